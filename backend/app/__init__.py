@@ -1,6 +1,7 @@
+import hmac
 import os
 import sys
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
@@ -10,6 +11,17 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from backend.routes.auth_routes import auth_bp
 from backend.routes.delivery_routes import delivery_bp
+from backend.routes.change_routes import change_bp
+from backend.routes.webhook_routes import webhook_bp
+from backend.routes.dashboard_routes import dashboard_bp
+from backend.commands import register_commands
+from backend.middleware.rate_limit import RateLimiter
+from backend.middleware.load_shedding import LoadShedder
+from backend.middleware.profiler import RequestProfiler
+from backend.models.group_commit import GroupCommitWriter
+from backend.models.address import AddressBook
+from backend.models.sharding import ShardRouter, UserMoving
+from backend.webhooks.dispatcher import WebhookDispatcher
 
 # Load environment variables
 load_dotenv()
@@ -20,18 +32,60 @@ def create_app():
     # Configure app
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-secret-key')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 60 * 60 * 24  # 24 hours
+    app.config['CHANGE_LOG_RETENTION_DAYS'] = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', 30))
+    # Token scrapers send in the X-Metrics-Token header; without one /metrics is not served
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+    # Set up every database now, so slow migrations do not run inside the first request and its deadline
+    ShardRouter.prepare()
 
     # Initialize extensions
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     JWTManager(app)
+    rate_limiter = RateLimiter(app)
+    load_shedder = LoadShedder(app)
+    profiler = RequestProfiler(app)
 
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(delivery_bp)
+    app.register_blueprint(change_bp)
+    app.register_blueprint(webhook_bp)
+    app.register_blueprint(dashboard_bp)
+
+    # Optionally deliver webhooks from a background thread instead of `flask webhooks dispatch`
+    if os.getenv('WEBHOOK_DISPATCHER', 'off').lower() == 'thread':
+        WebhookDispatcher.start_background()
+
+    # Writes refused while the user's rows move between shards can be retried shortly
+    @app.errorhandler(UserMoving)
+    def user_moving(error):
+        return {'error': str(error)}, 503, {'Retry-After': '1'}
+
+    # Register CLI commands
+    register_commands(app)
 
     # Create a simple health check route
     @app.route('/health')
     def health_check():
         return {'status': 'alive'}, 200
 
+    # Expose runtime metrics of the middleware layers to holders of the metrics token
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        if not token:
+            return {'error': 'Not found'}, 404
+        if not hmac.compare_digest(request.headers.get('X-Metrics-Token', '').encode(), token.encode()):
+            return {'error': 'Invalid metrics token'}, 401
+        return {
+            'rateLimit': rate_limiter.metrics(),
+            'loadShedding': load_shedder.metrics(),
+            'profiler': profiler.metrics(),
+            'groupCommit': GroupCommitWriter.process_metrics(),
+            'addresses': AddressBook.metrics(),
+            'webhooks': WebhookDispatcher.process_metrics(),
+            'worker': worker.metrics() if (worker := app.extensions.get('server_worker')) else None
+        }, 200
+
     return app 
\ No newline at end of file
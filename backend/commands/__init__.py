@@ -0,0 +1,25 @@
+from .changes import changes_cli
+from .export import export_cli
+from .analytics import analytics_cli
+from .rollups import rollups_cli
+from .shards import shards_cli
+from .webhooks import webhooks_cli
+from .backup import backup_cli
+from .bench import bench_cli
+from .profiler import profiler_cli
+from .addresses import addresses_cli
+
+__all__ = ['register_commands']
+
+def register_commands(app):
+    """Register the backend's maintenance commands on the Flask CLI."""
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(webhooks_cli)
+    app.cli.add_command(backup_cli)
+    app.cli.add_command(bench_cli)
+    app.cli.add_command(profiler_cli)
+    app.cli.add_command(addresses_cli)
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import time
+
+import click
+from flask.cli import AppGroup
+
+from backend.models.db import Database, DATA_DIR
+from backend.models.sharding import ShardRouter, SHARD_COUNT
+from backend.models.address import DELIVERIES_VIEW
+
+addresses_cli = AppGroup('addresses', help='Migrate and inspect interned delivery addresses.')
+
+def _database_paths():
+    paths = [os.path.join(DATA_DIR, 'beezetrack.db')]
+    if ShardRouter.is_sharded():
+        paths += [ShardRouter.shard_path(shard_id) for shard_id in range(SHARD_COUNT)]
+    return paths
+
+def _size(path):
+    """Page and byte counts of a database file, without setting up its schema."""
+    conn = sqlite3.connect(path)
+    try:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # dbstat counts the pages of the deliveries table and its indexes, when SQLite is built with it
+        try:
+            deliveries_pages = conn.execute('''
+            SELECT COUNT(*) FROM dbstat
+            WHERE name = 'deliveries' OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'deliveries')
+            ''').fetchone()[0]
+        except sqlite3.OperationalError:
+            deliveries_pages = None
+    finally:
+        conn.close()
+    return {'bytes': os.path.getsize(path), 'pageSize': page_size, 'pages': page_count, 'freePages': freelist, 'deliveriesPages': deliveries_pages}
+
+def _describe(size):
+    deliveries = f", deliveries {size['deliveriesPages']} pages" if size['deliveriesPages'] is not None else ''
+    return f"{size['bytes'] / 1024:.0f} KiB, {size['pages']} pages ({size['freePages']} free){deliveries}"
+
+@addresses_cli.command('migrate')
+@click.option('--vacuum/--no-vacuum', default=True, show_default=True, help='Return the freed pages to the file system afterwards.')
+def migrate(vacuum):
+    """Intern the text addresses of existing deliveries and report the size change."""
+    for index, path in enumerate(_database_paths()):
+        if not os.path.exists(path):
+            continue
+        before = _size(path)
+
+        # Opening the database runs any pending schema migration, including the address one
+        started = time.perf_counter()
+        # Only the directory, listed first, enforces foreign keys
+        db = Database(path, foreign_keys=index == 0)
+        db.close()
+        if vacuum:
+            conn = sqlite3.connect(path, isolation_level=None)
+            try:
+                conn.execute('VACUUM')
+            finally:
+                conn.close()
+        after = _size(path)
+
+        click.echo(os.path.relpath(path, DATA_DIR))
+        click.echo(f'  before: {_describe(before)}')
+        click.echo(f'  after:  {_describe(after)}  ({time.perf_counter() - started:.2f}s)')
+
+@addresses_cli.command('stats')
+@click.option('--scans', type=int, default=20, show_default=True, help='Full scans of the deliveries view to time.')
+def stats(scans):
+    """Show address deduplication, file size and full scan time per database."""
+    for path in _database_paths():
+        if not os.path.exists(path):
+            continue
+        conn = Database(path, foreign_keys=False).get_connection()
+        deliveries = conn.execute('SELECT COUNT(*) FROM deliveries').fetchone()[0]
+        addresses = conn.execute('SELECT COUNT(*) FROM addresses').fetchone()[0]
+
+        started = time.perf_counter()
+        for _ in range(scans):
+            conn.execute(f'SELECT COUNT(*), SUM(LENGTH(from_address) + LENGTH(to_address)) FROM {DELIVERIES_VIEW}').fetchone()
+        scan_ms = (time.perf_counter() - started) * 1000 / max(scans, 1)
+        conn.close()
+
+        click.echo(os.path.relpath(path, DATA_DIR))
+        click.echo(f'  {deliveries} deliveries, {addresses} distinct addresses ({2 * deliveries / max(addresses, 1):.1f} references each)')
+        click.echo(f'  {_describe(_size(path))}, full scan {scan_ms:.2f} ms')
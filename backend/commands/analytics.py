@@ -0,0 +1,13 @@
+import click
+from flask.cli import AppGroup
+
+from backend.models.analytics import Analytics
+
+analytics_cli = AppGroup('analytics', help='Maintain precomputed delivery analytics.')
+
+@analytics_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s analytics.')
+def rebuild(user_id):
+    """Recompute analytics from the full delivery history."""
+    processed = Analytics.rebuild(user_id)
+    click.echo(f'Rebuilt analytics from {processed} delivered deliveries')
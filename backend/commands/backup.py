@@ -0,0 +1,90 @@
+import json
+import time
+
+import click
+from flask.cli import AppGroup
+
+from backend.models.backup import Backup, BackupError, PAGES_PER_STEP, STEP_SLEEP_MS, RETENTION, INTERVAL_MINUTES
+
+backup_cli = AppGroup('backup', help='Take, list and restore online database snapshots.')
+
+def _report(manifest):
+    click.echo(f"Snapshot {manifest['name']}")
+    for entry in manifest['files']:
+        wait = entry['writeLockWaitMs']
+        click.echo(f"  {entry['name']}: {entry['pages']} pages in {entry['steps']} steps, {entry['seconds']}s, "
+                   f"{entry['bytes']} bytes compressed, {entry['restarts']} restarts"
+                   + (' (single-step fallback)' if entry['singleStepFallback'] else ''))
+        click.echo(f"    step ms: p50 {entry['stepMs']['p50']} p99 {entry['stepMs']['p99']} max {entry['stepMs']['max']}")
+        click.echo(f"    write lock wait ms: baseline p99 {wait['baseline']['p99']}, "
+                   f"during backup p50 {wait['duringBackup']['p50']} p99 {wait['duringBackup']['p99']} max {wait['duringBackup']['max']}")
+
+def _take(pages, sleep_ms, keep):
+    manifest = Backup.run(pages, sleep_ms)
+    _report(manifest)
+    for name in Backup.prune(keep):
+        click.echo(f'Pruned snapshot {name}')
+
+@backup_cli.command('run')
+@click.option('--pages', type=int, default=PAGES_PER_STEP, show_default=True, help='Pages copied per step.')
+@click.option('--sleep-ms', type=float, default=STEP_SLEEP_MS, show_default=True, help='Pause between steps.')
+@click.option('--keep', type=int, default=RETENTION, show_default=True, help='Snapshots kept after this one.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the full manifest as JSON.')
+def run(pages, sleep_ms, keep, as_json):
+    """Take a snapshot now and apply the retention policy."""
+    if as_json:
+        click.echo(json.dumps(Backup.run(pages, sleep_ms), indent=2))
+        Backup.prune(keep)
+    else:
+        _take(pages, sleep_ms, keep)
+
+@backup_cli.command('schedule')
+@click.option('--interval-minutes', type=float, default=INTERVAL_MINUTES, show_default=True)
+@click.option('--pages', type=int, default=PAGES_PER_STEP, show_default=True)
+@click.option('--sleep-ms', type=float, default=STEP_SLEEP_MS, show_default=True)
+@click.option('--keep', type=int, default=RETENTION, show_default=True)
+def schedule(interval_minutes, pages, sleep_ms, keep):
+    """Take snapshots forever at a fixed interval."""
+    while True:
+        started = time.monotonic()
+        try:
+            _take(pages, sleep_ms, keep)
+        except (OSError, BackupError) as e:
+            click.echo(f'Backup failed: {e}', err=True)
+        time.sleep(max(0, interval_minutes * 60 - (time.monotonic() - started)))
+
+@backup_cli.command('list')
+@click.option('--verify', is_flag=True, help='Check every snapshot against its checksums.')
+def list_snapshots(verify):
+    """List snapshots, newest first."""
+    for manifest in Backup.list():
+        size = sum(entry['bytes'] for entry in manifest['files'])
+        status = ''
+        if verify:
+            try:
+                Backup.verify(manifest['name'])
+                status = ' ok'
+            except BackupError as e:
+                status = f' CORRUPT ({e})'
+        click.echo(f"{manifest['name']}  {manifest['createdAt']}  {len(manifest['files'])} files  {size} bytes{status}")
+
+@backup_cli.command('restore')
+@click.argument('name')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def restore(name, yes):
+    """Restore every database from a snapshot. Stop the app's writers first."""
+    if not yes:
+        click.confirm(f'Overwrite the current databases with snapshot {name}?', abort=True)
+    try:
+        restored = Backup.restore(name)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    for db_name in restored:
+        click.echo(f'Restored {db_name}')
+
+@backup_cli.command('prune')
+@click.option('--keep', type=int, default=RETENTION, show_default=True)
+def prune(keep):
+    """Delete all but the newest snapshots."""
+    for name in Backup.prune(keep):
+        click.echo(f'Pruned snapshot {name}')
@@ -0,0 +1,64 @@
+import json
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from backend.models.delivery import Delivery
+from backend.models.render import DeliveryRenderer
+
+bench_cli = AppGroup('bench', help='Benchmark read paths against existing data.')
+
+def _time(function, iterations):
+    """Return (milliseconds per call, last result)."""
+    result = function()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = function()
+    return (time.perf_counter() - started) * 1000 / iterations, result
+
+@bench_cli.command('render')
+@click.option('--user-id', type=int, required=True, help='User whose deliveries are read.')
+@click.option('--iterations', type=int, default=200, show_default=True)
+def render(user_id, iterations):
+    """Compare SQL-side JSON rendering with the object-mapping path."""
+    if not DeliveryRenderer.available():
+        raise click.ClickException('SQL JSON rendering is disabled or SQLite lacks JSON1')
+
+    dumps = current_app.json.dumps
+    tracking_numbers = [delivery.tracking_number for delivery in Delivery.find_by_user_id(user_id, with_updates=False)][:100]
+    if not tracking_numbers:
+        raise click.ClickException(f'User {user_id} has no deliveries')
+
+    def track_objects():
+        delivery = Delivery.find_by_tracking_number(tracking_numbers[0]).to_dict()
+        delivery.pop('userId', None)
+        return dumps({'delivery': delivery})
+
+    def batch_objects():
+        found = Delivery.find_by_tracking_numbers(tracking_numbers)
+        results = []
+        for number in tracking_numbers:
+            delivery = found[number].to_dict()
+            delivery.pop('userId', None)
+            results.append({'trackingNumber': number, 'found': True, 'delivery': delivery})
+        return dumps({'results': results})
+
+    cases = [
+        ('list deliveries',
+         lambda: dumps({'deliveries': [delivery.to_dict() for delivery in Delivery.find_by_user_id(user_id)]}),
+         lambda: DeliveryRenderer.user_deliveries(user_id)),
+        ('track one',
+         track_objects,
+         lambda: DeliveryRenderer.tracked_delivery(tracking_numbers[0])),
+        (f'track batch of {len(tracking_numbers)}',
+         batch_objects,
+         lambda: DeliveryRenderer.tracking_results(tracking_numbers, DeliveryRenderer.tracked_deliveries(tracking_numbers))),
+    ]
+
+    for name, objects, sql in cases:
+        objects_ms, objects_body = _time(objects, iterations)
+        sql_ms, sql_body = _time(sql, iterations)
+        same = 'same output' if json.loads(objects_body) == json.loads(sql_body) else 'OUTPUT DIFFERS'
+        click.echo(f'{name}: objects {objects_ms:.3f} ms, sql {sql_ms:.3f} ms, {objects_ms / sql_ms:.1f}x ({same})')
@@ -0,0 +1,16 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from backend.models.change_log import ChangeLog
+
+changes_cli = AppGroup('changes', help='Manage the delivery change log.')
+
+@changes_cli.command('compact')
+@click.option('--days', type=int, default=None, help='Retention period in days (defaults to CHANGE_LOG_RETENTION_DAYS).')
+def compact(days):
+    """Drop superseded changes older than the retention period."""
+    if days is None:
+        days = current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    deleted = ChangeLog.compact(days)
+    click.echo(f'Deleted {deleted} superseded changes older than {days} days')
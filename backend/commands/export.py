@@ -0,0 +1,23 @@
+import sys
+
+import click
+from flask.cli import AppGroup
+
+from backend.models.export import DeliveryExport
+
+export_cli = AppGroup('export', help='Export delivery data.')
+
+@export_cli.command('deliveries')
+@click.option('--user-id', type=int, default=None, help='Only export this user\'s deliveries.')
+@click.option('--format', 'fmt', type=click.Choice(list(DeliveryExport.FORMATS)), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip-compress the output.')
+@click.option('--output', '-o', default='-', help='Output file, or - for stdout.')
+def export_deliveries(user_id, fmt, compress, output):
+    """Stream deliveries and their status history to a file."""
+    out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for chunk in DeliveryExport.stream(user_id, fmt, compress):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
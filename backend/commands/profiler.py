@@ -0,0 +1,69 @@
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from backend.middleware.profiler import RequestProfiler
+
+profiler_cli = AppGroup('profiler', help='Switch request profiling on for endpoints or users.')
+
+def _toggle_file():
+    return current_app.config['PROFILER_TOGGLE_FILE']
+
+@profiler_cli.command('enable')
+@click.option('--endpoint', default=None, help='Endpoint to profile, e.g. delivery.get_user_deliveries. Defaults to all.')
+@click.option('--user-id', type=int, default=None, help='Only profile requests made by this user.')
+@click.option('--minutes', type=float, default=10, show_default=True, help='How long the rule stays active.')
+def enable(endpoint, user_id, minutes):
+    """Profile matching requests in every running worker.
+
+    Workers only look at rules when started with PROFILER_ENABLED=true.
+    """
+    rules = RequestProfiler.read_rules(_toggle_file())
+    rules.append({'endpoint': endpoint, 'userId': user_id, 'until': time.time() + minutes * 60})
+    RequestProfiler.write_rules(_toggle_file(), rules)
+    click.echo(f"Profiling {endpoint or 'all endpoints'} for {'user ' + str(user_id) if user_id is not None else 'all users'} for {minutes:g} minutes")
+    if not current_app.config['PROFILER_ENABLED']:
+        click.echo('Warning: PROFILER_ENABLED is not set, so this process would not profile')
+
+@profiler_cli.command('disable')
+def disable():
+    """Remove every profiling rule."""
+    RequestProfiler.write_rules(_toggle_file(), [])
+    click.echo('Profiling rules removed')
+
+@profiler_cli.command('status')
+@click.option('--recent', type=int, default=10, show_default=True, help='Number of recent profiles to list.')
+def status(recent):
+    """Show active rules and the most recent profiles."""
+    rules = RequestProfiler.read_rules(_toggle_file())
+    if not rules:
+        click.echo('No active profiling rules')
+    for rule in rules:
+        left = (rule['until'] - time.time()) / 60
+        click.echo(f"Rule: endpoint={rule.get('endpoint') or '*'} user={rule.get('userId') if rule.get('userId') is not None else '*'} ({left:.1f} minutes left)")
+
+    profile_dir = current_app.config['PROFILER_DIR']
+    profiles = sorted(os.listdir(profile_dir), reverse=True)[:recent] if os.path.isdir(profile_dir) else []
+    for name in profiles:
+        click.echo(os.path.join(profile_dir, name))
+
+@profiler_cli.command('top')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--limit', type=int, default=20, show_default=True)
+def top(path, limit):
+    """Summarize a collapsed-stack profile by self time per frame."""
+    totals = {}
+    with open(path) as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            stack, _, weight = line.rstrip('\n').rpartition(' ')
+            frame = stack.rsplit(';', 1)[-1]
+            totals[frame] = totals.get(frame, 0) + int(weight)
+
+    total = sum(totals.values()) or 1
+    for frame, micros in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]:
+        click.echo(f'{micros / 1000:10.2f} ms {micros * 100 / total:5.1f}%  {frame}')
@@ -0,0 +1,13 @@
+import click
+from flask.cli import AppGroup
+
+from backend.models.rollups import DailyRollup
+
+rollups_cli = AppGroup('rollups', help='Maintain daily delivery rollups.')
+
+@rollups_cli.command('backfill')
+@click.option('--user-id', type=int, default=None, help='Only backfill this user\'s rollups.')
+def backfill(user_id):
+    """Rebuild daily rollups from the delivery history."""
+    written = DailyRollup.backfill(user_id)
+    click.echo(f'Wrote {written} rollup rows')
@@ -0,0 +1,34 @@
+import click
+from flask.cli import AppGroup
+
+from backend.models.sharding import ShardRouter, SHARD_COUNT
+
+shards_cli = AppGroup('shards', help='Inspect and rebalance delivery shards.')
+
+@shards_cli.command('status')
+def status():
+    """Show how deliveries are spread across shards."""
+    for size in ShardRouter.shard_sizes():
+        click.echo(f"shard {size['shard']}: {size['deliveries']} deliveries, {size['users']} users ({size['path']})")
+
+@shards_cli.command('assign')
+@click.option('--user-id', type=int, required=True)
+@click.option('--shard', 'shard_id', type=click.IntRange(0, SHARD_COUNT - 1), required=True)
+def assign(user_id, shard_id):
+    """Assign a user to a shard and move their data there."""
+    ShardRouter.assign_user(user_id, shard_id)
+    for moved_user, target_shard, moved in ShardRouter.rebalance(user_id=user_id):
+        click.echo(f'Moved user {moved_user} to shard {target_shard} ({moved} deliveries)')
+
+@shards_cli.command('rebalance')
+@click.option('--dry-run', is_flag=True, help='Only list the users that would move.')
+def rebalance(dry_run):
+    """Move users whose data is outside their assigned shard, including pre-sharding data."""
+    if not ShardRouter.is_sharded():
+        click.echo('Sharding is disabled (SHARD_COUNT=1); nothing to rebalance')
+        return
+    moves = ShardRouter.rebalance(dry_run=dry_run)
+    for user_id, target_shard, moved in moves:
+        verb = 'Would move' if dry_run else 'Moved'
+        click.echo(f'{verb} user {user_id} to shard {target_shard}' + ('' if dry_run else f' ({moved} deliveries)'))
+    click.echo(f'{len(moves)} users {"to move" if dry_run else "moved"}')
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import time
+
+import click
+from flask.cli import AppGroup
+
+from backend.models.sharding import ShardRouter
+from backend.models.webhook import WebhookSubscription
+from backend.webhooks.dispatcher import WebhookDispatcher, DEFAULT_BATCH_SIZE, DEFAULT_ENDPOINT_CONCURRENCY
+from backend.webhooks.stub_receiver import StubReceiver
+
+webhooks_cli = AppGroup('webhooks', help='Deliver webhook events.')
+
+@webhooks_cli.command('dispatch')
+@click.option('--once', is_flag=True, help='Exit once no events are due instead of polling forever.')
+def dispatch(once):
+    """Send queued webhook events to their endpoints."""
+    dispatcher = WebhookDispatcher()
+    try:
+        asyncio.run(dispatcher.run(until_empty=once))
+    except KeyboardInterrupt:
+        pass
+    click.echo(json.dumps(dispatcher.metrics()))
+
+@webhooks_cli.command('bench')
+@click.option('--events', 'event_count', type=int, default=10000, show_default=True)
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--endpoint-concurrency', type=int, default=DEFAULT_ENDPOINT_CONCURRENCY, show_default=True)
+@click.option('--fail-rate', type=float, default=0.0, help='Share of requests the stub receiver fails.')
+@click.option('--user-id', type=int, default=0, show_default=True, help='User the temporary subscription belongs to.')
+def bench(event_count, batch_size, endpoint_concurrency, fail_rate, user_id):
+    """Measure dispatch throughput against the local stub receiver."""
+    async def run():
+        receiver = StubReceiver(fail_rate)
+        port = await receiver.start()
+        subscription = WebhookSubscription(user_id=user_id, url=f'http://127.0.0.1:{port}/hooks').save()
+        try:
+            # Queue synthetic events straight into the outbox
+            conn = ShardRouter.database_for_user(user_id).get_connection()
+            conn.executemany('INSERT INTO webhook_outbox (subscription_id, user_id, payload) VALUES (?, ?, ?)', [
+                (subscription.id, user_id, json.dumps({'id': f'bench:{i}', 'type': 'bench', 'sequence': i}))
+                for i in range(event_count)
+            ])
+            conn.commit()
+
+            # Only the bench subscription is sent to, so reaching the loopback stub cannot open up real endpoints
+            dispatcher = WebhookDispatcher(batch_size=batch_size, endpoint_concurrency=endpoint_concurrency, poll_interval=0.05,
+                                           allow_private_targets=True, subscription_ids=[subscription.id])
+            started = time.perf_counter()
+            await dispatcher.run(until_empty=True)
+            elapsed = time.perf_counter() - started
+        finally:
+            subscription.delete()
+            await receiver.stop()
+
+        stats = receiver.stats()
+        click.echo(f"Delivered {stats['uniqueEvents']} of {event_count} events in {elapsed:.2f}s "
+                   f"({stats['uniqueEvents'] / elapsed:.0f} events/s)")
+        click.echo(f"receiver: {json.dumps(stats)}")
+        click.echo(f"dispatcher: {json.dumps(dispatcher.metrics())}")
+
+    asyncio.run(run())
@@ -1,4 +1,7 @@
 from .auth_controller import AuthController
 from .delivery_controller import DeliveryController
+from .change_controller import ChangeController
+from .webhook_controller import WebhookController
+from .dashboard_controller import DashboardController
 
-__all__ = ['AuthController', 'DeliveryController'] 
\ No newline at end of file
+__all__ = ['AuthController', 'DeliveryController', 'ChangeController', 'WebhookController', 'DashboardController'] 
\ No newline at end of file
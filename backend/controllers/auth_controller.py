@@ -2,6 +2,7 @@ from flask import request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 
 from backend.models.user import User
+from backend.middleware.rate_limit import rate_limit
 
 class AuthController:
     @staticmethod
@@ -44,11 +45,12 @@ class AuthController:
         }), 201
     
     @staticmethod
+    @rate_limit('login', account_field='email')
     def login():
         data = request.get_json()
         
         # Check if required fields are present
-        if 'email' not in data or 'password' not in data:
+        if not isinstance(data, dict) or 'email' not in data or 'password' not in data:
             return jsonify({"error": "Email and password are required"}), 400
         
         # Find user by email
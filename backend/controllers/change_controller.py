@@ -0,0 +1,37 @@
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from backend.models.change_log import ChangeLog
+
+# Default and maximum page size for the change feed
+DEFAULT_CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 1000
+
+class ChangeController:
+    @staticmethod
+    @jwt_required()
+    def get_changes():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Validate paging parameters
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', DEFAULT_CHANGES_LIMIT))
+        except ValueError:
+            return jsonify({"error": "since and limit must be integers"}), 400
+        
+        if since < 0 or not 1 <= limit <= MAX_CHANGES_LIMIT:
+            return jsonify({"error": f"since must be >= 0 and limit between 1 and {MAX_CHANGES_LIMIT}"}), 400
+        
+        # Get the next page of changes after the cursor
+        changes, has_more = ChangeLog.since(user_id, since, limit)
+        
+        # The next cursor is the last returned sequence, or the same one when there is nothing new
+        next_since = changes[-1]['seq'] if changes else since
+        
+        return jsonify({
+            "changes": changes,
+            "nextSince": next_since,
+            "hasMore": has_more
+        }), 200
@@ -0,0 +1,48 @@
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from backend.models.dashboard import Dashboard
+
+# Default and maximum number of recent deliveries on the dashboard
+DEFAULT_DASHBOARD_LIMIT = 20
+MAX_DASHBOARD_LIMIT = 100
+
+class DashboardController:
+    @staticmethod
+    @jwt_required()
+    def get_dashboard():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Validate the page size
+        try:
+            limit = int(request.args.get('limit', DEFAULT_DASHBOARD_LIMIT))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        
+        if not 1 <= limit <= MAX_DASHBOARD_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_DASHBOARD_LIMIT}"}), 400
+        
+        # An unchanged dashboard costs only the version check
+        version = Dashboard.version(user_id)
+        if version is None:
+            return jsonify({"error": "User not found"}), 404
+        
+        etag = f"{version}.{limit}"
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': f'"{etag}"'}
+        
+        # Read everything from one snapshot
+        dashboard = Dashboard.load(user_id, limit)
+        if dashboard is None:
+            return jsonify({"error": "User not found"}), 404
+        
+        response = jsonify({
+            "user": dashboard['user'],
+            "statistics": dashboard['statistics'],
+            "deliveries": dashboard['deliveries'],
+            "hasMore": dashboard['hasMore']
+        })
+        response.set_etag(f"{dashboard['version']}.{limit}")
+        
+        return response, 200
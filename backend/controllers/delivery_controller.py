@@ -1,18 +1,67 @@
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
 import uuid
+import datetime
+import itertools
 from werkzeug.utils import secure_filename
 
-from backend.models.delivery import Delivery
+from backend.models import deadline
+from backend.models.delivery import Delivery, VersionConflict, InvalidStatusTransition
+from backend.models.status import VALID_STATUSES
+from backend.models.export import DeliveryExport
+from backend.models.analytics import Analytics, DIMENSIONS
+from backend.models.rollups import DailyRollup
+from backend.models.render import DeliveryRenderer
+from backend.middleware.rate_limit import rate_limit
 
 # Add allowed file extensions for image uploads
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Maximum number of tracking numbers accepted by a single batch tracking request
+MAX_BATCH_TRACKING = 100
+
+# Default and maximum span of a time-series request, in days
+DEFAULT_TIMESERIES_DAYS = 30
+MAX_TIMESERIES_DAYS = 3 * 366
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def json_response(body, status=200):
+    """Wrap a JSON string rendered by SQLite in a response, as jsonify would."""
+    return Response(body + '\n', status=status, mimetype='application/json')
+
+def parse_field_options():
+    """Read ?fields= and ?include= from the query string.
+
+    Returns (fields, error). fields is None when the full representation was
+    requested, otherwise the list of API fields to return.
+    """
+    fields_param = request.args.get('fields')
+    include = {value.strip() for value in request.args.get('include', '').split(',') if value.strip()}
+    
+    if not fields_param and not include:
+        return None, None
+    
+    if include - {'updates'}:
+        return None, "Invalid include. Supported: updates"
+    
+    if fields_param:
+        fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+    else:
+        fields = [field for field in Delivery.FIELDS if field not in ('updates', 'latestUpdate')]
+    
+    invalid = [field for field in fields if field not in Delivery.FIELDS or field == 'updates']
+    if invalid:
+        return None, f"Invalid fields: {', '.join(invalid)}"
+    
+    if 'updates' in include:
+        fields.append('updates')
+    
+    return fields, None
+
 class DeliveryController:
     @staticmethod
     @jwt_required()
@@ -29,6 +78,10 @@ class DeliveryController:
             if field not in data:
                 return jsonify({"error": f"Missing required field: {field}"}), 400
         
+        # Addresses are interned by their text
+        if not isinstance(data['from'], str) or not isinstance(data['to'], str):
+            return jsonify({"error": "from and to must be strings"}), 400
+        
         # Create new delivery
         delivery = Delivery(
             package_type=data['packageType'],
@@ -51,12 +104,22 @@ class DeliveryController:
         # Get user ID from JWT
         user_id = get_jwt_identity()
         
-        # Get deliveries for user
-        deliveries = Delivery.find_by_user_id(user_id)
+        # Get requested fields
+        fields, error = parse_field_options()
+        if error:
+            return jsonify({"error": error}), 400
+        
+        # The full shape is rendered straight to JSON by SQLite
+        if fields is None and DeliveryRenderer.available():
+            return json_response(DeliveryRenderer.user_deliveries(user_id))
+        
+        # Get deliveries for user, touching updates only when they are returned
+        with_updates = fields is None or 'updates' in fields
+        deliveries = Delivery.find_by_user_id(user_id, with_updates=with_updates)
         
         # Return deliveries data
         return jsonify({
-            "deliveries": [delivery.to_dict() for delivery in deliveries]
+            "deliveries": [delivery.to_dict(fields) for delivery in deliveries]
         }), 200
     
     @staticmethod
@@ -65,8 +128,13 @@ class DeliveryController:
         # Get user ID from JWT
         user_id = get_jwt_identity()
         
+        # Get requested fields
+        fields, error = parse_field_options()
+        if error:
+            return jsonify({"error": error}), 400
+        
         # Find delivery by ID
-        delivery = Delivery.find_by_id(delivery_id)
+        delivery = Delivery.find_by_id(delivery_id, with_updates=fields is None or 'updates' in fields)
         
         # Check if delivery exists
         if not delivery:
@@ -76,31 +144,91 @@ class DeliveryController:
         if delivery.user_id != user_id:
             return jsonify({"error": "Unauthorized"}), 403
         
-        # Return delivery data
-        return jsonify({"delivery": delivery.to_dict()}), 200
+        # Return delivery data with its version as the ETag
+        response = jsonify({"delivery": delivery.to_dict(fields)})
+        response.set_etag(str(delivery.version))
+        return response, 200
     
     @staticmethod
+    @rate_limit('tracking')
     def track_delivery():
         # Get request data
         data = request.get_json()
         
         # Check if tracking number is provided
-        if 'trackingNumber' not in data:
+        if not isinstance(data, dict) or 'trackingNumber' not in data:
             return jsonify({"error": "Tracking number is required"}), 400
         
+        # Get requested fields
+        fields, error = parse_field_options()
+        if error:
+            return jsonify({"error": error}), 400
+        
+        # The full shape is rendered straight to JSON by SQLite
+        if fields is None and DeliveryRenderer.available():
+            body = DeliveryRenderer.tracked_delivery(data['trackingNumber'])
+            if body is None:
+                return jsonify({"error": "Delivery not found"}), 404
+            return json_response(body)
+        
         # Find delivery by tracking number
-        delivery = Delivery.find_by_tracking_number(data['trackingNumber'])
+        with_updates = fields is None or 'updates' in fields
+        delivery = Delivery.find_by_tracking_number(data['trackingNumber'], with_updates=with_updates)
         
         # Check if delivery exists
         if not delivery:
             return jsonify({"error": "Delivery not found"}), 404
         
         # Return delivery data (without sensitive information)
-        delivery_data = delivery.to_dict()
+        delivery_data = delivery.to_dict(fields)
         delivery_data.pop('userId', None)  # Remove user ID for public tracking
         
         return jsonify({"delivery": delivery_data}), 200
     
+    @staticmethod
+    @rate_limit('tracking')
+    def track_deliveries():
+        # Get request data
+        data = request.get_json()
+        
+        # Check if tracking numbers are provided
+        tracking_numbers = data.get('trackingNumbers') if isinstance(data, dict) else None
+        if not isinstance(tracking_numbers, list) or not tracking_numbers:
+            return jsonify({"error": "trackingNumbers must be a non-empty list"}), 400
+        
+        if len(tracking_numbers) > MAX_BATCH_TRACKING:
+            return jsonify({"error": f"At most {MAX_BATCH_TRACKING} tracking numbers can be tracked at once"}), 400
+        
+        if not all(isinstance(number, str) for number in tracking_numbers):
+            return jsonify({"error": "Tracking numbers must be strings"}), 400
+        
+        # Find all deliveries with one lookup; the latest status comes from the summary columns
+        latest_only = bool(data.get('latestOnly', False))
+        if DeliveryRenderer.available():
+            rendered = DeliveryRenderer.tracked_deliveries(tracking_numbers, latest_only)
+            return json_response(DeliveryRenderer.tracking_results(tracking_numbers, rendered))
+        
+        deliveries = Delivery.find_by_tracking_numbers(tracking_numbers, with_updates=not latest_only)
+        
+        # Build per-number results in request order, including misses
+        results = []
+        for tracking_number in tracking_numbers:
+            delivery = deliveries.get(tracking_number)
+            if not delivery:
+                results.append({"trackingNumber": tracking_number, "found": False, "error": "Delivery not found"})
+                continue
+            
+            # Return delivery data (without sensitive information)
+            delivery_data = delivery.to_dict()
+            delivery_data.pop('userId', None)
+            if latest_only:
+                delivery_data.pop('updates')
+                delivery_data['latestUpdate'] = delivery.latest_update
+            
+            results.append({"trackingNumber": tracking_number, "found": True, "delivery": delivery_data})
+        
+        return jsonify({"results": results}), 200
+    
     @staticmethod
     @jwt_required()
     def update_delivery_status(delivery_id):
@@ -126,16 +254,36 @@ class DeliveryController:
             return jsonify({"error": "Status is required"}), 400
         
         # Validate status
-        valid_statuses = ["Pending", "In-Transit", "Delivered", "Cancelled"]
-        if data['status'] not in valid_statuses:
-            return jsonify({"error": f"Invalid status. Must be one of: {', '.join(valid_statuses)}"}), 400
+        if data['status'] not in VALID_STATUSES:
+            return jsonify({"error": f"Invalid status. Must be one of: {', '.join(VALID_STATUSES)}"}), 400
+        
+        # Use the client's version from If-Match, if any, for the compare-and-set
+        expected_version = None
+        if request.if_match:
+            tags = request.if_match.as_set()
+            if request.if_match.star_tag:
+                tags = set()
+            elif not tags:
+                # If-Match compares strongly, so weak ETags can never match
+                return jsonify({"error": "If-Match does not accept weak ETags"}), 412
+            if len(tags) > 1 or not all(tag.isdigit() for tag in tags):
+                return jsonify({"error": "If-Match must be a single delivery version ETag"}), 400
+            if tags:
+                expected_version = int(tags.pop())
         
         # Update delivery status
         description = data.get('description')
-        delivery.update_status(data['status'], description)
+        try:
+            delivery.update_status(data['status'], description, expected_version=expected_version)
+        except VersionConflict as e:
+            return jsonify({"error": str(e), "currentVersion": e.current_version}), 409
+        except InvalidStatusTransition as e:
+            return jsonify({"error": str(e), "currentStatus": e.current_status}), 409
         
         # Return updated delivery data
-        return jsonify({"delivery": delivery.to_dict()}), 200
+        response = jsonify({"delivery": delivery.to_dict()})
+        response.set_etag(str(delivery.version))
+        return response, 200
     
     @staticmethod
     @jwt_required()
@@ -149,6 +297,73 @@ class DeliveryController:
         # Return statistics data
         return jsonify({"statistics": statistics}), 200
         
+    @staticmethod
+    @jwt_required()
+    def get_user_analytics():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Read precomputed performance metrics with per-package-type and per-route breakdowns
+        analytics = Analytics.summary(user_id, DIMENSIONS)
+        
+        return jsonify({"analytics": analytics}), 200
+    
+    @staticmethod
+    @jwt_required()
+    def get_user_timeseries():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Validate granularity and date range
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('day', 'week'):
+            return jsonify({"error": "Invalid granularity. Must be one of: day, week"}), 400
+        
+        try:
+            end = datetime.date.fromisoformat(request.args['to']) if 'to' in request.args else datetime.datetime.utcnow().date()
+            start = datetime.date.fromisoformat(request.args['from']) if 'from' in request.args else end - datetime.timedelta(days=DEFAULT_TIMESERIES_DAYS - 1)
+        except ValueError:
+            return jsonify({"error": "from and to must be dates in YYYY-MM-DD format"}), 400
+        
+        if start > end or (end - start).days >= MAX_TIMESERIES_DAYS:
+            return jsonify({"error": f"from must not be after to, and the range must be under {MAX_TIMESERIES_DAYS} days"}), 400
+        
+        # Read the precomputed daily rollups
+        series = DailyRollup.series(user_id, start, end, granularity)
+        
+        return jsonify({
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "series": series
+        }), 200
+    
+    @staticmethod
+    @jwt_required()
+    def export_deliveries():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Validate export options
+        fmt = request.args.get('format', 'csv')
+        if fmt not in DeliveryExport.FORMATS:
+            return jsonify({"error": f"Invalid format. Must be one of: {', '.join(DeliveryExport.FORMATS)}"}), 400
+        compress = request.args.get('gzip', 'false').lower() in ('1', 'true')
+        
+        # Stream rows straight from the database cursor
+        filename = f"deliveries.{fmt}.gz" if compress else f"deliveries.{fmt}"
+        mimetype = 'application/gzip' if compress else DeliveryExport.FORMATS[fmt]
+        chunks = DeliveryExport.stream(user_id, fmt, compress)
+        
+        # The request deadline covers the time to the first chunk; a started download runs to completion
+        first = next(chunks, b'')
+        deadline.lift()
+        body = stream_with_context(itertools.chain([first], chunks))
+        
+        return Response(body, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+        
     @staticmethod
     @jwt_required()
     def upload_package_image(delivery_id):
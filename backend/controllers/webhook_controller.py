@@ -0,0 +1,92 @@
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from urllib.parse import urlsplit
+
+from backend.models.webhook import WebhookSubscription, WebhookOutbox
+from backend.webhooks.http import ALLOW_PRIVATE_TARGETS, BlockedAddress, HttpError, resolve
+
+# Maximum number of webhook subscriptions per user
+MAX_SUBSCRIPTIONS = 10
+
+class WebhookController:
+    @staticmethod
+    @jwt_required()
+    def create_subscription():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Validate the endpoint URL
+        data = request.get_json(silent=True) or {}
+        url = data.get('url')
+        if not isinstance(url, str):
+            return jsonify({"error": "Missing required field: url"}), 400
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return jsonify({"error": "url must be an http or https URL"}), 400
+        
+        # Refuse endpoints inside our network; the dispatcher checks again on every connection
+        try:
+            resolve(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), ALLOW_PRIVATE_TARGETS)
+        except BlockedAddress:
+            return jsonify({"error": "url must not point to a private, loopback or reserved address"}), 400
+        except HttpError:
+            return jsonify({"error": "url host could not be resolved"}), 400
+        except ValueError:
+            return jsonify({"error": "url must be an http or https URL"}), 400
+        
+        secret = data.get('secret')
+        if secret is not None and (not isinstance(secret, str) or len(secret) < 16):
+            return jsonify({"error": "secret must be a string of at least 16 characters"}), 400
+        
+        if len(WebhookSubscription.find_by_user_id(user_id)) >= MAX_SUBSCRIPTIONS:
+            return jsonify({"error": f"At most {MAX_SUBSCRIPTIONS} webhook subscriptions are allowed"}), 400
+        
+        # Create the subscription; its secret is only returned this once
+        subscription = WebhookSubscription(user_id=user_id, url=url, secret=secret).save()
+        
+        return jsonify({"subscription": subscription.to_dict(include_secret=True)}), 201
+    
+    @staticmethod
+    @jwt_required()
+    def get_subscriptions():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        subscriptions = WebhookSubscription.find_by_user_id(user_id)
+        
+        return jsonify({"subscriptions": [subscription.to_dict() for subscription in subscriptions]}), 200
+    
+    @staticmethod
+    @jwt_required()
+    def delete_subscription(subscription_id):
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Find the user's subscription
+        subscription = WebhookSubscription.find_by_id(user_id, subscription_id)
+        if not subscription:
+            return jsonify({"error": "Subscription not found"}), 404
+        
+        subscription.delete()
+        
+        return jsonify({"message": "Subscription deleted"}), 200
+    
+    @staticmethod
+    @jwt_required()
+    def get_dead_letters():
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        return jsonify({"deadLetters": WebhookOutbox.dead_letters(user_id)}), 200
+    
+    @staticmethod
+    @jwt_required()
+    def retry_dead_letter(dead_letter_id):
+        # Get user ID from JWT
+        user_id = get_jwt_identity()
+        
+        # Put the event back in the outbox for the dispatcher
+        if not WebhookOutbox.redrive(user_id, dead_letter_id):
+            return jsonify({"error": "Dead letter not found"}), 404
+        
+        return jsonify({"message": "Event queued for delivery"}), 202
@@ -0,0 +1,5 @@
+from .rate_limit import RateLimiter, rate_limit
+from .load_shedding import LoadShedder
+from .profiler import RequestProfiler
+
+__all__ = ['RateLimiter', 'rate_limit', 'LoadShedder', 'RequestProfiler']
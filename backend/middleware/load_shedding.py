@@ -0,0 +1,234 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from backend.models import deadline
+
+# Endpoints with their own class; other endpoints are 'writes' or 'reads' by method
+ENDPOINT_CLASSES = {
+    'auth.login': 'auth',
+    'auth.register': 'auth',
+    'auth.update_password': 'auth',
+    'delivery.track_delivery': 'tracking',
+    'delivery.track_deliveries': 'tracking',
+    'delivery.export_deliveries': 'exports',
+}
+
+# Maximum concurrent requests admitted per endpoint class
+DEFAULT_CONCURRENCY = {
+    'auth': 8,
+    'tracking': 32,
+    'writes': 16,
+    'exports': 2,
+    'reads': 64,
+}
+
+# Seconds each class may run before its database work is abandoned
+DEFAULT_DEADLINES = {
+    'auth': 5,
+    'tracking': 2,
+    'writes': 5,
+    'exports': 300,
+    'reads': 5,
+}
+
+# CoDel parameters: acceptable standing queue delay and the window it may be exceeded for
+DEFAULT_TARGET_MS = 50
+DEFAULT_INTERVAL_MS = 500
+
+# Header a client can send to shorten its deadline
+TIMEOUT_HEADER = 'X-Request-Timeout-Ms'
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class _Gate:
+    """Concurrency cap for one endpoint class with a CoDel-controlled wait queue.
+
+    Requests over the cap queue for a slot. While the delay seen by admitted
+    requests stays under target they may wait up to one interval; once it has
+    stayed above target for a whole interval the gate enters the dropping state
+    and queued requests only wait up to target before being shed, which drains
+    the standing queue instead of letting every request time out late.
+    """
+
+    def __init__(self, limit, target, interval):
+        self.limit = limit
+        self.target = target
+        self.interval = interval
+        self.in_flight = 0
+        self.waiting = 0
+        self.first_above = None
+        self.dropping = False
+        self.admitted = 0
+        self.shed = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, latest):
+        """Wait for a slot, giving up at monotonic time latest. Returns whether admitted."""
+        arrived = time.monotonic()
+        with self.condition:
+            if self.in_flight < self.limit and not self.waiting:
+                self._admit(arrived, arrived)
+                return True
+
+            # Shed immediately when the queue is already known to be standing
+            if self.dropping and self.waiting >= self.limit:
+                self.shed += 1
+                return False
+
+            give_up = min(latest, arrived + (self.target if self.dropping else self.interval))
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        self._observe(time.monotonic() - arrived, time.monotonic())
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            self._admit(arrived, time.monotonic())
+            return True
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def _admit(self, arrived, now):
+        self.in_flight += 1
+        self.admitted += 1
+        self._observe(now - arrived, now)
+
+    def _observe(self, sojourn, now):
+        # Standard CoDel state machine over the queueing delay of each request
+        if sojourn < self.target:
+            self.first_above = None
+            self.dropping = False
+        elif self.first_above is None:
+            self.first_above = now + self.interval
+        elif now >= self.first_above:
+            self.dropping = True
+
+    def metrics(self):
+        with self.condition:
+            return {
+                'limit': self.limit,
+                'inFlight': self.in_flight,
+                'waiting': self.waiting,
+                'dropping': self.dropping,
+                'admitted': self.admitted,
+                'shed': self.shed,
+            }
+
+
+class LoadShedder:
+    """Per endpoint class admission control and request deadlines."""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.gates = {}
+        self.deadlines = {}
+        self.expired = 0
+        self.expired_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOAD_SHEDDING_ENABLED', os.getenv('LOAD_SHEDDING_ENABLED', 'true').lower() == 'true')
+        app.config.setdefault('LOAD_SHEDDING_TARGET_MS', int(os.getenv('LOAD_SHEDDING_TARGET_MS', DEFAULT_TARGET_MS)))
+        app.config.setdefault('LOAD_SHEDDING_INTERVAL_MS', int(os.getenv('LOAD_SHEDDING_INTERVAL_MS', DEFAULT_INTERVAL_MS)))
+        app.config.setdefault('LOAD_SHEDDING_CONCURRENCY', DEFAULT_CONCURRENCY)
+        app.config.setdefault('REQUEST_DEADLINES', DEFAULT_DEADLINES)
+
+        self.enabled = app.config['LOAD_SHEDDING_ENABLED']
+        self.deadlines = app.config['REQUEST_DEADLINES']
+        target = app.config['LOAD_SHEDDING_TARGET_MS'] / 1000
+        interval = app.config['LOAD_SHEDDING_INTERVAL_MS'] / 1000
+        self.gates = {
+            name: _Gate(limit, target, interval)
+            for name, limit in app.config['LOAD_SHEDDING_CONCURRENCY'].items()
+        }
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.register_error_handler(deadline.DeadlineExceeded, self._deadline_exceeded)
+        app.register_error_handler(sqlite3.OperationalError, self._interrupted)
+        app.extensions['load_shedder'] = self
+
+    @staticmethod
+    def endpoint_class():
+        """Return the endpoint class of the current request."""
+        name = ENDPOINT_CLASSES.get(request.endpoint)
+        if name is not None:
+            return name
+        return 'writes' if request.method in WRITE_METHODS else 'reads'
+
+    def _request_timeout(self, endpoint_class):
+        timeout = self.deadlines.get(endpoint_class)
+        header = request.headers.get(TIMEOUT_HEADER)
+        if header:
+            try:
+                client_timeout = float(header) / 1000
+            except ValueError:
+                client_timeout = None
+            if client_timeout is not None and client_timeout > 0:
+                timeout = client_timeout if timeout is None else min(timeout, client_timeout)
+        return timeout
+
+    def _before_request(self):
+        if not self.enabled or request.endpoint in (None, 'health_check', 'metrics') or request.method == 'OPTIONS':
+            return None
+
+        endpoint_class = self.endpoint_class()
+        timeout = self._request_timeout(endpoint_class)
+        if timeout is not None:
+            g.deadline_token = deadline.set_deadline(timeout)
+
+        gate = self.gates.get(endpoint_class)
+        if gate is None:
+            return None
+
+        latest = deadline.current_deadline() or time.monotonic() + gate.interval
+        if not gate.acquire(latest):
+            retry_after = max(1, math.ceil(gate.interval))
+            return jsonify({"error": "Server is overloaded, please retry"}), 503, {'Retry-After': str(retry_after)}
+
+        g.load_shedding_gate = gate
+        return None
+
+    def _teardown_request(self, error=None):
+        gate = g.pop('load_shedding_gate', None)
+        if gate is not None:
+            gate.release()
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            deadline.reset_deadline(token)
+
+    def _deadline_exceeded(self, error):
+        with self.expired_lock:
+            self.expired += 1
+        return jsonify({"error": "Request timed out"}), 503, {'Retry-After': '1'}
+
+    def _interrupted(self, error):
+        # Queries aborted by the deadline progress handler surface as sqlite "interrupted" errors
+        if deadline.is_interrupt(error):
+            return self._deadline_exceeded(error)
+        raise error
+
+    def metrics(self):
+        """Return gate state per endpoint class and the number of expired requests."""
+        with self.expired_lock:
+            expired = self.expired
+        return {
+            'enabled': self.enabled,
+            'classes': {name: gate.metrics() for name, gate in self.gates.items()},
+            'deadlineExceeded': expired,
+        }
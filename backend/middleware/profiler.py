@@ -0,0 +1,245 @@
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from backend.models.db import DATA_DIR
+
+# Where collapsed-stack profiles are written
+DEFAULT_PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+
+# Rules written by `flask profiler enable`, re-read by every worker when the file changes
+DEFAULT_TOGGLE_FILE = os.path.join(DATA_DIR, 'profiler.json')
+
+# Header that profiles a request when its value equals PROFILER_TOKEN
+PROFILE_HEADER = 'X-Profile'
+
+# Seconds between checks of the toggle file for changes
+TOGGLE_CHECK_INTERVAL = 1.0
+
+
+def _frame_name(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _c_function_name(function):
+    # Builtin methods such as sqlite3.Cursor.execute have no module of their own, so use their owner's
+    owner = getattr(function, '__self__', None)
+    module = getattr(function, '__module__', None) or (type(owner).__module__ if owner is not None else None)
+    name = getattr(function, '__qualname__', getattr(function, '__name__', repr(function)))
+    return f'{module}.{name} [C]' if module else f'{name} [C]'
+
+
+class _Trace:
+    """Deterministic profile of one thread, aggregated into collapsed stacks.
+
+    Uses sys.setprofile, which only affects the calling thread, so other
+    requests keep running unprofiled. C calls are included, which is where
+    SQLite and bcrypt time shows up. Weights are self time in microseconds.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.frames = []
+        self.stacks = {}
+        self.started = None
+        self.elapsed = 0
+
+    def _profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call':
+            self._push(_frame_name(frame.f_code), now)
+        elif event == 'c_call':
+            self._push(_c_function_name(arg), now)
+        elif event in ('return', 'c_return', 'c_exception'):
+            # Frames that were already running when tracing started have nothing to pop
+            if self.frames:
+                self._pop(now)
+
+    def _push(self, name, now):
+        self.names.append(name)
+        self.frames.append([now, 0.0])
+
+    def _pop(self, now):
+        started, children = self.frames.pop()
+        elapsed = now - started
+        key = ';'.join(self.names)
+        self.stacks[key] = self.stacks.get(key, 0) + (elapsed - children)
+        self.names.pop()
+        if self.frames:
+            self.frames[-1][1] += elapsed
+
+    def start(self):
+        self.started = time.perf_counter()
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        sys.setprofile(None)
+        now = time.perf_counter()
+        while self.frames:
+            self._pop(now)
+        self.elapsed = now - self.started
+
+    def collapsed(self):
+        """Render in the collapsed-stack format read by flamegraph.pl and speedscope."""
+        lines = [f'{stack} {round(seconds * 1_000_000)}' for stack, seconds in sorted(self.stacks.items())]
+        return '\n'.join(line for line in lines if not line.endswith(' 0')) + '\n'
+
+
+class RequestProfiler:
+    """Opt-in per-request profiling that writes collapsed-stack flame graph files.
+
+    A request is profiled when it carries the X-Profile header with the
+    configured token, when it falls in the random sample, or when it
+    matches a rule from the toggle file managed by `flask profiler`. Unless
+    PROFILER_ENABLED is set no hooks are installed, so requests pay nothing.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.token = None
+        self.sample_rate = 0.0
+        self.profile_dir = DEFAULT_PROFILE_DIR
+        self.toggle_file = DEFAULT_TOGGLE_FILE
+        self.rules = []
+        self.toggle_mtime = None
+        self.toggle_checked = 0.0
+        self.toggle_lock = threading.Lock()
+        self.profiled = 0
+        self.sequence = itertools.count(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILER_ENABLED', os.getenv('PROFILER_ENABLED', 'false').lower() == 'true')
+        app.config.setdefault('PROFILER_TOKEN', os.getenv('PROFILER_TOKEN'))
+        app.config.setdefault('PROFILER_SAMPLE_RATE', float(os.getenv('PROFILER_SAMPLE_RATE', 0)))
+        app.config.setdefault('PROFILER_DIR', os.getenv('PROFILER_DIR', DEFAULT_PROFILE_DIR))
+        app.config.setdefault('PROFILER_TOGGLE_FILE', os.getenv('PROFILER_TOGGLE_FILE', DEFAULT_TOGGLE_FILE))
+
+        self.enabled = app.config['PROFILER_ENABLED']
+        self.token = app.config['PROFILER_TOKEN']
+        self.sample_rate = app.config['PROFILER_SAMPLE_RATE']
+        self.profile_dir = app.config['PROFILER_DIR']
+        self.toggle_file = app.config['PROFILER_TOGGLE_FILE']
+        app.extensions['request_profiler'] = self
+
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def read_rules(toggle_file):
+        """Read unexpired toggle rules from a toggle file."""
+        try:
+            with open(toggle_file) as f:
+                rules = json.load(f).get('rules', [])
+        except (OSError, ValueError):
+            return []
+        now = time.time()
+        return [rule for rule in rules if rule.get('until', 0) > now]
+
+    @staticmethod
+    def write_rules(toggle_file, rules):
+        """Atomically replace the toggle file's rules."""
+        os.makedirs(os.path.dirname(toggle_file), exist_ok=True)
+        partial = toggle_file + '.tmp'
+        with open(partial, 'w') as f:
+            json.dump({'rules': rules}, f, indent=2)
+        os.replace(partial, toggle_file)
+
+    def _current_rules(self):
+        # Stat the toggle file at most once per interval; re-read it only when it changed
+        now = time.monotonic()
+        if now - self.toggle_checked >= TOGGLE_CHECK_INTERVAL:
+            with self.toggle_lock:
+                self.toggle_checked = now
+                try:
+                    mtime = os.stat(self.toggle_file).st_mtime
+                except OSError:
+                    mtime = None
+                if mtime != self.toggle_mtime:
+                    self.toggle_mtime = mtime
+                    self.rules = self.read_rules(self.toggle_file) if mtime else []
+        return self.rules
+
+    def _matches_rule(self):
+        rules = [rule for rule in self._current_rules()
+                 if rule.get('until', 0) > time.time() and rule.get('endpoint') in (None, request.endpoint)]
+        if not rules:
+            return False
+        if any(rule.get('userId') is None for rule in rules):
+            return True
+
+        # Only user-scoped rules match, so find out who is asking
+        user_id = self._user_id()
+        return user_id is not None and any(rule['userId'] == user_id for rule in rules)
+
+    @staticmethod
+    def _user_id():
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity()
+        except Exception:
+            return None
+
+    def _should_profile(self):
+        if self.token and request.headers.get(PROFILE_HEADER) == self.token:
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        if self._matches_rule():
+            return 'toggle'
+        return None
+
+    def _before_request(self):
+        if request.endpoint is None:
+            return None
+        reason = self._should_profile()
+        if reason is None:
+            return None
+
+        g.profile_reason = reason
+        g.profile_trace = _Trace()
+        g.profile_trace.start()
+        return None
+
+    def _teardown_request(self, error=None):
+        trace = g.pop('profile_trace', None)
+        if trace is None:
+            return
+        trace.stop()
+
+        try:
+            self._write(trace, g.pop('profile_reason', None))
+        except OSError:
+            # A profile that cannot be written must never fail the request
+            pass
+
+    def _write(self, trace, reason):
+        user_id = self._user_id()
+        endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unknown')
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        name = f"{stamp}-{endpoint}-user{user_id if user_id is not None else 'anonymous'}-{round(trace.elapsed * 1000)}ms-{os.getpid()}-{next(self.sequence)}.collapsed"
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with open(os.path.join(self.profile_dir, name), 'w') as f:
+            f.write(f'# {request.method} {request.path} reason={reason} elapsed_ms={trace.elapsed * 1000:.2f}\n')
+            f.write(trace.collapsed())
+        self.profiled += 1
+
+    def metrics(self):
+        return {
+            'enabled': self.enabled,
+            'sampleRate': self.sample_rate,
+            'rules': len(self.rules),
+            'profiled': self.profiled,
+        }
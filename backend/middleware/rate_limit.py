@@ -0,0 +1,245 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+# Default limits as (tokens per second, bucket capacity) for each rule and key kind
+DEFAULT_RATE_LIMITS = {
+    'login': {
+        'ip': (10 / 60, 10),
+        'account': (5 / 60, 5),
+    },
+    'tracking': {
+        'ip': (1.0, 60),
+    },
+}
+
+# Maximum number of buckets kept in memory before the least recently used are evicted
+DEFAULT_MAX_KEYS = 100_000
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+def _refill(tokens, updated, now, rate, capacity):
+    """Return the token count after refilling since the last update."""
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """Bounded in-process token bucket store with LRU eviction."""
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, capacity, now):
+        """Take one token for key. Returns (allowed, retry_after_seconds)."""
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = _Bucket(capacity, now)
+                self.buckets[key] = bucket
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.buckets.move_to_end(key)
+                bucket.tokens = _refill(bucket.tokens, bucket.updated, now, rate, capacity)
+                bucket.updated = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True, 0
+            return False, (1 - bucket.tokens) / rate
+
+    def size(self):
+        return len(self.buckets)
+
+
+class SqliteBucketStore:
+    """Token bucket store in a local SQLite file, shared by every worker on the host."""
+
+    # Run idle-bucket cleanup once every this many takes
+    CLEANUP_INTERVAL = 1000
+
+    def __init__(self, path, max_keys=DEFAULT_MAX_KEYS, idle_ttl=3600):
+        self.path = path
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self.evictions = 0
+        self.takes = 0
+        self.local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._get_connection()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated ON rate_limit_buckets (updated)')
+
+    def _get_connection(self):
+        """Get this thread's connection to the shared store."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # Limiter state is advisory, so losing the last writes on power failure is fine
+            conn.execute('PRAGMA synchronous = OFF')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def take(self, key, rate, capacity, now):
+        """Take one token for key. Returns (allowed, retry_after_seconds)."""
+        conn = self._get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], now, rate, capacity)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            conn.execute('''
+            INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated
+            ''', (key, tokens, now))
+
+            self.takes += 1
+            if self.takes % self.CLEANUP_INTERVAL == 0:
+                self._evict(conn, now)
+
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return (True, 0) if allowed else (False, (1 - tokens) / rate)
+
+    def _evict(self, conn, now):
+        """Drop idle buckets, then the oldest ones if the store is still over capacity."""
+        cursor = conn.execute('DELETE FROM rate_limit_buckets WHERE updated < ?', (now - self.idle_ttl,))
+        self.evictions += cursor.rowcount
+
+        cursor = conn.execute('''
+        DELETE FROM rate_limit_buckets WHERE key IN (
+            SELECT key FROM rate_limit_buckets ORDER BY updated
+            LIMIT MAX(0, (SELECT COUNT(*) FROM rate_limit_buckets) - ?)
+        )
+        ''', (self.max_keys,))
+        self.evictions += cursor.rowcount
+
+    def size(self):
+        return self._get_connection().execute('SELECT COUNT(*) FROM rate_limit_buckets').fetchone()[0]
+
+
+class RateLimiter:
+    """Per-IP and per-account token bucket admission control."""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.limits = {}
+        self.enabled = True
+        self.counters = {}
+        self.counters_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true')
+        app.config.setdefault('RATE_LIMIT_STORAGE', os.getenv('RATE_LIMIT_STORAGE', 'memory'))
+        app.config.setdefault('RATE_LIMIT_MAX_KEYS', int(os.getenv('RATE_LIMIT_MAX_KEYS', DEFAULT_MAX_KEYS)))
+        app.config.setdefault('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.limits = app.config['RATE_LIMITS']
+
+        # 'memory' keeps buckets per process; any other value is the path of a shared SQLite store
+        storage = app.config['RATE_LIMIT_STORAGE']
+        if storage == 'memory':
+            self.store = MemoryBucketStore(app.config['RATE_LIMIT_MAX_KEYS'])
+        else:
+            self.store = SqliteBucketStore(storage, app.config['RATE_LIMIT_MAX_KEYS'])
+
+        app.extensions['rate_limiter'] = self
+
+    def hit(self, rule, keys):
+        """Check every (kind, value) key for a rule. Returns (allowed, retry_after_seconds)."""
+        now = time.time()
+        retry_after = 0
+        limited_by = None
+        for kind, value in keys:
+            limit = self.limits.get(rule, {}).get(kind)
+            if limit is None or value is None:
+                continue
+
+            rate, capacity = limit
+            allowed, wait = self.store.take(f'{rule}:{kind}:{value}', rate, capacity, now)
+            if not allowed and wait > retry_after:
+                retry_after = wait
+                limited_by = kind
+
+        self._count(rule, f'limited_{limited_by}' if limited_by else 'allowed')
+        return limited_by is None, retry_after
+
+    def _count(self, rule, name):
+        with self.counters_lock:
+            rule_counters = self.counters.setdefault(rule, {})
+            rule_counters[name] = rule_counters.get(name, 0) + 1
+
+    def metrics(self):
+        """Return limiter counters and store statistics."""
+        with self.counters_lock:
+            counters = {rule: dict(values) for rule, values in self.counters.items()}
+        return {
+            'enabled': self.enabled,
+            'store': type(self.store).__name__,
+            'keys': self.store.size(),
+            'evictions': self.store.evictions,
+            'rules': counters,
+        }
+
+
+def rate_limit(rule, account_field=None):
+    """Reject requests over the rule's per-IP (and optionally per-account) budget with 429."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('rate_limiter')
+            if limiter is None or not limiter.enabled:
+                return view(*args, **kwargs)
+
+            keys = [('ip', request.remote_addr)]
+            if account_field:
+                data = request.get_json(silent=True)
+                # A body that is not a JSON object has no account; the view rejects it
+                if not isinstance(data, dict):
+                    data = {}
+                account = data.get(account_field)
+                keys.append(('account', account.strip().lower() if isinstance(account, str) else None))
+
+            allowed, retry_after = limiter.hit(rule, keys)
+            if not allowed:
+                return jsonify({"error": "Too many requests"}), 429, {'Retry-After': str(math.ceil(retry_after))}
+
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
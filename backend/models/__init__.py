@@ -1,5 +1,13 @@
 from backend.models.db import Database
 from backend.models.user import User
-from backend.models.delivery import Delivery, DeliveryUpdate
+from backend.models.delivery import Delivery, DeliveryUpdate, DeliveryConflict, VersionConflict, InvalidStatusTransition
+from backend.models.change_log import ChangeLog
+from backend.models.analytics import Analytics
+from backend.models.rollups import DailyRollup
+from backend.models.sharding import ShardRouter
+from backend.models.webhook import WebhookSubscription, WebhookOutbox
+from backend.models.dashboard import Dashboard
 
-__all__ = ['Database', 'User', 'Delivery', 'DeliveryUpdate'] 
\ No newline at end of file
+__all__ = ['Database', 'User', 'Delivery', 'DeliveryUpdate', 'DeliveryConflict',
+           'VersionConflict', 'InvalidStatusTransition', 'ChangeLog', 'Analytics', 'DailyRollup', 'ShardRouter',
+           'WebhookSubscription', 'WebhookOutbox', 'Dashboard'] 
\ No newline at end of file
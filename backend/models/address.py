@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Interned address ids kept per process, across all database files
+CACHE_SIZE = int(os.getenv('ADDRESS_CACHE_SIZE', 10000))
+
+# Deliveries rows with their addresses resolved, in the shape readers had before interning
+DELIVERIES_VIEW = 'deliveries_with_addresses'
+
+def address_hash(address):
+    """64-bit signed hash of an address, the leading key of its lookup index."""
+    return int.from_bytes(hashlib.blake2b(address.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+class AddressBook:
+    """Interns delivery addresses into the addresses table of each database.
+
+    Merchants ship from the same few addresses thousands of times, so
+    deliveries store address ids instead of repeating the text. Addresses are
+    interned by their exact text so to_dict() returns what was submitted.
+    Ids are local to a database file and never change once committed, which
+    lets an LRU cache skip the lookup for hot addresses on insert. A restore
+    can replace a file's addresses from under the cache, so restores bump the
+    file's generation (PRAGMA user_version) and cached ids are keyed by it;
+    entries of older generations are never hit again and age out of the LRU,
+    so no process needs restarting after a restore.
+    """
+
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def create_schema(cursor):
+        """Create the addresses table and its lookup index.
+
+        Only the 64-bit hash is indexed, so the text is stored once; the rare
+        addresses sharing a hash are told apart by comparing the text. Every
+        insert checks for the address first inside a write transaction, which
+        keeps addresses unique without a unique index.
+        """
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS addresses (
+            id INTEGER PRIMARY KEY,
+            hash INTEGER NOT NULL,
+            address TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_addresses_hash ON addresses (hash)')
+        # Earlier files indexed the text too, keeping a second copy of every address
+        cursor.execute('DROP INDEX IF EXISTS idx_addresses_hash_address')
+
+    @staticmethod
+    def create_view(cursor):
+        """Create the view resolving delivery addresses, once deliveries has its id columns."""
+        cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS {DELIVERIES_VIEW} AS
+        SELECT d.*, from_addresses.address AS from_address, to_addresses.address AS to_address
+        FROM deliveries d
+        LEFT JOIN addresses from_addresses ON from_addresses.id = d.from_address_id
+        LEFT JOIN addresses to_addresses ON to_addresses.id = d.to_address_id
+        ''')
+
+    @staticmethod
+    def migrate(cursor):
+        """Move the text address columns of an old deliveries table into addresses.
+
+        Runs inside the caller's transaction, so a failure leaves the old
+        columns in place to retry from.
+        """
+        cursor.connection.create_function('address_hash', 1, address_hash, deterministic=True)
+        cursor.execute('''
+        INSERT INTO addresses (hash, address)
+        SELECT address_hash(address), address FROM (
+            SELECT from_address AS address FROM deliveries
+            UNION
+            SELECT to_address FROM deliveries
+        ) new
+        WHERE NOT EXISTS (SELECT 1 FROM addresses existing WHERE existing.hash = address_hash(new.address) AND existing.address = new.address)
+        ''')
+        cursor.execute('''
+        UPDATE deliveries SET
+            from_address_id = (SELECT id FROM addresses WHERE hash = address_hash(deliveries.from_address) AND address = deliveries.from_address),
+            to_address_id = (SELECT id FROM addresses WHERE hash = address_hash(deliveries.to_address) AND address = deliveries.to_address)
+        ''')
+        cursor.execute('ALTER TABLE deliveries DROP COLUMN from_address')
+        cursor.execute('ALTER TABLE deliveries DROP COLUMN to_address')
+
+    @staticmethod
+    def generation(cursor):
+        """Generation of the cursor's database, bumped whenever a restore replaces its content."""
+        cursor.execute('PRAGMA user_version')
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def intern(cursor, db_path, generation, address):
+        """Get the id of address in the cursor's database, inserting it if new.
+
+        The id is not cached here because the caller's transaction may still
+        roll back; call remember() once it has committed.
+        """
+        # A missing address fails on the NOT NULL id column, as the text column did
+        if address is None:
+            return None
+
+        with AddressBook._lock:
+            address_id = AddressBook._cache.get((db_path, generation, address))
+            if address_id is not None:
+                AddressBook._cache.move_to_end((db_path, generation, address))
+                AddressBook.hits += 1
+                return address_id
+            AddressBook.misses += 1
+
+        address_key = address_hash(address)
+        cursor.execute('SELECT id FROM addresses WHERE hash = ? AND address = ?', (address_key, address))
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        cursor.execute('INSERT INTO addresses (hash, address) VALUES (?, ?)', (address_key, address))
+        return cursor.lastrowid
+
+    @staticmethod
+    def remember(db_path, generation, ids):
+        """Cache committed {address: id} pairs of a database generation."""
+        with AddressBook._lock:
+            for address, address_id in ids.items():
+                AddressBook._cache[(db_path, generation, address)] = address_id
+                AddressBook._cache.move_to_end((db_path, generation, address))
+            while len(AddressBook._cache) > CACHE_SIZE:
+                AddressBook._cache.popitem(last=False)
+
+    @staticmethod
+    def copy_deliveries(conn, where, params):
+        """Copy the deliveries d of the attached source database matching where into conn's, remapping address ids.
+
+        where may only use named parameters, taken from the params mapping.
+
+        Address ids are local to each database, so the addresses are interned
+        on the target first and the copied rows point at those.
+        """
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        INSERT INTO addresses (hash, address)
+        SELECT hash, address FROM source.addresses original
+        WHERE id IN (
+            SELECT from_address_id FROM source.deliveries d WHERE {where}
+            UNION
+            SELECT to_address_id FROM source.deliveries d WHERE {where}
+        )
+        AND NOT EXISTS (SELECT 1 FROM addresses existing WHERE existing.hash = original.hash AND existing.address = original.address)
+        ''', params)
+
+        # Name the columns, since their order differs between migrated and newly created files
+        cursor.execute('PRAGMA table_info(deliveries)')
+        columns = [row[1] for row in cursor.fetchall() if row[1] not in ('from_address_id', 'to_address_id')]
+        remap = '''(
+            SELECT target.id FROM addresses target JOIN source.addresses original
+            ON target.hash = original.hash AND target.address = original.address
+            WHERE original.id = d.{column}
+        )'''
+        cursor.execute(f'''
+        INSERT OR REPLACE INTO deliveries ({', '.join(columns)}, from_address_id, to_address_id)
+        SELECT {', '.join('d.' + column for column in columns)}, {remap.format(column='from_address_id')}, {remap.format(column='to_address_id')}
+        FROM source.deliveries d
+        WHERE {where}
+        ''', params)
+
+    @staticmethod
+    def metrics():
+        return {
+            'cached': len(AddressBook._cache),
+            'hits': AddressBook.hits,
+            'misses': AddressBook.misses,
+        }
@@ -0,0 +1,224 @@
+import bisect
+import os
+from .sharding import ShardRouter
+from .address import DELIVERIES_VIEW
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the pure Python path gives identical results
+    np = None
+
+# Upper bounds, in hours, of the transit time histogram buckets; the last bucket is open-ended
+TRANSIT_BUCKET_HOURS = [6, 12, 24, 48, 72, 120, 168, 336]
+
+# A delivery is on time when it is delivered within this many hours of being scheduled
+ON_TIME_TARGET_HOURS = float(os.getenv('ON_TIME_TARGET_HOURS', 72))
+
+# Breakdowns maintained for every user, besides the user-wide 'all' totals
+DIMENSIONS = ('packageType', 'route')
+
+# Columnar extract of delivered deliveries, as julian days. Transit starts at the first
+# In-Transit update, or at scheduling for parcels that were delivered straight away.
+EXTRACT_SQL = f'''
+SELECT d.id, d.user_id, d.package_type, d.from_address, d.to_address,
+       julianday(d.created_at) AS created,
+       COALESCE(
+           (SELECT julianday(MIN(u.created_at)) FROM delivery_updates u WHERE u.delivery_id = d.id AND u.status = 'In-Transit'),
+           julianday(d.created_at)
+       ) AS shipped,
+       (SELECT julianday(MAX(u.created_at)) FROM delivery_updates u WHERE u.delivery_id = d.id AND u.status = 'Delivered') AS delivered
+FROM {DELIVERIES_VIEW} d
+WHERE d.status = 'Delivered'
+'''
+
+def _route(from_address, to_address):
+    return f"{from_address} -> {to_address}"
+
+class Analytics:
+    """Delivery performance metrics computed from delivery_updates history.
+
+    Results live in the delivery_analytics table as per-user histogram rows
+    for each dimension key. They are maintained incrementally as deliveries
+    are delivered and can be rebuilt in bulk from history.
+    """
+
+    @staticmethod
+    def record_delivered(cursor, delivery_id):
+        """Add one newly delivered delivery to the aggregates using the caller's cursor."""
+        cursor.execute(EXTRACT_SQL + ' AND d.id = ?', (delivery_id,))
+        row = cursor.fetchone()
+        if row is None or row['delivered'] is None:
+            return
+
+        transit_hours = max(0.0, (row['delivered'] - row['shipped']) * 24)
+        on_time = int((row['delivered'] - row['created']) * 24 <= ON_TIME_TARGET_HOURS)
+        bucket = bisect.bisect_left(TRANSIT_BUCKET_HOURS, transit_hours)
+
+        keys = [('all', ''), ('packageType', row['package_type']), ('route', _route(row['from_address'], row['to_address']))]
+        cursor.executemany('''
+        INSERT INTO delivery_analytics (user_id, dimension, key, bucket, deliveries, on_time, transit_hours)
+        VALUES (?, ?, ?, ?, 1, ?, ?)
+        ON CONFLICT (user_id, dimension, key, bucket) DO UPDATE SET
+            deliveries = deliveries + 1,
+            on_time = on_time + excluded.on_time,
+            transit_hours = transit_hours + excluded.transit_hours
+        ''', [(row['user_id'], dimension, key, bucket, on_time, transit_hours) for dimension, key in keys])
+
+    @staticmethod
+    def rebuild(user_id=None):
+        """Recompute the aggregates from history, for one user or everyone.
+
+        Returns the number of delivered deliveries processed.
+        """
+        databases = [ShardRouter.database_for_user(user_id)] if user_id is not None else ShardRouter.all_databases()
+        return sum(Analytics._rebuild(db, user_id) for db in databases)
+
+    @staticmethod
+    def _rebuild(db, user_id):
+        """Recompute the aggregates stored in one database."""
+        conn = db.get_connection()
+        cursor = conn.cursor()
+
+        # Pull the history as columns rather than objects
+        params = []
+        query = EXTRACT_SQL
+        if user_id is not None:
+            query += ' AND d.user_id = ?'
+            params.append(user_id)
+        cursor.execute(query, params)
+        rows = [row for row in cursor.fetchall() if row['delivered'] is not None]
+
+        columns = {
+            'user_id': [row['user_id'] for row in rows],
+            'created': [row['created'] for row in rows],
+            'shipped': [row['shipped'] for row in rows],
+            'delivered': [row['delivered'] for row in rows],
+            'all': ['' for _ in rows],
+            'packageType': [row['package_type'] for row in rows],
+            'route': [_route(row['from_address'], row['to_address']) for row in rows],
+        }
+        aggregate = Analytics._aggregate_numpy if np is not None else Analytics._aggregate_python
+        aggregates = aggregate(columns)
+
+        if user_id is None:
+            cursor.execute('DELETE FROM delivery_analytics')
+        else:
+            cursor.execute('DELETE FROM delivery_analytics WHERE user_id = ?', (user_id,))
+        cursor.executemany('''
+        INSERT INTO delivery_analytics (user_id, dimension, key, bucket, deliveries, on_time, transit_hours)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', aggregates)
+        conn.commit()
+
+        return len(rows)
+
+    @staticmethod
+    def _aggregate_numpy(columns):
+        """Vectorized aggregation of the columnar extract into histogram rows."""
+        if not columns['user_id']:
+            return []
+
+        created = np.asarray(columns['created'], dtype=float)
+        shipped = np.asarray(columns['shipped'], dtype=float)
+        delivered = np.asarray(columns['delivered'], dtype=float)
+
+        transit_hours = np.maximum(0.0, (delivered - shipped) * 24)
+        on_time = ((delivered - created) * 24 <= ON_TIME_TARGET_HOURS).astype(np.int64)
+        buckets = np.searchsorted(np.asarray(TRANSIT_BUCKET_HOURS, dtype=float), transit_hours, side='left')
+        bucket_count = len(TRANSIT_BUCKET_HOURS) + 1
+
+        users, user_codes = np.unique(np.asarray(columns['user_id'], dtype=np.int64), return_inverse=True)
+
+        results = []
+        for dimension in ('all',) + DIMENSIONS:
+            keys, key_codes = np.unique(np.asarray(columns[dimension], dtype=str), return_inverse=True)
+
+            # Encode (user, key, bucket) as one integer, then sum each group with bincount
+            codes = (user_codes * len(keys) + key_codes) * bucket_count + buckets
+            groups, inverse = np.unique(codes, return_inverse=True)
+            counts = np.bincount(inverse)
+            on_time_counts = np.bincount(inverse, weights=on_time)
+            hours = np.bincount(inverse, weights=transit_hours)
+
+            user_index, remainder = np.divmod(groups, len(keys) * bucket_count)
+            key_index, bucket_index = np.divmod(remainder, bucket_count)
+            for i in range(len(groups)):
+                results.append((int(users[user_index[i]]), dimension, str(keys[key_index[i]]), int(bucket_index[i]),
+                                int(counts[i]), int(on_time_counts[i]), float(hours[i])))
+        return results
+
+    @staticmethod
+    def _aggregate_python(columns):
+        """Aggregation of the columnar extract into histogram rows without numpy."""
+        groups = {}
+        for i, user in enumerate(columns['user_id']):
+            transit_hours = max(0.0, (columns['delivered'][i] - columns['shipped'][i]) * 24)
+            on_time = int((columns['delivered'][i] - columns['created'][i]) * 24 <= ON_TIME_TARGET_HOURS)
+            bucket = bisect.bisect_left(TRANSIT_BUCKET_HOURS, transit_hours)
+            for dimension in ('all',) + DIMENSIONS:
+                group = groups.setdefault((user, dimension, columns[dimension][i], bucket), [0, 0, 0.0])
+                group[0] += 1
+                group[1] += on_time
+                group[2] += transit_hours
+        return [key + tuple(values) for key, values in groups.items()]
+
+    @staticmethod
+    def summary(user_id=None, dimensions=(), conn=None):
+        """Read precomputed metrics for a user (or everyone).
+
+        Returns the user-wide totals plus a breakdown for each requested
+        dimension. With conn, a connection to the user's shard, only it is read.
+        """
+        wanted = ('all',) + tuple(dimensions)
+        placeholders = ', '.join('?' for _ in wanted)
+        params = list(wanted)
+        user_filter = ""
+        if user_id is not None:
+            user_filter = "AND user_id = ?"
+            params.append(user_id)
+
+        # Everyone's metrics are spread over all shards, so sum them across databases
+        if conn is not None:
+            connections = [conn]
+        else:
+            databases = [ShardRouter.database_for_user(user_id)] if user_id is not None else ShardRouter.all_databases()
+            connections = [db.get_connection() for db in databases]
+        groups = {}
+        for connection in connections:
+            cursor = connection.cursor()
+            cursor.execute(f'''
+            SELECT dimension, key, bucket, SUM(deliveries) AS deliveries, SUM(on_time) AS on_time, SUM(transit_hours) AS transit_hours
+            FROM delivery_analytics
+            WHERE dimension IN ({placeholders}) {user_filter}
+            GROUP BY dimension, key, bucket
+            ''', params)
+
+            for row in cursor.fetchall():
+                group = groups.setdefault((row['dimension'], row['key']), {
+                    'deliveries': 0, 'on_time': 0, 'transit_hours': 0.0, 'histogram': [0] * (len(TRANSIT_BUCKET_HOURS) + 1)
+                })
+                group['deliveries'] += row['deliveries']
+                group['on_time'] += row['on_time']
+                group['transit_hours'] += row['transit_hours']
+                group['histogram'][row['bucket']] += row['deliveries']
+
+        result = {'all': Analytics._metrics(groups.get(('all', '')))}
+        for dimension in dimensions:
+            result[dimension] = {
+                key: Analytics._metrics(group) for (group_dimension, key), group in sorted(groups.items()) if group_dimension == dimension
+            }
+        return result
+
+    @staticmethod
+    def _metrics(group):
+        """Turn a summed histogram group into API metrics."""
+        if not group or not group['deliveries']:
+            return {'deliveries': 0, 'onTimeRate': 0, 'averageTransitHours': 0, 'histogram': []}
+
+        bounds = TRANSIT_BUCKET_HOURS + [None]
+        return {
+            'deliveries': group['deliveries'],
+            'onTimeRate': round(100 * group['on_time'] / group['deliveries'], 1),
+            'averageTransitHours': round(group['transit_hours'] / group['deliveries'], 1),
+            'histogram': [{'maxHours': bound, 'count': count} for bound, count in zip(bounds, group['histogram'])]
+        }
@@ -0,0 +1,317 @@
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from .db import Database, DATA_DIR
+
+# Where snapshots are written, one directory per snapshot
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(DATA_DIR, 'backups'))
+
+# Pages copied per backup step, and the pause after each step that lets writers in
+PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', 64))
+STEP_SLEEP_MS = float(os.getenv('BACKUP_STEP_SLEEP_MS', 5))
+
+# Number of snapshots kept by prune, and minutes between scheduled snapshots
+RETENTION = int(os.getenv('BACKUP_RETENTION', 24))
+INTERVAL_MINUTES = float(os.getenv('BACKUP_INTERVAL_MINUTES', 60))
+
+# Restarts caused by concurrent writes before the copy falls back to a single step
+MAX_RESTARTS = 3
+
+# Seconds between write lock probes while a copy runs
+PROBE_INTERVAL = 0.05
+
+MANIFEST = 'manifest.json'
+
+class BackupError(Exception):
+    """A snapshot is missing, incomplete or does not match its checksums."""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _percentiles(values):
+    """Summarize durations in seconds as milliseconds."""
+    if not values:
+        return {'count': 0, 'p50': 0, 'p95': 0, 'p99': 0, 'max': 0}
+    ordered = sorted(values)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {'count': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1] * 1000, 2)}
+
+
+class _WriteProbe:
+    """Measures how long taking the database write lock takes, as a stand-in for request write latency.
+
+    BEGIN IMMEDIATE followed by ROLLBACK takes and releases the write lock
+    without changing anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self, conn):
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('ROLLBACK')
+        self.samples.append(time.perf_counter() - started)
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            while not self.stop_event.is_set():
+                self.sample(conn)
+                self.stop_event.wait(PROBE_INTERVAL)
+        finally:
+            conn.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='backup-write-probe', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        return self.samples
+
+
+class Backup:
+    """Online snapshots of the directory and shard databases.
+
+    Each database is copied with the SQLite online backup API a few pages at
+    a time from one pinned WAL snapshot, sleeping between steps so the copy's
+    I/O yields to live requests, then gzip-compressed and checksummed. Write
+    lock wait is probed before and during the copy to show its cost. Shards
+    are copied before the directory so every delivery in a snapshot's shards
+    is present in its delivery index.
+    """
+
+    @staticmethod
+    def database_paths():
+        """Get (name, path) of every database file to back up, shards first."""
+        paths = []
+        for path in sorted(glob.glob(os.path.join(DATA_DIR, 'shards', 'shard-*.db'))):
+            paths.append((os.path.relpath(path, DATA_DIR), path))
+        directory = Database().db_path
+        paths.append((os.path.relpath(directory, DATA_DIR), directory))
+        return paths
+
+    @staticmethod
+    def _copy(source_path, target_path, pages, sleep):
+        """Copy a live database with the backup API. Returns step and write-lock timing stats."""
+        step_times = []
+        restarts = 0
+        state = {'remaining': None, 'step_started': None}
+
+        def progress(status, remaining, total):
+            nonlocal restarts
+            now = time.perf_counter()
+            step_times.append(now - state['step_started'])
+
+            # A write from another connection makes the backup start over
+            if state['remaining'] is not None and remaining > state['remaining']:
+                restarts += 1
+                if restarts > MAX_RESTARTS:
+                    raise _TooManyRestarts()
+            state['remaining'] = remaining
+
+            if remaining and sleep:
+                time.sleep(sleep)
+            state['step_started'] = time.perf_counter()
+
+        # Measure write lock latency with and without the copy running
+        probe = _WriteProbe(source_path)
+        baseline_conn = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+        try:
+            for _ in range(10):
+                probe.sample(baseline_conn)
+        finally:
+            baseline_conn.close()
+        baseline = probe.samples
+        probe.samples = []
+
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        single_step = False
+        started = time.perf_counter()
+        probe.start()
+        try:
+            # In WAL mode a read transaction held across steps pins one snapshot, so writes no longer restart the copy
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+            state['step_started'] = time.perf_counter()
+            try:
+                source.backup(target, pages=pages, progress=progress)
+            except _TooManyRestarts:
+                # Under heavy writes a stepped copy may never finish; one step holds a single read snapshot instead
+                single_step = True
+                state['step_started'] = time.perf_counter()
+                source.backup(target, pages=-1, progress=progress)
+            page_count = target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            during = probe.stop()
+            source.close()
+            target.close()
+
+        return {
+            'pages': page_count,
+            'steps': len(step_times),
+            'restarts': restarts,
+            'singleStepFallback': single_step,
+            'seconds': round(time.perf_counter() - started, 3),
+            'stepMs': _percentiles(step_times),
+            'writeLockWaitMs': {
+                'baseline': _percentiles(baseline),
+                'duringBackup': _percentiles(during),
+            },
+        }
+
+    @staticmethod
+    def _compress(source_path, target_path):
+        """Gzip a file and return the sha256 of the compressed output."""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        with open(target_path, 'rb') as compressed:
+            for chunk in iter(lambda: compressed.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def run(pages=PAGES_PER_STEP, sleep_ms=STEP_SLEEP_MS, backup_dir=BACKUP_DIR):
+        """Take a snapshot of every database and return its manifest.
+
+        The snapshot is built in a hidden directory and renamed into place
+        only once complete, so listed snapshots are never partial.
+        """
+        created = datetime.datetime.now(datetime.timezone.utc)
+        name = created.strftime('%Y%m%dT%H%M%S%fZ')
+        partial = os.path.join(backup_dir, f'.{name}.partial')
+        os.makedirs(partial)
+
+        files = []
+        try:
+            for db_name, path in Backup.database_paths():
+                target = os.path.join(partial, db_name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+
+                stats = Backup._copy(path, target, pages, sleep_ms / 1000)
+                stats['name'] = db_name
+                stats['sha256'] = Backup._compress(target, target + '.gz')
+                stats['bytes'] = os.path.getsize(target + '.gz')
+                os.remove(target)
+                files.append(stats)
+
+            manifest = {
+                'name': name,
+                'createdAt': created.isoformat(),
+                'pagesPerStep': pages,
+                'stepSleepMs': sleep_ms,
+                'files': files,
+            }
+            with open(os.path.join(partial, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            os.rename(partial, os.path.join(backup_dir, name))
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        return manifest
+
+    @staticmethod
+    def list(backup_dir=BACKUP_DIR):
+        """Get the manifests of every complete snapshot, newest first."""
+        if not os.path.isdir(backup_dir):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(backup_dir), reverse=True):
+            path = os.path.join(backup_dir, name, MANIFEST)
+            if not name.startswith('.') and os.path.isfile(path):
+                with open(path) as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    @staticmethod
+    def _load(name, backup_dir):
+        path = os.path.join(backup_dir, os.path.basename(name), MANIFEST)
+        if not os.path.isfile(path):
+            raise BackupError(f'Snapshot {name} not found in {backup_dir}')
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def verify(name, backup_dir=BACKUP_DIR):
+        """Check every file of a snapshot against its checksum. Raises BackupError on a mismatch."""
+        manifest = Backup._load(name, backup_dir)
+        for entry in manifest['files']:
+            path = os.path.join(backup_dir, manifest['name'], entry['name'] + '.gz')
+            if not os.path.isfile(path):
+                raise BackupError(f"Snapshot {manifest['name']} is missing {entry['name']}")
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != entry['sha256']:
+                raise BackupError(f"Checksum mismatch for {entry['name']} in snapshot {manifest['name']}")
+        return manifest
+
+    @staticmethod
+    def restore(name, backup_dir=BACKUP_DIR):
+        """Restore every database of a verified snapshot. Returns the restored file names.
+
+        Each file is written back through the backup API, which takes the
+        database's write lock, so open connections see either the old or the
+        restored content. Writers should still be stopped to avoid losing
+        writes made after the restore starts. The restored file gets a newer
+        generation than the one it replaces, so processes that cached its
+        address ids look them up again instead of needing a restart.
+        """
+        manifest = Backup.verify(name, backup_dir)
+        restored = []
+        for entry in manifest['files']:
+            target_path = os.path.join(DATA_DIR, entry['name'])
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+            # Decompress next to the target, then copy it in page by page
+            staging = target_path + '.restore'
+            with gzip.open(os.path.join(backup_dir, manifest['name'], entry['name'] + '.gz'), 'rb') as source, open(staging, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            try:
+                source = sqlite3.connect(staging)
+                target = sqlite3.connect(target_path, timeout=30)
+                try:
+                    # Stamped on the staging copy, so the generation changes in the same write as the content
+                    generation = max(source.execute('PRAGMA user_version').fetchone()[0], target.execute('PRAGMA user_version').fetchone()[0])
+                    source.execute(f'PRAGMA user_version = {generation + 1}')
+                    source.backup(target)
+                finally:
+                    source.close()
+                    target.close()
+            finally:
+                os.remove(staging)
+            restored.append(entry['name'])
+
+        return restored
+
+    @staticmethod
+    def prune(retention=RETENTION, backup_dir=BACKUP_DIR):
+        """Delete all but the newest retention snapshots. Returns the deleted names."""
+        removed = []
+        for manifest in Backup.list(backup_dir)[retention:]:
+            shutil.rmtree(os.path.join(backup_dir, manifest['name']))
+            removed.append(manifest['name'])
+        return removed
@@ -0,0 +1,82 @@
+import json
+from .sharding import ShardRouter
+
+class ChangeLog:
+    """Append-only log of delivery changes, read by sequence number for incremental sync."""
+
+    # Operations recorded in the log
+    CREATE = 'create'
+    UPDATE = 'update'
+    STATUS = 'status'
+    IMAGE = 'image'
+
+    @staticmethod
+    def record(cursor, delivery, operation):
+        """Append a change for a delivery using the caller's cursor.
+
+        The caller commits, so the change lands in the same transaction as the
+        write it describes. The payload is a full snapshot of the delivery row,
+        which is what lets compaction drop superseded entries.
+        """
+        fields = [field for field in delivery.FIELDS if field != 'updates']
+        cursor.execute('''
+        INSERT INTO delivery_changes (delivery_id, user_id, operation, payload)
+        VALUES (?, ?, ?, ?)
+        ''', (delivery.id, delivery.user_id, operation, json.dumps(delivery.to_dict(fields))))
+        return cursor.lastrowid
+
+    @staticmethod
+    def since(user_id, since=0, limit=100):
+        """Get a user's changes after a sequence number, oldest first.
+
+        Returns (changes, has_more).
+        """
+        db = ShardRouter.database_for_user(user_id)
+        conn = db.get_connection()
+        cursor = conn.cursor()
+
+        # Fetch one extra row to know whether another page exists
+        cursor.execute('''
+        SELECT seq, delivery_id, operation, payload, created_at FROM delivery_changes
+        WHERE user_id = ? AND seq > ?
+        ORDER BY seq
+        LIMIT ?
+        ''', (user_id, since, limit + 1))
+        rows = cursor.fetchall()
+
+        changes = [{
+            'seq': row['seq'],
+            'deliveryId': row['delivery_id'],
+            'operation': row['operation'],
+            'delivery': json.loads(row['payload']),
+            'createdAt': row['created_at']
+        } for row in rows[:limit]]
+
+        return changes, len(rows) > limit
+
+    @staticmethod
+    def compact(retention_days):
+        """Delete changes older than the retention period that a newer change supersedes.
+
+        The latest change of every delivery is always kept, so a consumer that
+        starts from zero still converges to the current state of every delivery.
+        Returns the number of deleted changes.
+        """
+        deleted = 0
+        for db in ShardRouter.all_databases():
+            conn = db.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+            DELETE FROM delivery_changes
+            WHERE created_at < datetime('now', ?)
+            AND EXISTS (
+                SELECT 1 FROM delivery_changes AS newer
+                WHERE newer.delivery_id = delivery_changes.delivery_id
+                AND newer.seq > delivery_changes.seq
+            )
+            ''', (f'-{int(retention_days)} days',))
+
+            deleted += cursor.rowcount
+            conn.commit()
+        return deleted
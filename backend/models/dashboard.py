@@ -0,0 +1,92 @@
+from .sharding import ShardRouter
+from .user import User
+from .delivery import Delivery
+from .address import DELIVERIES_VIEW
+
+# Delivery fields shown in the dashboard's recent deliveries list
+SUMMARY_FIELDS = ('id', 'trackingNumber', 'packageType', 'from', 'to', 'date', 'status', 'version', 'latestUpdate')
+
+class Dashboard:
+    """A user's profile, statistics and recent deliveries, read as one snapshot.
+
+    Everything comes from the user's shard connection inside a single read
+    transaction; when sharded, the directory database holding the users table
+    is attached to that connection for the duration of the read.
+    """
+
+    @staticmethod
+    def _open(user_id):
+        shard_id = ShardRouter.shard_for_user(user_id)
+        db = ShardRouter.database_for_shard(shard_id)
+        conn = db.get_connection()
+        if not ShardRouter.is_sharded():
+            return db, conn, 'users', shard_id
+
+        conn.execute('ATTACH DATABASE ? AS directory', (ShardRouter.directory().db_path,))
+        return db, conn, 'directory.users', shard_id
+
+    @staticmethod
+    def _close(conn):
+        if ShardRouter.is_sharded():
+            conn.execute('DETACH DATABASE directory')
+
+    @staticmethod
+    def _version(cursor, users_table, user_id, shard_id):
+        # The user row version and the newest change log entry move whenever anything on the dashboard does;
+        # change sequence numbers are per shard, so the shard is part of the version too
+        cursor.execute(f'''
+        SELECT
+            (SELECT version FROM {users_table} WHERE id = ?) AS user_version,
+            (SELECT IFNULL(MAX(seq), 0) FROM delivery_changes WHERE user_id = ?) AS change_seq
+        ''', (user_id, user_id))
+        row = cursor.fetchone()
+        if row['user_version'] is None:
+            return None
+        return f"{shard_id}.{row['user_version']}.{row['change_seq']}"
+
+    @staticmethod
+    def version(user_id):
+        """Get the dashboard's current version, or None if the user does not exist."""
+        db, conn, users_table, shard_id = Dashboard._open(user_id)
+        try:
+            return Dashboard._version(conn.cursor(), users_table, user_id, shard_id)
+        finally:
+            Dashboard._close(conn)
+
+    @staticmethod
+    def load(user_id, limit):
+        """Read the dashboard of a user, or None if the user does not exist.
+
+        Returns a dict with the version it was read at, the user, their
+        statistics, up to limit most recent delivery summaries and whether
+        there are more deliveries.
+        """
+        db, conn, users_table, shard_id = Dashboard._open(user_id)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            try:
+                version = Dashboard._version(cursor, users_table, user_id, shard_id)
+                if version is None:
+                    return None
+
+                cursor.execute(f'SELECT * FROM {users_table} WHERE id = ?', (user_id,))
+                user = User._from_row(cursor.fetchone())
+
+                statistics = Delivery.get_statistics(user_id, conn=conn)
+
+                # Fetch one extra row to know whether the list continues
+                cursor.execute(f'SELECT * FROM {DELIVERIES_VIEW} WHERE user_id = ? ORDER BY id DESC LIMIT ?', (user_id, limit + 1))
+                rows = cursor.fetchall()
+            finally:
+                conn.commit()
+        finally:
+            Dashboard._close(conn)
+
+        return {
+            'version': version,
+            'user': user.to_dict(),
+            'statistics': statistics,
+            'deliveries': [Delivery._from_row(row, db).to_dict(SUMMARY_FIELDS) for row in rows[:limit]],
+            'hasMore': len(rows) > limit
+        }
@@ -1,34 +1,64 @@
 import sqlite3
 import os
+import threading
 from pathlib import Path
+from .status import STATUS_TRANSITIONS
+from . import deadline
+from .address import AddressBook, DELIVERIES_VIEW
+
+# Directory holding the database files
+DATA_DIR = os.path.join(Path(__file__).parent.parent, 'data')
 
 class Database:
-    def __init__(self):
-        # Get the path to the data directory
-        self.db_path = os.path.join(Path(__file__).parent.parent, 'data', 'beezetrack.db')
+    # Database files whose schema this process has already set up
+    _initialized_paths = set()
+    _initialize_lock = threading.Lock()
+
+    def __init__(self, db_path=None, foreign_keys=True):
+        # Get the path to the database file, the main database by default
+        self.db_path = db_path or os.path.join(DATA_DIR, 'beezetrack.db')
+        self.foreign_keys = foreign_keys
         
         # Ensure data directory exists
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        # Initialize database
+        # Initialize database once per file and process
         self.conn = None
-        self.initialize_db()
+        if self.db_path not in Database._initialized_paths:
+            with Database._initialize_lock:
+                if self.db_path not in Database._initialized_paths:
+                    self.initialize_db()
+                    Database._initialized_paths.add(self.db_path)
 
     def get_connection(self):
         """Get a connection to the database."""
         if self.conn is None:
             self.conn = sqlite3.connect(self.db_path)
-            # Enable foreign keys
-            self.conn.execute("PRAGMA foreign_keys = ON")
+            # Enable foreign keys, except on shard files whose users live in the directory database
+            if self.foreign_keys:
+                self.conn.execute("PRAGMA foreign_keys = ON")
             # Return dictionary-like objects for rows
             self.conn.row_factory = sqlite3.Row
+            # Abort queries once the request that runs them has run out of time
+            deadline.install(self.conn)
         return self.conn
 
     def initialize_db(self):
         """Initialize the database tables if they don't exist."""
         conn = self.get_connection()
+        # Migrations run once and can take far longer than a request, so the deadline of whichever request got here first does not apply
+        deadline.uninstall(conn)
+        try:
+            self._create_schema(conn)
+        finally:
+            deadline.install(conn)
+
+    def _create_schema(self, conn):
         cursor = conn.cursor()
 
+        # Use write-ahead logging so long reads such as exports do not block writers
+        cursor.execute("PRAGMA journal_mode = WAL")
+
         # Create users table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -46,6 +76,9 @@ class Database:
         )
         ''')
 
+        # Create interned addresses, referenced by deliveries
+        AddressBook.create_schema(cursor)
+
         # Create deliveries table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS deliveries (
@@ -54,8 +87,8 @@ class Database:
             package_type TEXT NOT NULL,
             weight TEXT NOT NULL,
             dimensions TEXT NOT NULL,
-            from_address TEXT NOT NULL,
-            to_address TEXT NOT NULL,
+            from_address_id INTEGER NOT NULL REFERENCES addresses (id),
+            to_address_id INTEGER NOT NULL REFERENCES addresses (id),
             date TEXT NOT NULL,
             status TEXT NOT NULL,
             user_id INTEGER,
@@ -78,8 +111,222 @@ class Database:
         )
         ''')
 
+        # Create append-only delivery change log for incremental sync
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS delivery_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            delivery_id INTEGER NOT NULL,
+            user_id INTEGER,
+            operation TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_delivery_changes_user_seq ON delivery_changes (user_id, seq)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_delivery_changes_delivery_seq ON delivery_changes (delivery_id, seq)')
+
+        # Create precomputed delivery analytics, one histogram bucket per row
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS delivery_analytics (
+            user_id INTEGER NOT NULL,
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            deliveries INTEGER NOT NULL,
+            on_time INTEGER NOT NULL,
+            transit_hours REAL NOT NULL,
+            PRIMARY KEY (user_id, dimension, key, bucket)
+        ) WITHOUT ROWID
+        ''')
+
+        # Create daily per-user event rollups for time-series charts
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS delivery_daily_rollups (
+            user_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, event, day)
+        ) WITHOUT ROWID
+        ''')
+
+        # Create shard directory tables, used when deliveries are sharded by user
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard_id INTEGER NOT NULL,
+            moving INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS delivery_index (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tracking_number TEXT NOT NULL UNIQUE,
+            shard_id INTEGER NOT NULL
+        )
+        ''')
+
+        # Create webhook subscriptions, their pending event outbox and the events that ran out of retries
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            secret TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscription_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscription_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_webhook_subscriptions_user_id ON webhook_subscriptions (user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_webhook_outbox_next_attempt ON webhook_outbox (next_attempt_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_webhook_dead_letters_user_id ON webhook_dead_letters (user_id)')
+
+        # Indexes for the per-user listing and per-delivery update lookups
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_user_id ON deliveries (user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_delivery_updates_delivery_id ON delivery_updates (delivery_id)')
+
+        # Columns added after the original schema
+        self._add_column(cursor, 'deliveries', 'image_url', 'TEXT')
+
+        # Denormalized summary of the most recent delivery update
+        if self._add_column(cursor, 'deliveries', 'latest_update_status', 'TEXT'):
+            self._add_column(cursor, 'deliveries', 'latest_update_date', 'TEXT')
+            self._add_column(cursor, 'deliveries', 'latest_update_time', 'TEXT')
+            self._add_column(cursor, 'deliveries', 'latest_update_description', 'TEXT')
+            cursor.execute('''
+            UPDATE deliveries
+            SET (latest_update_status, latest_update_date, latest_update_time, latest_update_description) = (
+                SELECT status, date, time, description FROM delivery_updates
+                WHERE delivery_updates.delivery_id = deliveries.id
+                ORDER BY id DESC LIMIT 1
+            )
+            ''')
+
+        # Version counter for compare-and-set updates
+        self._add_column(cursor, 'deliveries', 'version', 'INTEGER NOT NULL DEFAULT 0')
+        self._add_column(cursor, 'users', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+        # Set while a user's rows are being moved between shards, refusing their writes
+        self._add_column(cursor, 'user_shards', 'moving', 'INTEGER NOT NULL DEFAULT 0')
+
+        # Text addresses moved to the interned addresses table; checked by the old column so an interrupted run resumes
+        if self._has_column(cursor, 'deliveries', 'from_address'):
+            self._add_column(cursor, 'deliveries', 'from_address_id', 'INTEGER REFERENCES addresses (id)')
+            self._add_column(cursor, 'deliveries', 'to_address_id', 'INTEGER REFERENCES addresses (id)')
+            AddressBook.migrate(cursor)
+
+        # Added columns cannot be NOT NULL, so rebuild the migrated table to match a newly created one
+        if self._is_nullable(cursor, 'deliveries', 'from_address_id'):
+            cursor.execute(f'DROP VIEW IF EXISTS {DELIVERIES_VIEW}')
+            self._rebuild_table(cursor, 'deliveries', {
+                f'{column} INTEGER REFERENCES addresses (id)': f'{column} INTEGER NOT NULL REFERENCES addresses (id)'
+                for column in ('from_address_id', 'to_address_id')
+            })
+        AddressBook.create_view(cursor)
+
+        # Allowed status transitions, checked inside the status update statement
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS status_transitions (
+            from_status TEXT NOT NULL,
+            to_status TEXT NOT NULL,
+            PRIMARY KEY (from_status, to_status)
+        ) WITHOUT ROWID
+        ''')
+        transitions = {(from_status, to_status) for from_status, targets in STATUS_TRANSITIONS.items() for to_status in targets}
+        cursor.execute('SELECT from_status, to_status FROM status_transitions')
+        if {tuple(row) for row in cursor.fetchall()} != transitions:
+            cursor.execute('DELETE FROM status_transitions')
+            cursor.executemany('INSERT INTO status_transitions (from_status, to_status) VALUES (?, ?)', sorted(transitions))
+
         conn.commit()
 
+    @staticmethod
+    def _has_column(cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row['name'] == column for row in cursor.fetchall())
+
+    @staticmethod
+    def _is_nullable(cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row['name'] == column and not row['notnull'] for row in cursor.fetchall())
+
+    def _rebuild_table(self, cursor, table, replacements):
+        """Recreate a table from its stored definition with text replaced, keeping its rows, indexes, triggers and id sequence.
+
+        SQLite cannot change a column's constraints in place. Whatever the
+        caller's transaction holds is committed first, because foreign keys
+        can only be switched off outside a transaction, and they have to be
+        so dropping the old table leaves the rows referencing it alone.
+        """
+        conn = cursor.connection
+        conn.commit()
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute("SELECT sql FROM sqlite_schema WHERE type = 'table' AND name = ?", (table,))
+            sql = cursor.fetchone()['sql']
+            for old, new in replacements.items():
+                sql = sql.replace(old, new)
+            cursor.execute("SELECT sql FROM sqlite_schema WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL", (table,))
+            dependents = [row['sql'] for row in cursor.fetchall()]
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+            sequence = cursor.fetchone()
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = ', '.join(row['name'] for row in cursor.fetchall())
+
+            rebuilt = f'{table}_rebuilt'
+            cursor.execute(sql.replace(f'CREATE TABLE {table} ', f'CREATE TABLE {rebuilt} ', 1))
+            cursor.execute(f'INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table}')
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {rebuilt} RENAME TO {table}')
+            for dependent in dependents:
+                cursor.execute(dependent)
+            # Dropping the table lost its AUTOINCREMENT high-water mark, which keeps deleted ids from coming back
+            if sequence is not None:
+                cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (sequence['seq'], table))
+
+            cursor.execute(f'PRAGMA foreign_key_check({table})')
+            if cursor.fetchone() is not None:
+                raise sqlite3.IntegrityError(f'Rebuilt {table} table violates a foreign key')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if self.foreign_keys:
+                cursor.execute('PRAGMA foreign_keys = ON')
+
+    @staticmethod
+    def _add_column(cursor, table, column, definition):
+        """Add a column to a table if it is missing. Returns True if it was added."""
+        if Database._has_column(cursor, table, column):
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+
     def close(self):
         """Close the database connection."""
         if self.conn is not None:
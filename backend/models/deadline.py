@@ -0,0 +1,56 @@
+import contextvars
+import sqlite3
+import time
+
+# Monotonic time by which the current request must finish, or None
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+# SQLite virtual machine instructions between deadline checks
+PROGRESS_INTERVAL = 1000
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed, so its remaining work was abandoned."""
+
+def set_deadline(seconds):
+    """Set the current context's deadline, seconds from now. Returns a token for reset_deadline."""
+    return _deadline.set(time.monotonic() + seconds)
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+def lift():
+    """Drop the current context's deadline, e.g. once a streamed response body has started."""
+    _deadline.set(None)
+
+def current_deadline():
+    return _deadline.get()
+
+def remaining():
+    """Seconds left before the deadline, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def expired(deadline=None):
+    if deadline is None:
+        deadline = _deadline.get()
+    return deadline is not None and time.monotonic() > deadline
+
+def check():
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    if expired():
+        raise DeadlineExceeded("Request deadline exceeded")
+
+def _progress_handler():
+    # A non-zero return makes SQLite abort the running statement with "interrupted"
+    return 1 if expired() else 0
+
+def install(conn):
+    """Make statements on this connection abort once the calling context's deadline passes."""
+    conn.set_progress_handler(_progress_handler, PROGRESS_INTERVAL)
+
+def uninstall(conn):
+    conn.set_progress_handler(None, 0)
+
+def is_interrupt(error):
+    """Whether a sqlite3 error was raised by the deadline progress handler."""
+    return isinstance(error, sqlite3.OperationalError) and str(error) == 'interrupted'
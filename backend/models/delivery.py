@@ -2,7 +2,28 @@ import sqlite3
 import datetime
 import random
 import string
-from .db import Database
+from .sharding import ShardRouter
+from .change_log import ChangeLog
+from .analytics import Analytics
+from .rollups import DailyRollup, STATUS_EVENTS
+from .group_commit import GroupCommitWriter
+from .webhook import WebhookOutbox
+from .address import AddressBook, DELIVERIES_VIEW
+
+class DeliveryConflict(Exception):
+    """A status update lost against the stored state of the delivery."""
+
+class VersionConflict(DeliveryConflict):
+    def __init__(self, expected_version, current_version):
+        super().__init__(f"Delivery was modified (expected version {expected_version}, current version {current_version})")
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+class InvalidStatusTransition(DeliveryConflict):
+    def __init__(self, current_status, new_status):
+        super().__init__(f"Cannot change status from {current_status} to {new_status}")
+        self.current_status = current_status
+        self.new_status = new_status
 
 class DeliveryUpdate:
     def __init__(self, id=None, delivery_id=None, status=None, date=None, time=None, description=None):
@@ -13,6 +34,18 @@ class DeliveryUpdate:
         self.time = time
         self.description = description
     
+    @staticmethod
+    def _from_row(update_data):
+        """Build a DeliveryUpdate from a delivery_updates row."""
+        return DeliveryUpdate(
+            id=update_data['id'],
+            delivery_id=update_data['delivery_id'],
+            status=update_data['status'],
+            date=update_data['date'],
+            time=update_data['time'],
+            description=update_data['description']
+        )
+
     def to_dict(self):
         """Convert delivery update to dictionary."""
         return {
@@ -25,8 +58,13 @@ class DeliveryUpdate:
         }
 
 class Delivery:
+    # API field names accepted by to_dict(fields=...)
+    FIELDS = ('id', 'trackingNumber', 'packageType', 'weight', 'dimensions', 'from', 'to',
+              'date', 'status', 'userId', 'imageUrl', 'version', 'latestUpdate', 'updates')
+
     def __init__(self, id=None, tracking_number=None, package_type=None, weight=None, dimensions=None, 
-                 from_address=None, to_address=None, date=None, status=None, user_id=None, image_url=None):
+                 from_address=None, to_address=None, date=None, status=None, user_id=None, image_url=None,
+                 latest_update=None, version=0, db=None):
         self.id = id
         self.tracking_number = tracking_number or self._generate_tracking_number()
         self.package_type = package_type
@@ -38,8 +76,49 @@ class Delivery:
         self.status = status or "Pending"
         self.user_id = user_id
         self.image_url = image_url
+        self.latest_update = latest_update
+        self.version = version
         self.updates = []
-        self.db = Database()
+        self._db = db
+
+    @property
+    def db(self):
+        """The database holding this delivery, resolved from its user's shard on first use."""
+        if self._db is None:
+            self._db = ShardRouter.database_for_user(self.user_id)
+        return self._db
+
+    @staticmethod
+    def _from_row(delivery_data, db=None):
+        """Build a Delivery from a deliveries row without loading updates."""
+        return Delivery(
+            id=delivery_data['id'],
+            tracking_number=delivery_data['tracking_number'],
+            package_type=delivery_data['package_type'],
+            weight=delivery_data['weight'],
+            dimensions=delivery_data['dimensions'],
+            from_address=delivery_data['from_address'],
+            to_address=delivery_data['to_address'],
+            date=delivery_data['date'],
+            status=delivery_data['status'],
+            user_id=delivery_data['user_id'],
+            image_url=delivery_data['image_url'],
+            latest_update=Delivery._latest_update_from_row(delivery_data),
+            version=delivery_data['version'],
+            db=db
+        )
+
+    @staticmethod
+    def _latest_update_from_row(delivery_data):
+        """Read the denormalized latest update summary from a deliveries row."""
+        if delivery_data['latest_update_status'] is None:
+            return None
+        return {
+            'status': delivery_data['latest_update_status'],
+            'date': delivery_data['latest_update_date'],
+            'time': delivery_data['latest_update_time'],
+            'description': delivery_data['latest_update_description']
+        }
 
     def _generate_tracking_number(self):
         """Generate a unique tracking number."""
@@ -48,8 +127,33 @@ class Delivery:
         random_digits = ''.join(random.choices(string.digits, k=6))
         return f"{prefix}{random_digits}"
     
-    def to_dict(self):
-        """Convert delivery object to dictionary."""
+    def to_dict(self, fields=None):
+        """Convert delivery object to dictionary.
+
+        With fields, only those API fields are included; 'updates' must then be
+        requested explicitly and 'latestUpdate' comes from the summary columns.
+        """
+        if fields is not None:
+            values = {
+                'id': self.id,
+                'trackingNumber': self.tracking_number,
+                'packageType': self.package_type,
+                'weight': self.weight,
+                'dimensions': self.dimensions,
+                'from': self.from_address,
+                'to': self.to_address,
+                'date': self.date,
+                'status': self.status,
+                'userId': self.user_id,
+                'imageUrl': self.image_url,
+                'version': self.version,
+                'latestUpdate': self.latest_update
+            }
+            result = {field: values[field] for field in fields if field in values}
+            if 'updates' in fields:
+                result['updates'] = [update.to_dict() for update in self.updates]
+            return result
+
         return {
             'id': self.id,
             'trackingNumber': self.tracking_number,
@@ -65,54 +169,116 @@ class Delivery:
             'updates': [update.to_dict() for update in self.updates]
         }
     
-    def save(self):
-        """Save delivery to database."""
+    def _write(self, operation):
+        """Run operation(cursor) in a write transaction and return its result.
+
+        When group commit is enabled the operation is handed to this database's
+        writer thread and shares a commit with other concurrent writes; either
+        way it has been committed by the time this returns. Operations update
+        this object as they go, so if the write fails, including at COMMIT,
+        those changes are undone before the error is raised.
+        """
+        def guarded(cursor):
+            # Checked under the write lock, so a concurrent shard move either waits for this write or refuses it
+            ShardRouter.check_writable(self.user_id, self.db)
+            return operation(cursor)
+        
+        state = dict(vars(self))
+        try:
+            return self._commit(guarded)
+        except BaseException:
+            vars(self).update(state)
+            raise
+    
+    def _commit(self, operation):
+        if GroupCommitWriter.enabled:
+            return GroupCommitWriter.for_path(self.db.db_path, self.db.foreign_keys).execute(operation)
+        
         conn = self.db.get_connection()
         cursor = conn.cursor()
-
-        # Check if the deliveries table has the image_url column
-        cursor.execute("PRAGMA table_info(deliveries)")
-        columns = cursor.fetchall()
-        has_image_url = any(column['name'] == 'image_url' for column in columns)
-
-        # Add image_url column if it doesn't exist
-        if not has_image_url:
-            cursor.execute("ALTER TABLE deliveries ADD COLUMN image_url TEXT")
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            result = operation(cursor)
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return result
+    
+    def save(self):
+        """Save delivery to database."""
+        creating = self.id is None
         
-        if self.id is None:
-            cursor.execute('''
-            INSERT INTO deliveries (tracking_number, package_type, weight, dimensions, from_address, to_address, date, status, user_id, image_url)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (self.tracking_number, self.package_type, self.weight, self.dimensions, self.from_address, self.to_address, self.date, self.status, self.user_id, self.image_url))
-            
-            self.id = cursor.lastrowid
-            
-            # Add initial delivery update
-            current_time = datetime.datetime.now().strftime("%I:%M %p")
-            description = f"Your package has been scheduled for pickup."
-            
-            cursor.execute('''
-            INSERT INTO delivery_updates (delivery_id, status, date, time, description)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (self.id, self.status, self.date, current_time, description))
-        else:
-            cursor.execute('''
-            UPDATE deliveries
-            SET tracking_number = ?, package_type = ?, weight = ?, dimensions = ?, from_address = ?, to_address = ?, date = ?, status = ?, user_id = ?, image_url = ?
-            WHERE id = ?
-            ''', (self.tracking_number, self.package_type, self.weight, self.dimensions, self.from_address, self.to_address, self.date, self.status, self.user_id, self.image_url, self.id))
+        # With sharding, the global id and tracking number are claimed in the directory first
+        reserved = creating and ShardRouter.is_sharded()
+        if reserved:
+            self.id = ShardRouter.reserve_delivery(self.tracking_number, ShardRouter.shard_for_user(self.user_id))
+        
+        addresses = {}
+        generation = None
+
+        def write(cursor):
+            nonlocal generation
+            # Read in the write transaction, so a restore cannot slip in between it and the inserts
+            generation = AddressBook.generation(cursor)
+            for address in (self.from_address, self.to_address):
+                addresses[address] = AddressBook.intern(cursor, self.db.db_path, generation, address)
+
+            if creating:
+                # Initial delivery update, also stored as the latest update summary
+                current_time = datetime.datetime.now().strftime("%I:%M %p")
+                description = f"Your package has been scheduled for pickup."
+                self.latest_update = {'status': self.status, 'date': self.date, 'time': current_time, 'description': description}
+                
+                cursor.execute('''
+                INSERT INTO deliveries (id, tracking_number, package_type, weight, dimensions, from_address_id, to_address_id, date, status, user_id, image_url,
+                                        latest_update_status, latest_update_date, latest_update_time, latest_update_description)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (self.id, self.tracking_number, self.package_type, self.weight, self.dimensions, addresses[self.from_address], addresses[self.to_address], self.date, self.status, self.user_id, self.image_url,
+                      self.status, self.date, current_time, description))
+                
+                self.id = cursor.lastrowid
+                
+                cursor.execute('''
+                INSERT INTO delivery_updates (delivery_id, status, date, time, description)
+                VALUES (?, ?, ?, ?, ?)
+                ''', (self.id, self.status, self.date, current_time, description))
+                
+                ChangeLog.record(cursor, self, ChangeLog.CREATE)
+                DailyRollup.increment(cursor, self.user_id, 'created')
+            else:
+                cursor.execute('''
+                UPDATE deliveries
+                SET tracking_number = ?, package_type = ?, weight = ?, dimensions = ?, from_address_id = ?, to_address_id = ?, date = ?, status = ?, user_id = ?, image_url = ?,
+                    version = version + 1
+                WHERE id = ?
+                ''', (self.tracking_number, self.package_type, self.weight, self.dimensions, addresses[self.from_address], addresses[self.to_address], self.date, self.status, self.user_id, self.image_url, self.id))
+                
+                self.version += 1
+                ChangeLog.record(cursor, self, ChangeLog.UPDATE)
         
-        conn.commit()
+        try:
+            self._write(write)
+        except Exception:
+            if reserved:
+                ShardRouter.release_delivery(self.id)
+                self.id = None
+            raise
+
+        # The address ids are committed now, so later inserts can skip looking them up
+        AddressBook.remember(self.db.db_path, generation, addresses)
         return self
     
-    def update_status(self, new_status, description=None):
-        """Update delivery status and add a status update entry."""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        # Update delivery status
-        cursor.execute('UPDATE deliveries SET status = ? WHERE id = ?', (new_status, self.id))
+    def update_status(self, new_status, description=None, expected_version=None):
+        """Update delivery status and add a status update entry.
+
+        The update is a compare-and-set against expected_version (by default the
+        version this object was loaded with) and the status_transitions table,
+        in a single statement. Raises VersionConflict or InvalidStatusTransition
+        when it does not apply.
+        """
+        if expected_version is None:
+            expected_version = self.version
         
         # Create status update record
         current_date = datetime.datetime.now().strftime("%B %d, %Y")
@@ -121,13 +287,56 @@ class Delivery:
         if description is None:
             description = f"Your package status has been updated to {new_status}."
         
-        cursor.execute('''
-        INSERT INTO delivery_updates (delivery_id, status, date, time, description)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (self.id, new_status, current_date, current_time, description))
+        def write(cursor):
+            # The loaded status is what the compare-and-set replaces unless the caller expects a different version
+            previous_status = self.status
+            if expected_version != self.version:
+                cursor.execute('SELECT status FROM deliveries WHERE id = ?', (self.id,))
+                row = cursor.fetchone()
+                previous_status = row['status'] if row else None
+            
+            # Update delivery status and its latest update summary if nobody else got there first
+            cursor.execute('''
+            UPDATE deliveries
+            SET status = ?, latest_update_status = ?, latest_update_date = ?, latest_update_time = ?, latest_update_description = ?,
+                version = version + 1
+            WHERE id = ? AND version = ?
+            AND EXISTS (
+                SELECT 1 FROM status_transitions
+                WHERE from_status = deliveries.status AND to_status = ?
+            )
+            ''', (new_status, new_status, current_date, current_time, description, self.id, expected_version, new_status))
+            
+            if cursor.rowcount == 0:
+                cursor.execute('SELECT status, version FROM deliveries WHERE id = ?', (self.id,))
+                current = cursor.fetchone()
+                if current['version'] != expected_version:
+                    raise VersionConflict(expected_version, current['version'])
+                raise InvalidStatusTransition(current['status'], new_status)
+            
+            cursor.execute('''
+            INSERT INTO delivery_updates (delivery_id, status, date, time, description)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (self.id, new_status, current_date, current_time, description))
+            
+            # Fold the finished delivery into the precomputed analytics
+            if new_status == 'Delivered':
+                Analytics.record_delivered(cursor, self.id)
+            
+            # Count the status change in the daily rollups; repeated scans are not new events
+            if new_status != previous_status and new_status in STATUS_EVENTS:
+                DailyRollup.increment(cursor, self.user_id, STATUS_EVENTS[new_status])
+            
+            self.status = new_status
+            self.version = expected_version + 1
+            self.latest_update = {'status': new_status, 'date': current_date, 'time': current_time, 'description': description}
+            ChangeLog.record(cursor, self, ChangeLog.STATUS)
+            
+            # Queue webhook events in the same transaction so none are lost or sent for rolled back changes
+            if new_status != previous_status:
+                WebhookOutbox.enqueue(cursor, self, previous_status, description)
         
-        self.status = new_status
-        conn.commit()
+        self._write(write)
         
         # Refresh the updates list
         self.load_updates()
@@ -136,15 +345,15 @@ class Delivery:
     
     def update_image(self, image_url):
         """Update the package image URL."""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        # Update image URL
-        cursor.execute('UPDATE deliveries SET image_url = ? WHERE id = ?', (image_url, self.id))
-        
-        self.image_url = image_url
-        conn.commit()
+        def write(cursor):
+            # Update image URL
+            cursor.execute('UPDATE deliveries SET image_url = ?, version = version + 1 WHERE id = ?', (image_url, self.id))
+            
+            self.image_url = image_url
+            self.version += 1
+            ChangeLog.record(cursor, self, ChangeLog.IMAGE)
         
+        self._write(write)
         return self
     
     def load_updates(self):
@@ -155,157 +364,168 @@ class Delivery:
         cursor.execute('''
         SELECT * FROM delivery_updates
         WHERE delivery_id = ?
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         ''', (self.id,))
         
         updates_data = cursor.fetchall()
         self.updates = []
         
         for update_data in updates_data:
-            update = DeliveryUpdate(
-                id=update_data['id'],
-                delivery_id=update_data['delivery_id'],
-                status=update_data['status'],
-                date=update_data['date'],
-                time=update_data['time'],
-                description=update_data['description']
-            )
-            self.updates.append(update)
+            self.updates.append(DeliveryUpdate._from_row(update_data))
         
         return self.updates
     
     @staticmethod
-    def find_by_id(delivery_id):
+    def find_by_id(delivery_id, with_updates=True):
         """Find delivery by ID."""
-        db = Database()
+        db = ShardRouter.database_for_delivery(delivery_id)
+        if db is None:
+            return None
         conn = db.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM deliveries WHERE id = ?', (delivery_id,))
+        cursor.execute(f'SELECT * FROM {DELIVERIES_VIEW} WHERE id = ?', (delivery_id,))
         delivery_data = cursor.fetchone()
         
         if delivery_data:
-            delivery = Delivery(
-                id=delivery_data['id'],
-                tracking_number=delivery_data['tracking_number'],
-                package_type=delivery_data['package_type'],
-                weight=delivery_data['weight'],
-                dimensions=delivery_data['dimensions'],
-                from_address=delivery_data['from_address'],
-                to_address=delivery_data['to_address'],
-                date=delivery_data['date'],
-                status=delivery_data['status'],
-                user_id=delivery_data['user_id'],
-                image_url=delivery_data['image_url']
-            )
-            delivery.load_updates()
+            delivery = Delivery._from_row(delivery_data, db)
+            if with_updates:
+                delivery.load_updates()
             return delivery
         return None
     
     @staticmethod
-    def find_by_tracking_number(tracking_number):
+    def find_by_tracking_number(tracking_number, with_updates=True):
         """Find delivery by tracking number."""
-        db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM deliveries WHERE tracking_number = ?', (tracking_number,))
-        delivery_data = cursor.fetchone()
-        
-        if delivery_data:
-            delivery = Delivery(
-                id=delivery_data['id'],
-                tracking_number=delivery_data['tracking_number'],
-                package_type=delivery_data['package_type'],
-                weight=delivery_data['weight'],
-                dimensions=delivery_data['dimensions'],
-                from_address=delivery_data['from_address'],
-                to_address=delivery_data['to_address'],
-                date=delivery_data['date'],
-                status=delivery_data['status'],
-                user_id=delivery_data['user_id'],
-                image_url=delivery_data['image_url']
-            )
-            delivery.load_updates()
-            return delivery
+        # The tracking number index says which shard to look in
+        for db, _ in ShardRouter.databases_for_tracking_numbers([tracking_number]):
+            conn = db.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute(f'SELECT * FROM {DELIVERIES_VIEW} WHERE tracking_number = ?', (tracking_number,))
+            delivery_data = cursor.fetchone()
+            
+            if delivery_data:
+                delivery = Delivery._from_row(delivery_data, db)
+                if with_updates:
+                    delivery.load_updates()
+                return delivery
         return None
     
     @staticmethod
-    def find_by_user_id(user_id):
-        """Find all deliveries for a user."""
-        db = Database()
+    def find_by_tracking_numbers(tracking_numbers, with_updates=True):
+        """Find deliveries for several tracking numbers at once.
+
+        Returns a dict keyed by tracking number; numbers that do not exist are
+        simply absent. Updates for all matches are loaded with one query per
+        shard holding any of them.
+        """
+        tracking_numbers = list(dict.fromkeys(tracking_numbers))
+        if not tracking_numbers:
+            return {}
+
+        found = {}
+        for db, numbers in ShardRouter.databases_for_tracking_numbers(tracking_numbers):
+            conn = db.get_connection()
+            cursor = conn.cursor()
+
+            placeholders = ', '.join('?' for _ in numbers)
+            cursor.execute(f'SELECT * FROM {DELIVERIES_VIEW} WHERE tracking_number IN ({placeholders})', numbers)
+
+            deliveries = [Delivery._from_row(delivery_data, db) for delivery_data in cursor.fetchall()]
+            if with_updates:
+                Delivery.load_updates_for(deliveries, conn=conn)
+            found.update((delivery.tracking_number, delivery) for delivery in deliveries)
+
+        return found
+
+    @staticmethod
+    def load_updates_for(deliveries, conn=None):
+        """Load updates for many deliveries, all from the same database, with a single query."""
+        if not deliveries:
+            return deliveries
+
+        if conn is None:
+            conn = deliveries[0].db.get_connection()
+        cursor = conn.cursor()
+
+        by_id = {delivery.id: delivery for delivery in deliveries}
+        for delivery in deliveries:
+            delivery.updates = []
+
+        # Chunk the IN list to stay well under SQLite's bound parameter limit
+        ids = list(by_id)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            cursor.execute(f'''
+            SELECT * FROM delivery_updates
+            WHERE delivery_id IN ({placeholders})
+            ORDER BY created_at DESC, id DESC
+            ''', chunk)
+
+            for update_data in cursor.fetchall():
+                by_id[update_data['delivery_id']].updates.append(DeliveryUpdate._from_row(update_data))
+
+        return deliveries
+
+    @staticmethod
+    def find_by_user_id(user_id, with_updates=True):
+        """Find all deliveries for a user.
+
+        Without updates only the deliveries table is read; the latest update
+        summary is still available on each delivery.
+        """
+        db = ShardRouter.database_for_user(user_id)
         conn = db.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM deliveries WHERE user_id = ? ORDER BY date DESC', (user_id,))
+        cursor.execute(f'SELECT * FROM {DELIVERIES_VIEW} WHERE user_id = ? ORDER BY date DESC, id DESC', (user_id,))
         deliveries_data = cursor.fetchall()
         
-        deliveries = []
-        for delivery_data in deliveries_data:
-            delivery = Delivery(
-                id=delivery_data['id'],
-                tracking_number=delivery_data['tracking_number'],
-                package_type=delivery_data['package_type'],
-                weight=delivery_data['weight'],
-                dimensions=delivery_data['dimensions'],
-                from_address=delivery_data['from_address'],
-                to_address=delivery_data['to_address'],
-                date=delivery_data['date'],
-                status=delivery_data['status'],
-                user_id=delivery_data['user_id'],
-                image_url=delivery_data['image_url']
-            )
-            delivery.load_updates()
-            deliveries.append(delivery)
+        deliveries = [Delivery._from_row(delivery_data, db) for delivery_data in deliveries_data]
+        if with_updates:
+            Delivery.load_updates_for(deliveries, conn=conn)
         
         return deliveries
     
     @staticmethod
-    def get_statistics(user_id=None):
-        """Get delivery statistics, optionally filtered by user_id."""
-        db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        query_params = []
-        user_filter = ""
-        if user_id:
-            user_filter = "WHERE user_id = ?"
-            query_params.append(user_id)
-        
-        # Get total deliveries
-        cursor.execute(f'SELECT COUNT(*) as count FROM deliveries {user_filter}', query_params)
-        result = cursor.fetchone()
-        total_deliveries = result['count'] if result else 0
-        
-        # Get pending deliveries
-        if user_id:
-            cursor.execute('SELECT COUNT(*) as count FROM deliveries WHERE user_id = ? AND status = "Pending"', (user_id,))
+    def get_statistics(user_id=None, conn=None):
+        """Get delivery statistics, optionally filtered by user_id.
+
+        With conn, a connection to the user's shard, everything is read
+        through it, e.g. inside the caller's read transaction.
+        """
+        if conn is not None:
+            connections = [conn]
         else:
-            cursor.execute('SELECT COUNT(*) as count FROM deliveries WHERE status = "Pending"')
-        result = cursor.fetchone()
-        pending_deliveries = result['count'] if result else 0
+            databases = [ShardRouter.database_for_user(user_id)] if user_id else ShardRouter.all_databases()
+            connections = [db.get_connection() for db in databases]
         
-        # Get in-transit deliveries
-        if user_id:
-            cursor.execute('SELECT COUNT(*) as count FROM deliveries WHERE user_id = ? AND status = "In-Transit"', (user_id,))
-        else:
-            cursor.execute('SELECT COUNT(*) as count FROM deliveries WHERE status = "In-Transit"')
-        result = cursor.fetchone()
-        in_transit_deliveries = result['count'] if result else 0
+        # Count deliveries per status on every database that may hold them
+        counts = {}
+        for connection in connections:
+            cursor = connection.cursor()
+            
+            if user_id:
+                cursor.execute('SELECT status, COUNT(*) as count FROM deliveries WHERE user_id = ? GROUP BY status', (user_id,))
+            else:
+                cursor.execute('SELECT status, COUNT(*) as count FROM deliveries GROUP BY status')
+            for row in cursor.fetchall():
+                counts[row['status']] = counts.get(row['status'], 0) + row['count']
         
-        # Get delivered deliveries
-        if user_id:
-            cursor.execute('SELECT COUNT(*) as count FROM deliveries WHERE user_id = ? AND status = "Delivered"', (user_id,))
-        else:
-            cursor.execute('SELECT COUNT(*) as count FROM deliveries WHERE status = "Delivered"')
-        result = cursor.fetchone()
-        delivered_deliveries = result['count'] if result else 0
+        total_deliveries = sum(counts.values())
+        pending_deliveries = counts.get('Pending', 0)
+        in_transit_deliveries = counts.get('In-Transit', 0)
+        delivered_deliveries = counts.get('Delivered', 0)
+        
+        # Read delivery performance from the precomputed analytics
+        performance = Analytics.summary(user_id, conn=conn)['all']
+        on_time_delivery_rate = performance['onTimeRate']
+        average_delivery_time = f"{performance['averageTransitHours'] / 24:.1f} days"
         
-        # For demo purposes, we'll generate some fake statistics
-        on_time_delivery_rate = 95 if delivered_deliveries > 0 else 0
-        average_delivery_time = "2.5 days" if delivered_deliveries > 0 else "0 days"
-        customer_satisfaction = 4.8 if delivered_deliveries > 0 else 0
+        # No ratings are collected yet, so there is no satisfaction score to report
+        customer_satisfaction = 0
         
         return {
             'totalDeliveries': total_deliveries,
@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+import zlib
+from . import deadline
+from .sharding import ShardRouter
+from .address import DELIVERIES_VIEW
+
+# CSV columns, one row per delivery update with the delivery's fields repeated
+CSV_COLUMNS = [
+    'delivery_id', 'tracking_number', 'package_type', 'weight', 'dimensions', 'from_address', 'to_address',
+    'date', 'status', 'user_id', 'image_url', 'created_at',
+    'update_id', 'update_status', 'update_date', 'update_time', 'update_description', 'update_created_at'
+]
+
+class DeliveryExport:
+    """Streams deliveries joined with their updates as CSV or NDJSON."""
+
+    # Rows fetched from SQLite per step; memory use is bounded by this, not the account size
+    BATCH_SIZE = 500
+
+    FORMATS = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    @staticmethod
+    def iter_rows(user_id=None, batch_size=BATCH_SIZE):
+        """Yield joined delivery/update rows in delivery order, batch_size rows at a time."""
+        databases = [ShardRouter.database_for_user(user_id)] if user_id is not None else ShardRouter.all_databases()
+        for db in databases:
+            yield from DeliveryExport._iter_database_rows(db, user_id, batch_size)
+
+    @staticmethod
+    def _iter_database_rows(db, user_id, batch_size):
+        # Router databases are fresh objects, so this connection is dedicated to the long-running read
+        conn = db.get_connection()
+        try:
+            cursor = conn.cursor()
+            user_filter = "WHERE d.user_id = ?" if user_id is not None else ""
+            cursor.execute(f'''
+            SELECT d.id AS delivery_id, d.tracking_number, d.package_type, d.weight, d.dimensions,
+                   d.from_address, d.to_address, d.date, d.status, d.user_id, d.image_url, d.created_at,
+                   u.id AS update_id, u.status AS update_status, u.date AS update_date, u.time AS update_time,
+                   u.description AS update_description, u.created_at AS update_created_at
+            FROM {DELIVERIES_VIEW} d
+            LEFT JOIN delivery_updates u ON u.delivery_id = d.id
+            {user_filter}
+            ORDER BY d.id, u.id
+            ''', [] if user_id is None else [user_id])
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+                # Once the caller lifts the deadline the rest of the read must not be interrupted
+                if deadline.current_deadline() is None:
+                    deadline.uninstall(conn)
+        finally:
+            db.close()
+
+    @staticmethod
+    def iter_csv(user_id=None):
+        """Yield CSV text chunks, one per fetched batch."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+
+        for rows in DeliveryExport.iter_rows(user_id):
+            writer.writerows(tuple(row) for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    @staticmethod
+    def iter_ndjson(user_id=None):
+        """Yield NDJSON text chunks with one delivery object per line, updates nested."""
+        current = None
+        lines = []
+
+        for rows in DeliveryExport.iter_rows(user_id):
+            for row in rows:
+                # Rows are ordered by delivery, so a new id means the previous delivery is complete
+                if current is None or current['id'] != row['delivery_id']:
+                    if current is not None:
+                        lines.append(json.dumps(current))
+                    current = {
+                        'id': row['delivery_id'],
+                        'trackingNumber': row['tracking_number'],
+                        'packageType': row['package_type'],
+                        'weight': row['weight'],
+                        'dimensions': row['dimensions'],
+                        'from': row['from_address'],
+                        'to': row['to_address'],
+                        'date': row['date'],
+                        'status': row['status'],
+                        'userId': row['user_id'],
+                        'imageUrl': row['image_url'],
+                        'createdAt': row['created_at'],
+                        'updates': []
+                    }
+                if row['update_id'] is not None:
+                    current['updates'].append({
+                        'id': row['update_id'],
+                        'status': row['update_status'],
+                        'date': row['update_date'],
+                        'time': row['update_time'],
+                        'description': row['update_description'],
+                        'createdAt': row['update_created_at']
+                    })
+
+            if lines:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+
+        if current is not None:
+            yield json.dumps(current) + '\n'
+
+    @staticmethod
+    def stream(user_id=None, fmt='csv', compress=False):
+        """Yield the export as bytes, optionally gzip-compressed on the fly."""
+        chunks = DeliveryExport.iter_csv(user_id) if fmt == 'csv' else DeliveryExport.iter_ndjson(user_id)
+
+        if not compress:
+            for chunk in chunks:
+                yield chunk.encode('utf-8')
+            return
+
+        # wbits=31 produces a gzip container rather than a raw zlib stream
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
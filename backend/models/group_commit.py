@@ -0,0 +1,142 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from . import deadline
+
+class GroupCommitWriter:
+    """Applies write operations from many request threads in shared transactions.
+
+    One writer thread per database file and process drains a queue of
+    operations, runs each inside its own savepoint of a single transaction and
+    commits the whole group at once, so concurrent writers share one fsync.
+    A caller's future resolves only after the group's COMMIT has returned,
+    which keeps the durability guarantee of a per-request commit.
+    """
+
+    # Whether Delivery writes go through the group-commit writer
+    enabled = os.getenv('GROUP_COMMIT', 'true').lower() == 'true'
+
+    # Maximum operations per transaction
+    max_batch = int(os.getenv('GROUP_COMMIT_MAX_BATCH', 64))
+
+    # How long to wait for more operations once the queue runs dry, in seconds
+    max_delay = float(os.getenv('GROUP_COMMIT_MAX_DELAY_MS', 1)) / 1000
+
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, db_path, foreign_keys=True):
+        self.db_path = db_path
+        self.foreign_keys = foreign_keys
+        self.queue = queue.SimpleQueue()
+        self.transactions = 0
+        self.operations = 0
+        self.thread = threading.Thread(target=self._run, name=f'group-commit:{os.path.basename(db_path)}', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def for_path(cls, db_path, foreign_keys=True):
+        """Get this process's writer for a database file, starting it on first use."""
+        # Keyed by pid so forked workers start their own thread instead of using the parent's
+        key = (os.getpid(), db_path)
+        writer = cls._writers.get(key)
+        if writer is None:
+            with cls._writers_lock:
+                writer = cls._writers.get(key)
+                if writer is None:
+                    writer = cls(db_path, foreign_keys)
+                    cls._writers[key] = writer
+        return writer
+
+    @classmethod
+    def process_metrics(cls):
+        """Metrics of every writer started by this process, keyed by database file."""
+        pid = os.getpid()
+        return {os.path.basename(path): writer.metrics() for (writer_pid, path), writer in list(cls._writers.items()) if writer_pid == pid}
+
+    def submit(self, operation):
+        """Queue operation(cursor) and return a future for its result."""
+        future = Future()
+        self.queue.put((operation, future, deadline.current_deadline()))
+        return future
+
+    def execute(self, operation):
+        """Run operation(cursor) in the next group commit and wait for its result."""
+        return self.submit(operation).result()
+
+    def metrics(self):
+        return {
+            'transactions': self.transactions,
+            'operations': self.operations,
+            'queued': self.queue.qsize(),
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        if self.foreign_keys:
+            conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _next_batch(self):
+        """Block for one operation, then gather more until the batch is full or the delay passes."""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = self._next_batch()
+            results = []
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                for operation, future, operation_deadline in batch:
+                    # Skip work whose request has already given up
+                    if deadline.expired(operation_deadline):
+                        results.append((future, None, deadline.DeadlineExceeded("Request deadline exceeded before the write started")))
+                        continue
+                    
+                    # A savepoint per operation lets one failure roll back alone
+                    cursor.execute('SAVEPOINT operation')
+                    try:
+                        results.append((future, operation(cursor), None))
+                        cursor.execute('RELEASE operation')
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO operation')
+                        cursor.execute('RELEASE operation')
+                        results.append((future, None, e))
+                cursor.execute('COMMIT')
+            except Exception as e:
+                # The transaction itself failed, so nothing in the group was committed
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                for operation, future, operation_deadline in batch:
+                    future.set_exception(e)
+                continue
+
+            self.transactions += 1
+            self.operations += len(batch)
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+
+from .sharding import ShardRouter
+from .address import DELIVERIES_VIEW
+
+# Keys are listed in sorted order so the output matches jsonify's sort_keys rendering
+
+# One delivery_updates row as DeliveryUpdate.to_dict() renders it
+UPDATE_JSON = '''json_object(
+    'date', u.date, 'delivery_id', u.delivery_id, 'description', u.description,
+    'id', u.id, 'status', u.status, 'time', u.time
+)'''
+
+# A delivery's updates, newest first, as Delivery.to_dict() nests them
+UPDATES_JSON = f'''(
+    SELECT json_group_array(json(update_json)) FROM (
+        SELECT {UPDATE_JSON} AS update_json FROM delivery_updates u
+        WHERE u.delivery_id = d.id
+        ORDER BY u.created_at DESC, u.id DESC
+    )
+)'''
+
+# The latest update summary, or null before the first update
+LATEST_UPDATE_JSON = '''CASE WHEN d.latest_update_status IS NULL THEN NULL ELSE json_object(
+    'date', d.latest_update_date, 'description', d.latest_update_description,
+    'status', d.latest_update_status, 'time', d.latest_update_time
+) END'''
+
+
+def _delivery_json(with_user_id=True, with_updates=True, with_latest_update=False):
+    """SQL expression rendering deliveries row d in the shape of Delivery.to_dict()."""
+    pairs = [
+        ("'date'", 'd.date'),
+        ("'dimensions'", 'd.dimensions'),
+        ("'from'", 'd.from_address'),
+        ("'id'", 'd.id'),
+        ("'imageUrl'", 'd.image_url'),
+        ("'latestUpdate'", LATEST_UPDATE_JSON) if with_latest_update else None,
+        ("'packageType'", 'd.package_type'),
+        ("'status'", 'd.status'),
+        ("'to'", 'd.to_address'),
+        ("'trackingNumber'", 'd.tracking_number'),
+        ("'updates'", UPDATES_JSON) if with_updates else None,
+        ("'userId'", 'd.user_id') if with_user_id else None,
+        ("'weight'", 'd.weight'),
+    ]
+    return 'json_object(' + ', '.join(f'{key}, {value}' for key, value in filter(None, pairs)) + ')'
+
+
+class DeliveryRenderer:
+    """Renders delivery read responses to JSON inside SQLite.
+
+    The hottest read endpoints return these strings as the response body,
+    skipping row, model and dict construction. Output is the same JSON as
+    the object path's to_dict() and jsonify; it is only used when no
+    ?fields= selection is requested.
+    """
+
+    # Whether read endpoints use SQL rendering; also off when SQLite lacks JSON1
+    enabled = os.getenv('SQL_JSON_RENDERING', 'true').lower() == 'true'
+
+    _available = None
+
+    @classmethod
+    def available(cls):
+        if not cls.enabled:
+            return False
+        if cls._available is None:
+            try:
+                sqlite3.connect(':memory:').execute("SELECT json_group_array(json_object('a', 1))").fetchone()
+                cls._available = True
+            except sqlite3.OperationalError:
+                cls._available = False
+        return cls._available
+
+    @staticmethod
+    def user_deliveries(user_id):
+        """Render {"deliveries": [...]} for a user, as GET /api/deliveries returns it."""
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        row = conn.execute(f'''
+        SELECT json_object('deliveries', json_group_array(json(delivery_json))) FROM (
+            SELECT {_delivery_json()} AS delivery_json FROM {DELIVERIES_VIEW} d
+            WHERE d.user_id = ?
+            ORDER BY d.date DESC, d.id DESC
+        )
+        ''', (user_id,)).fetchone()
+        return row[0]
+
+    @staticmethod
+    def tracked_delivery(tracking_number):
+        """Render {"delivery": {...}} for public tracking, or None if the number is unknown."""
+        for db, _ in ShardRouter.databases_for_tracking_numbers([tracking_number]):
+            row = db.get_connection().execute(f'''
+            SELECT json_object('delivery', json({_delivery_json(with_user_id=False)}))
+            FROM {DELIVERIES_VIEW} d
+            WHERE d.tracking_number = ?
+            ''', (tracking_number,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    @staticmethod
+    def tracked_deliveries(tracking_numbers, latest_only=False):
+        """Render the public tracking objects of several deliveries, keyed by tracking number.
+
+        With latest_only, updates are replaced by the latest update summary.
+        Unknown numbers are absent.
+        """
+        tracking_numbers = list(dict.fromkeys(tracking_numbers))
+        delivery_json = _delivery_json(with_user_id=False, with_updates=not latest_only, with_latest_update=latest_only)
+
+        rendered = {}
+        for db, numbers in ShardRouter.databases_for_tracking_numbers(tracking_numbers):
+            placeholders = ', '.join('?' for _ in numbers)
+            cursor = db.get_connection().execute(f'''
+            SELECT d.tracking_number, {delivery_json}
+            FROM {DELIVERIES_VIEW} d
+            WHERE d.tracking_number IN ({placeholders})
+            ''', numbers)
+            rendered.update((row[0], row[1]) for row in cursor)
+        return rendered
+
+    @staticmethod
+    def tracking_results(tracking_numbers, rendered):
+        """Assemble the batch tracking response body around pre-rendered deliveries, in request order."""
+        results = []
+        for tracking_number in tracking_numbers:
+            number = json.dumps(tracking_number)
+            delivery_json = rendered.get(tracking_number)
+            if delivery_json is None:
+                results.append(f'{{"error":"Delivery not found","found":false,"trackingNumber":{number}}}')
+            else:
+                results.append(f'{{"delivery":{delivery_json},"found":true,"trackingNumber":{number}}}')
+        return '{"results":[' + ','.join(results) + ']}'
@@ -0,0 +1,105 @@
+import datetime
+from .sharding import ShardRouter
+
+# Events counted per user and day, as returned by the API
+EVENTS = ('created', 'inTransit', 'delivered', 'cancelled')
+
+# Rollup event recorded when a delivery enters each status
+STATUS_EVENTS = {
+    'In-Transit': 'inTransit',
+    'Delivered': 'delivered',
+    'Cancelled': 'cancelled',
+}
+
+class DailyRollup:
+    """Per-user daily counts of delivery events, maintained on the write paths.
+
+    Days are UTC dates, matching the created_at timestamps they are derived from.
+    """
+
+    @staticmethod
+    def increment(cursor, user_id, event):
+        """Count one event for today using the caller's cursor."""
+        cursor.execute('''
+        INSERT INTO delivery_daily_rollups (user_id, event, day, count)
+        VALUES (?, ?, date('now'), 1)
+        ON CONFLICT (user_id, event, day) DO UPDATE SET count = count + 1
+        ''', (user_id, event))
+
+    @staticmethod
+    def backfill(user_id=None):
+        """Rebuild rollups from deliveries and delivery_updates history.
+
+        A status counts on the day a delivery first entered it. Returns the
+        number of rollup rows written.
+        """
+        databases = [ShardRouter.database_for_user(user_id)] if user_id is not None else ShardRouter.all_databases()
+        return sum(DailyRollup._backfill(db, user_id) for db in databases)
+
+    @staticmethod
+    def _backfill(db, user_id):
+        """Rebuild the rollups stored in one database."""
+        conn = db.get_connection()
+        cursor = conn.cursor()
+
+        user_filter = "WHERE d.user_id = ?" if user_id is not None else ""
+        params = [] if user_id is None else [user_id]
+        cases = ' '.join(f"WHEN '{status}' THEN '{event}'" for status, event in STATUS_EVENTS.items())
+
+        if user_id is None:
+            cursor.execute('DELETE FROM delivery_daily_rollups')
+        else:
+            cursor.execute('DELETE FROM delivery_daily_rollups WHERE user_id = ?', (user_id,))
+
+        cursor.execute(f'''
+        INSERT INTO delivery_daily_rollups (user_id, event, day, count)
+        SELECT user_id, event, day, COUNT(*) FROM (
+            SELECT d.user_id, 'created' AS event, date(d.created_at) AS day
+            FROM deliveries d
+            {user_filter}
+            UNION ALL
+            SELECT d.user_id, CASE u.status {cases} END AS event, date(MIN(u.created_at)) AS day
+            FROM delivery_updates u
+            JOIN deliveries d ON d.id = u.delivery_id
+            {user_filter}{' AND' if user_id is not None else 'WHERE'} u.status IN ({', '.join('?' for _ in STATUS_EVENTS)})
+            GROUP BY u.delivery_id, u.status
+        )
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, event, day
+        ''', params + params + list(STATUS_EVENTS))
+
+        written = cursor.rowcount
+        conn.commit()
+        return written
+
+    @staticmethod
+    def series(user_id, start, end, granularity='day'):
+        """Get event counts per period between two dates, inclusive.
+
+        Periods without events are included with zero counts. Weekly periods
+        start on Monday and are labelled with that date.
+        """
+        db = ShardRouter.database_for_user(user_id)
+        conn = db.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+        SELECT event, day, count FROM delivery_daily_rollups
+        WHERE user_id = ? AND event IN (?, ?, ?, ?) AND day BETWEEN ? AND ?
+        ''', (user_id, *EVENTS, start.isoformat(), end.isoformat()))
+
+        def period_of(day):
+            return day - datetime.timedelta(days=day.weekday()) if granularity == 'week' else day
+
+        step = datetime.timedelta(days=7 if granularity == 'week' else 1)
+        periods = {}
+        period = period_of(start)
+        while period <= end:
+            periods[period] = dict.fromkeys(EVENTS, 0)
+            period += step
+
+        for row in cursor.fetchall():
+            period = period_of(datetime.date.fromisoformat(row['day']))
+            periods[period][row['event']] += row['count']
+
+        return [{'period': period.isoformat(), **counts} for period, counts in periods.items()]
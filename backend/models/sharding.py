@@ -0,0 +1,342 @@
+import os
+from .db import Database, DATA_DIR
+from .address import AddressBook
+
+# Number of shard files deliveries are partitioned across; 1 keeps everything in the main database
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 1))
+
+# Row ids of delivery_updates and webhook_subscriptions in shard N start at (N + 1) * ID_RANGE, so rows keep their ids when moved
+ID_RANGE = 10 ** 12
+
+# Tables holding per-user delivery data, moved together when a user changes shard
+USER_TABLES = ('deliveries', 'delivery_updates', 'delivery_changes', 'delivery_analytics', 'delivery_daily_rollups',
+               'webhook_subscriptions', 'webhook_outbox', 'webhook_dead_letters')
+
+# Row-keyed user tables as (table, key column, condition on the source rows of :user_id); the
+# per-user counter tables are only changed by delivery writes and are moved whole
+MOVED_ROWS = (
+    ('deliveries', 'id', 'user_id = :user_id'),
+    ('delivery_updates', 'id', 'delivery_id IN (SELECT id FROM source.deliveries WHERE user_id = :user_id)'),
+    ('delivery_changes', 'seq', 'user_id = :user_id'),
+    ('webhook_subscriptions', 'id', 'user_id = :user_id'),
+    ('webhook_outbox', 'id', 'user_id = :user_id'),
+    ('webhook_dead_letters', 'id', 'user_id = :user_id'),
+)
+
+class UserMoving(Exception):
+    """The user's rows are being moved to another shard, so their writes are refused until it finishes."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        super().__init__(f"Deliveries of user {user_id} are being moved, please retry")
+
+class ShardRouter:
+    """Routes delivery data to shard databases by user.
+
+    Users, the user -> shard map and the global delivery index (id and
+    tracking number -> shard) live in the main, directory database. With a
+    single shard the directory is also the only shard and no lookups happen.
+    """
+
+    _prepared_shards = set()
+    _directory_prepared = False
+
+    @staticmethod
+    def is_sharded():
+        return SHARD_COUNT > 1
+
+    @staticmethod
+    def directory():
+        """Get the directory database holding users and the shard maps."""
+        db = Database()
+        if ShardRouter.is_sharded() and not ShardRouter._directory_prepared:
+            ShardRouter._prepare_directory(db)
+            ShardRouter._directory_prepared = True
+        return db
+
+    @staticmethod
+    def _prepare_directory(db):
+        """Start global delivery ids after any deliveries stored in the directory before sharding."""
+        conn = db.get_connection()
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'delivery_index', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'delivery_index')")
+        conn.execute('''
+        UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT IFNULL(MAX(id), 0) FROM deliveries))
+        WHERE name = 'delivery_index'
+        ''')
+        conn.commit()
+
+    @staticmethod
+    def shard_path(shard_id):
+        return os.path.join(DATA_DIR, 'shards', f'shard-{shard_id}.db')
+
+    @staticmethod
+    def database_for_shard(shard_id):
+        """Get the database of a shard."""
+        if not ShardRouter.is_sharded():
+            return Database()
+
+        db = Database(ShardRouter.shard_path(shard_id), foreign_keys=False)
+        if db.db_path not in ShardRouter._prepared_shards:
+            ShardRouter._prepare_shard(db, shard_id)
+            ShardRouter._prepared_shards.add(db.db_path)
+        return db
+
+    @staticmethod
+    def _prepare_shard(db, shard_id):
+        """Give a new shard its own range of delivery update and webhook subscription ids."""
+        conn = db.get_connection()
+        for table in ('delivery_updates', 'webhook_subscriptions'):
+            conn.execute('''
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+            ''', (table, (shard_id + 1) * ID_RANGE, table))
+        conn.commit()
+
+    @staticmethod
+    def prepare():
+        """Create or migrate the directory and every shard database."""
+        for db in [ShardRouter.directory(), *ShardRouter.all_databases()]:
+            db.close()
+
+    @staticmethod
+    def all_databases():
+        """Get every database that may hold deliveries."""
+        if not ShardRouter.is_sharded():
+            return [Database()]
+        return [ShardRouter.database_for_shard(shard_id) for shard_id in range(SHARD_COUNT)]
+
+    @staticmethod
+    def shard_for_user(user_id):
+        """Get a user's shard, assigning the default one on first use."""
+        if not ShardRouter.is_sharded():
+            return 0
+
+        conn = ShardRouter.directory().get_connection()
+        row = conn.execute('SELECT shard_id FROM user_shards WHERE user_id = ?', (user_id,)).fetchone()
+        if row:
+            return row['shard_id']
+
+        conn.execute('INSERT OR IGNORE INTO user_shards (user_id, shard_id) VALUES (?, ?)', (user_id, user_id % SHARD_COUNT))
+        conn.commit()
+        return conn.execute('SELECT shard_id FROM user_shards WHERE user_id = ?', (user_id,)).fetchone()['shard_id']
+
+    @staticmethod
+    def database_for_user(user_id):
+        return ShardRouter.database_for_shard(ShardRouter.shard_for_user(user_id))
+
+    @staticmethod
+    def database_for_delivery(delivery_id):
+        """Get the database holding a delivery, or None if it is not indexed."""
+        if not ShardRouter.is_sharded():
+            return Database()
+
+        conn = ShardRouter.directory().get_connection()
+        row = conn.execute('SELECT shard_id FROM delivery_index WHERE id = ?', (delivery_id,)).fetchone()
+        return ShardRouter.database_for_shard(row['shard_id']) if row else None
+
+    @staticmethod
+    def databases_for_tracking_numbers(tracking_numbers):
+        """Group tracking numbers by the database holding them; unknown numbers are left out."""
+        if not ShardRouter.is_sharded():
+            return [(Database(), list(tracking_numbers))]
+
+        conn = ShardRouter.directory().get_connection()
+        by_shard = {}
+        for start in range(0, len(tracking_numbers), 500):
+            chunk = tracking_numbers[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            for row in conn.execute(f'SELECT tracking_number, shard_id FROM delivery_index WHERE tracking_number IN ({placeholders})', chunk):
+                by_shard.setdefault(row['shard_id'], []).append(row['tracking_number'])
+
+        return [(ShardRouter.database_for_shard(shard_id), numbers) for shard_id, numbers in sorted(by_shard.items())]
+
+    @staticmethod
+    def reserve_delivery(tracking_number, shard_id):
+        """Allocate a global delivery id and index its tracking number before the shard insert."""
+        conn = ShardRouter.directory().get_connection()
+        cursor = conn.execute('INSERT INTO delivery_index (tracking_number, shard_id) VALUES (?, ?)', (tracking_number, shard_id))
+        conn.commit()
+        return cursor.lastrowid
+
+    @staticmethod
+    def release_delivery(delivery_id):
+        """Undo a reservation whose shard insert failed."""
+        conn = ShardRouter.directory().get_connection()
+        conn.execute('DELETE FROM delivery_index WHERE id = ?', (delivery_id,))
+        conn.commit()
+
+    @staticmethod
+    def assign_user(user_id, shard_id):
+        """Point a user at a shard; their existing rows follow on the next rebalance."""
+        conn = ShardRouter.directory().get_connection()
+        conn.execute('''
+        INSERT INTO user_shards (user_id, shard_id) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET shard_id = excluded.shard_id
+        ''', (user_id, shard_id))
+        conn.commit()
+
+    @staticmethod
+    def check_writable(user_id, db):
+        """Raise UserMoving unless the user's rows may be written to db now.
+
+        Call it inside the write transaction once its write lock is held: a
+        move marks the user before waiting for that lock, so it either copies
+        the committed write or the write sees the mark here.
+        """
+        if not ShardRouter.is_sharded() or user_id is None:
+            return
+
+        conn = ShardRouter.directory().get_connection()
+        row = conn.execute('SELECT shard_id, moving FROM user_shards WHERE user_id = ?', (user_id,)).fetchone()
+        # A database other than the assigned shard means the write was routed before a move switched it
+        if row is not None and (row['moving'] or ShardRouter.shard_path(row['shard_id']) != db.db_path):
+            raise UserMoving(user_id)
+
+    @staticmethod
+    def _set_moving(user_id, moving):
+        conn = ShardRouter.directory().get_connection()
+        conn.execute('UPDATE user_shards SET moving = ? WHERE user_id = ?', (int(moving), user_id))
+        conn.commit()
+
+    @staticmethod
+    def misplaced_users(user_id=None):
+        """Find users whose rows are stored outside their assigned shard.
+
+        Returns (user_id, source_database, target_shard) tuples, only for
+        user_id if given. Rows left in the directory database from before
+        sharding are always misplaced.
+        """
+        if not ShardRouter.is_sharded():
+            return []
+
+        sources = [(None, ShardRouter.directory())] + [(shard_id, ShardRouter.database_for_shard(shard_id)) for shard_id in range(SHARD_COUNT)]
+        user_filter = 'user_id IS NOT NULL' if user_id is None else 'user_id = :user_id'
+        misplaced = []
+        for source_shard, db in sources:
+            cursor = db.get_connection().execute(f'''
+            SELECT user_id FROM deliveries WHERE {user_filter}
+            UNION
+            SELECT user_id FROM delivery_daily_rollups WHERE {user_filter}
+            UNION
+            SELECT user_id FROM webhook_subscriptions WHERE {user_filter}
+            ''', {'user_id': user_id})
+            for row in cursor.fetchall():
+                target_shard = ShardRouter.shard_for_user(row['user_id'])
+                if target_shard != source_shard:
+                    misplaced.append((row['user_id'], db, target_shard))
+        return misplaced
+
+    @staticmethod
+    def _copy_rows(conn, user_id, copy_pass):
+        """Copy the user's source rows not copied by an earlier pass, recording their keys in temp.moved_rows."""
+        params = {'user_id': user_id, 'pass': copy_pass}
+        for table, key, condition in MOVED_ROWS:
+            conn.execute(f'''
+            INSERT INTO temp.moved_rows (tbl, id, pass)
+            SELECT '{table}', {key}, :pass FROM source.{table} WHERE {condition}
+            AND {key} NOT IN (SELECT id FROM temp.moved_rows WHERE tbl = '{table}')
+            ''', params)
+
+        def pending(table, key):
+            return f"{key} IN (SELECT id FROM temp.moved_rows WHERE tbl = '{table}' AND pass = :pass)"
+
+        AddressBook.copy_deliveries(conn, pending('deliveries', 'd.id'), params)
+        conn.execute(f'INSERT OR REPLACE INTO delivery_updates SELECT * FROM source.delivery_updates WHERE {pending("delivery_updates", "id")}', params)
+        # Number copied changes after every one the source issued, so a feed cursor from the source sees them again rather than skipping them
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'delivery_changes', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'delivery_changes')")
+        conn.execute('''
+        UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT IFNULL(MAX(seq), 0) FROM source.sqlite_sequence WHERE name = 'delivery_changes'))
+        WHERE name = 'delivery_changes'
+        ''')
+        conn.execute(f'''
+        INSERT INTO delivery_changes (delivery_id, user_id, operation, payload, created_at)
+        SELECT delivery_id, user_id, operation, payload, created_at FROM source.delivery_changes
+        WHERE {pending('delivery_changes', 'seq')} ORDER BY seq
+        ''', params)
+        conn.execute(f'INSERT OR REPLACE INTO webhook_subscriptions SELECT * FROM source.webhook_subscriptions WHERE {pending("webhook_subscriptions", "id")}', params)
+        # Keep attempts and leases, so events a dispatcher is sending are not sent again right away
+        for table, columns in (('webhook_outbox', 'subscription_id, user_id, payload, attempts, next_attempt_at, last_error, created_at'),
+                               ('webhook_dead_letters', 'subscription_id, user_id, payload, attempts, last_error, created_at')):
+            conn.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM source.{table} WHERE {pending(table, "id")}', params)
+
+    @staticmethod
+    def move_user(user_id, source, target_shard):
+        """Move all of a user's delivery data from one database to a shard.
+
+        The user is marked as moving, so their writes fail with UserMoving,
+        and writes already under way are waited for. Rows are then copied and
+        committed on the target, rows that appeared meanwhile are copied too,
+        the directory index is switched, and only then are the copied rows
+        deleted from the source. Change log entries get new sequence numbers
+        on the target, all above any the source issued, so change feed
+        consumers receive the moved entries again instead of skipping them.
+        Returns the number of deliveries moved.
+        """
+        ShardRouter._set_moving(user_id, True)
+        target = ShardRouter.database_for_shard(target_shard)
+        conn = target.get_connection()
+        conn.execute('ATTACH DATABASE ? AS source', (source.db_path,))
+        try:
+            # Taking both write locks waits out writes that checked the mark before it was set
+            conn.execute('BEGIN IMMEDIATE')
+            conn.commit()
+
+            conn.execute('CREATE TEMP TABLE moved_rows (tbl TEXT NOT NULL, id INTEGER NOT NULL, pass INTEGER NOT NULL, PRIMARY KEY (tbl, id))')
+            ShardRouter._copy_rows(conn, user_id, 1)
+            for table in ('delivery_analytics', 'delivery_daily_rollups'):
+                conn.execute(f'INSERT OR REPLACE INTO {table} SELECT * FROM source.{table} WHERE user_id = ?', (user_id,))
+            conn.commit()
+
+            # Pick up rows from writers that do not check the mark, such as the webhook dispatcher, before switching
+            conn.execute('BEGIN IMMEDIATE')
+            ShardRouter._copy_rows(conn, user_id, 2)
+            conn.commit()
+
+            moved = conn.execute('''
+            SELECT id, tracking_number FROM deliveries
+            WHERE id IN (SELECT id FROM temp.moved_rows WHERE tbl = 'deliveries')
+            ''').fetchall()
+
+            # Point the index at the new shard, adding entries for rows stored before sharding
+            directory = ShardRouter.directory().get_connection()
+            directory.executemany('''
+            INSERT INTO delivery_index (id, tracking_number, shard_id) VALUES (?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET shard_id = excluded.shard_id
+            ''', [(row['id'], row['tracking_number'], target_shard) for row in moved])
+            directory.commit()
+
+            # Delete only what was copied; anything written since stays for the next rebalance
+            for table, key, _ in MOVED_ROWS:
+                conn.execute(f'DELETE FROM source.{table} WHERE {key} IN (SELECT id FROM temp.moved_rows WHERE tbl = ?)', (table,))
+            for table in ('delivery_analytics', 'delivery_daily_rollups'):
+                conn.execute(f'DELETE FROM source.{table} WHERE user_id = ?', (user_id,))
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute('DROP TABLE IF EXISTS temp.moved_rows')
+            conn.execute('DETACH DATABASE source')
+            ShardRouter._set_moving(user_id, False)
+
+        return len(moved)
+
+    @staticmethod
+    def rebalance(dry_run=False, user_id=None):
+        """Move every misplaced user, or only user_id, to their assigned shard.
+
+        Returns a list of (user_id, target_shard, deliveries_moved).
+        """
+        moves = []
+        for misplaced_user, source, target_shard in ShardRouter.misplaced_users(user_id):
+            moved = 0 if dry_run else ShardRouter.move_user(misplaced_user, source, target_shard)
+            moves.append((misplaced_user, target_shard, moved))
+        return moves
+
+    @staticmethod
+    def shard_sizes():
+        """Count deliveries and users stored in each shard."""
+        sizes = []
+        for shard_id, db in enumerate(ShardRouter.all_databases()):
+            row = db.get_connection().execute('SELECT COUNT(*) AS deliveries, COUNT(DISTINCT user_id) AS users FROM deliveries').fetchone()
+            sizes.append({'shard': shard_id, 'path': db.db_path, 'deliveries': row['deliveries'], 'users': row['users']})
+        return sizes
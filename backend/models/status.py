@@ -0,0 +1,12 @@
+# Delivery statuses and the transitions allowed between them
+
+VALID_STATUSES = ["Pending", "In-Transit", "Delivered", "Cancelled"]
+
+# Delivered and Cancelled are terminal. Repeating a non-terminal status is allowed
+# so scanners can add progress notes without changing the status.
+STATUS_TRANSITIONS = {
+    "Pending": {"Pending", "In-Transit", "Delivered", "Cancelled"},
+    "In-Transit": {"In-Transit", "Delivered", "Cancelled"},
+    "Delivered": set(),
+    "Cancelled": set(),
+}
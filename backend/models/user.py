@@ -1,6 +1,7 @@
 import sqlite3
 import bcrypt
 from .db import Database
+from . import deadline
 
 class User:
     def __init__(self, id=None, name=None, email=None, password=None, phone=None, address=None, city=None, state=None, zip_code=None, bio=None):
@@ -48,7 +49,8 @@ class User:
         else:
             cursor.execute('''
             UPDATE users
-            SET name = ?, email = ?, phone = ?, address = ?, city = ?, state = ?, zip_code = ?, bio = ?
+            SET name = ?, email = ?, phone = ?, address = ?, city = ?, state = ?, zip_code = ?, bio = ?,
+                version = version + 1
             WHERE id = ?
             ''', (self.name, self.email, self.phone, self.address, self.city, self.state, self.zip_code, self.bio, self.id))
         
@@ -75,8 +77,25 @@ class User:
     @staticmethod
     def verify_password(stored_password, provided_password):
         """Verify a password against a stored hash."""
+        # bcrypt cannot be interrupted, so do not start it for a request that has already timed out
+        deadline.check()
         return bcrypt.checkpw(provided_password.encode('utf-8'), stored_password.encode('utf-8'))
 
+    @staticmethod
+    def _from_row(user_data):
+        return User(
+            id=user_data['id'],
+            name=user_data['name'],
+            email=user_data['email'],
+            password=user_data['password'],
+            phone=user_data['phone'],
+            address=user_data['address'],
+            city=user_data['city'],
+            state=user_data['state'],
+            zip_code=user_data['zip_code'],
+            bio=user_data['bio']
+        )
+
     @staticmethod
     def find_by_email(email):
         """Find a user by email."""
@@ -87,21 +106,7 @@ class User:
         cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
         user_data = cursor.fetchone()
         
-        if user_data:
-            user = User(
-                id=user_data['id'],
-                name=user_data['name'],
-                email=user_data['email'],
-                password=user_data['password'],
-                phone=user_data['phone'],
-                address=user_data['address'],
-                city=user_data['city'],
-                state=user_data['state'],
-                zip_code=user_data['zip_code'],
-                bio=user_data['bio']
-            )
-            return user
-        return None
+        return User._from_row(user_data) if user_data else None
 
     @staticmethod
     def find_by_id(user_id):
@@ -113,18 +118,4 @@ class User:
         cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
         user_data = cursor.fetchone()
         
-        if user_data:
-            user = User(
-                id=user_data['id'],
-                name=user_data['name'],
-                email=user_data['email'],
-                password=user_data['password'],
-                phone=user_data['phone'],
-                address=user_data['address'],
-                city=user_data['city'],
-                state=user_data['state'],
-                zip_code=user_data['zip_code'],
-                bio=user_data['bio']
-            )
-            return user
-        return None 
\ No newline at end of file
+        return User._from_row(user_data) if user_data else None 
\ No newline at end of file
@@ -0,0 +1,280 @@
+import json
+import os
+import random
+import secrets
+import time
+
+from .sharding import ShardRouter
+
+# Event sent when a delivery's status changes
+STATUS_CHANGED = 'delivery.status_changed'
+
+# Delivery attempts before an event is moved to the dead-letter table
+MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+
+# Retry delay is BACKOFF_BASE * 2 ** (attempts - 1) seconds, capped at BACKOFF_MAX, with jitter
+BACKOFF_BASE = float(os.getenv('WEBHOOK_BACKOFF_SECONDS', 2))
+BACKOFF_MAX = float(os.getenv('WEBHOOK_BACKOFF_MAX_SECONDS', 3600))
+
+# Seconds a claimed event is hidden from other dispatchers; renewed before a send it might not outlast
+LEASE_SECONDS = float(os.getenv('WEBHOOK_LEASE_SECONDS', 60))
+
+class WebhookSubscription:
+    """A user's endpoint that receives delivery events."""
+
+    def __init__(self, id=None, user_id=None, url=None, secret=None, active=True, created_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.url = url
+        self.secret = secret
+        self.active = active
+        self.created_at = created_at
+
+    @staticmethod
+    def _from_row(row):
+        return WebhookSubscription(
+            id=row['id'],
+            user_id=row['user_id'],
+            url=row['url'],
+            secret=row['secret'],
+            active=bool(row['active']),
+            created_at=row['created_at']
+        )
+
+    def save(self):
+        """Create the subscription in its user's shard, generating a signing secret if none was given."""
+        if self.secret is None:
+            self.secret = secrets.token_hex(32)
+
+        db = ShardRouter.database_for_user(self.user_id)
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            ShardRouter.check_writable(self.user_id, db)
+            cursor.execute('''
+            INSERT INTO webhook_subscriptions (user_id, url, secret, active)
+            VALUES (?, ?, ?, ?)
+            ''', (self.user_id, self.url, self.secret, int(self.active)))
+        except Exception:
+            conn.rollback()
+            raise
+        self.id = cursor.lastrowid
+        conn.commit()
+        return self
+
+    def delete(self):
+        """Delete the subscription and its undelivered events."""
+        db = ShardRouter.database_for_user(self.user_id)
+        conn = db.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            ShardRouter.check_writable(self.user_id, db)
+            conn.execute('DELETE FROM webhook_outbox WHERE subscription_id = ?', (self.id,))
+            conn.execute('DELETE FROM webhook_subscriptions WHERE id = ?', (self.id,))
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    @staticmethod
+    def find_by_id(user_id, subscription_id):
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        row = conn.execute('SELECT * FROM webhook_subscriptions WHERE id = ? AND user_id = ?', (subscription_id, user_id)).fetchone()
+        return WebhookSubscription._from_row(row) if row else None
+
+    @staticmethod
+    def find_by_user_id(user_id):
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        rows = conn.execute('SELECT * FROM webhook_subscriptions WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+        return [WebhookSubscription._from_row(row) for row in rows]
+
+    def to_dict(self, include_secret=False):
+        data = {
+            'id': self.id,
+            'url': self.url,
+            'active': self.active,
+            'createdAt': self.created_at
+        }
+        # The secret is only shown when the subscription is created
+        if include_secret:
+            data['secret'] = self.secret
+        return data
+
+
+class WebhookOutbox:
+    """Transactional outbox of webhook events, drained by the dispatcher."""
+
+    @staticmethod
+    def enqueue(cursor, delivery, previous_status, description):
+        """Queue a status change event for each of the owner's active subscriptions.
+
+        Uses the caller's cursor so the event commits or rolls back with the
+        status change itself. Returns the number of queued events.
+        """
+        payload = json.dumps({
+            'id': f'{delivery.id}:{delivery.version}',
+            'type': STATUS_CHANGED,
+            'deliveryId': delivery.id,
+            'trackingNumber': delivery.tracking_number,
+            'previousStatus': previous_status,
+            'status': delivery.status,
+            'description': description,
+            'version': delivery.version,
+            'occurredAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        })
+        cursor.execute('''
+        INSERT INTO webhook_outbox (subscription_id, user_id, payload)
+        SELECT id, user_id, ? FROM webhook_subscriptions
+        WHERE user_id = ? AND active = 1
+        ''', (payload, delivery.user_id))
+        return cursor.rowcount
+
+    @staticmethod
+    def claim(db, limit, exclude=(), subscription_ids=None):
+        """Lease up to limit due events from a database, oldest first, skipping the ids in exclude.
+
+        Only events of subscription_ids are claimed when it is given.
+
+        Returns dicts with the event id, payload, attempts, lease and the
+        subscription's url and secret.
+        """
+        now = time.time()
+        lease = now + LEASE_SECONDS
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        params = [now, json.dumps(list(exclude))]
+        subscription_filter = ''
+        if subscription_ids is not None:
+            subscription_filter = 'AND o.subscription_id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(list(subscription_ids)))
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute(f'''
+            SELECT o.id, o.subscription_id, o.payload, o.attempts, s.url, s.secret
+            FROM webhook_outbox o
+            JOIN webhook_subscriptions s ON s.id = o.subscription_id
+            WHERE o.next_attempt_at <= ? AND s.active = 1
+            AND o.id NOT IN (SELECT value FROM json_each(?))
+            {subscription_filter}
+            ORDER BY o.id
+            LIMIT ?
+            ''', (*params, limit))
+            events = [dict(row, lease=lease) for row in cursor.fetchall()]
+
+            # Hide claimed events from other dispatchers until the lease runs out
+            cursor.executemany('UPDATE webhook_outbox SET next_attempt_at = ? WHERE id = ?',
+                               [(lease, event['id']) for event in events])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return events
+
+    @staticmethod
+    def renew(db, events):
+        """Extend the leases of claimed events about to be sent. Returns the events still held.
+
+        An event whose lease ran out may have been claimed again by another
+        dispatcher, which then owns it; the lease value itself tells them apart.
+        """
+        lease = time.time() + LEASE_SECONDS
+        conn = db.get_connection()
+        by_lease = {}
+        for event in events:
+            by_lease.setdefault(event['lease'], []).append(event['id'])
+
+        renewed = set()
+        for previous, event_ids in by_lease.items():
+            cursor = conn.execute('''
+            UPDATE webhook_outbox SET next_attempt_at = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND next_attempt_at = ?
+            RETURNING id
+            ''', (lease, json.dumps(event_ids), previous))
+            renewed.update(row[0] for row in cursor.fetchall())
+        conn.commit()
+
+        held = [event for event in events if event['id'] in renewed]
+        for event in held:
+            event['lease'] = lease
+        return held
+
+    @staticmethod
+    def complete(db, event_ids):
+        """Remove delivered events."""
+        conn = db.get_connection()
+        conn.executemany('DELETE FROM webhook_outbox WHERE id = ?', [(event_id,) for event_id in event_ids])
+        conn.commit()
+
+    @staticmethod
+    def backoff(attempts):
+        """Seconds to wait before the next attempt, with full jitter on the upper half."""
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def fail(db, events, error):
+        """Schedule failed events for retry, or dead-letter them once out of attempts.
+
+        Attempts are counted on the stored rows, not the claimed copies.
+        Returns the number of dead-lettered events.
+        """
+        now = time.time()
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        event_ids = json.dumps([event['id'] for event in events])
+        cursor.execute('''
+        UPDATE webhook_outbox SET attempts = attempts + 1, last_error = ?
+        WHERE id IN (SELECT value FROM json_each(?))
+        RETURNING id, attempts
+        ''', (error, event_ids))
+        rows = cursor.fetchall()
+
+        dead = [(row['id'],) for row in rows if row['attempts'] >= MAX_ATTEMPTS]
+        retries = [(now + WebhookOutbox.backoff(row['attempts']), row['id']) for row in rows if row['attempts'] < MAX_ATTEMPTS]
+        cursor.executemany('UPDATE webhook_outbox SET next_attempt_at = ? WHERE id = ?', retries)
+        cursor.executemany('''
+        INSERT INTO webhook_dead_letters (subscription_id, user_id, payload, attempts, last_error)
+        SELECT subscription_id, user_id, payload, attempts, last_error FROM webhook_outbox WHERE id = ?
+        ''', dead)
+        cursor.executemany('DELETE FROM webhook_outbox WHERE id = ?', dead)
+        conn.commit()
+        return len(dead)
+
+    @staticmethod
+    def dead_letters(user_id, limit=100):
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        rows = conn.execute('''
+        SELECT id, subscription_id, payload, attempts, last_error, created_at FROM webhook_dead_letters
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+        ''', (user_id, limit)).fetchall()
+        return [{
+            'id': row['id'],
+            'subscriptionId': row['subscription_id'],
+            'event': json.loads(row['payload']),
+            'attempts': row['attempts'],
+            'lastError': row['last_error'],
+            'createdAt': row['created_at']
+        } for row in rows]
+
+    @staticmethod
+    def redrive(user_id, dead_letter_id):
+        """Put a dead-lettered event back in the outbox. Returns whether it existed."""
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO webhook_outbox (subscription_id, user_id, payload)
+        SELECT subscription_id, user_id, payload FROM webhook_dead_letters
+        WHERE id = ? AND user_id = ?
+        ''', (dead_letter_id, user_id))
+        if cursor.rowcount == 0:
+            return False
+        cursor.execute('DELETE FROM webhook_dead_letters WHERE id = ?', (dead_letter_id,))
+        conn.commit()
+        return True
+
+    @staticmethod
+    def pending(db):
+        return db.get_connection().execute('SELECT COUNT(*) FROM webhook_outbox').fetchone()[0]
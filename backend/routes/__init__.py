@@ -1,4 +1,7 @@
 from .auth_routes import auth_bp
 from .delivery_routes import delivery_bp
+from .change_routes import change_bp
+from .webhook_routes import webhook_bp
+from .dashboard_routes import dashboard_bp
 
-__all__ = ['auth_bp', 'delivery_bp'] 
\ No newline at end of file
+__all__ = ['auth_bp', 'delivery_bp', 'change_bp', 'webhook_bp', 'dashboard_bp'] 
\ No newline at end of file
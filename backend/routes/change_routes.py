@@ -0,0 +1,7 @@
+from flask import Blueprint
+from backend.controllers.change_controller import ChangeController
+
+change_bp = Blueprint('changes', __name__, url_prefix='/api/changes')
+
+# Register routes
+change_bp.route('', methods=['GET'])(ChangeController.get_changes)
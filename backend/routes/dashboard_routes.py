@@ -0,0 +1,7 @@
+from flask import Blueprint
+from backend.controllers.dashboard_controller import DashboardController
+
+dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
+
+# Register routes
+dashboard_bp.route('', methods=['GET'])(DashboardController.get_dashboard)
@@ -0,0 +1,11 @@
+from flask import Blueprint
+from backend.controllers.webhook_controller import WebhookController
+
+webhook_bp = Blueprint('webhooks', __name__, url_prefix='/api/webhooks')
+
+# Register routes
+webhook_bp.route('', methods=['POST'])(WebhookController.create_subscription)
+webhook_bp.route('', methods=['GET'])(WebhookController.get_subscriptions)
+webhook_bp.route('/<int:subscription_id>', methods=['DELETE'])(WebhookController.delete_subscription)
+webhook_bp.route('/dead-letters', methods=['GET'])(WebhookController.get_dead_letters)
+webhook_bp.route('/dead-letters/<int:dead_letter_id>/retry', methods=['POST'])(WebhookController.retry_dead_letter)
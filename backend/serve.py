@@ -0,0 +1,469 @@
+"""Production server: a preforking master with multi-threaded workers.
+
+The master binds the listening socket and forks the workers. Each worker
+creates the Flask app after the fork, so it opens its own connections and
+starts its own group-commit writers, and serves the shared socket from a
+bounded thread pool. Run it with:
+
+    python -m backend.serve --port 5000 --workers 4 --threads 8
+
+Signals sent to the master:
+
+    SIGHUP           start a new set of workers and, once all of them are
+                     ready, gracefully stop the old ones
+    SIGTERM, SIGINT  stop accepting, let in-flight requests finish, then exit
+
+The master never imports the application. Every database schema is created
+or migrated by a short-lived child process, at startup and again before each
+reload, so a reload picks up any code change, schema changes included. If
+that setup or any new worker fails, the reload is abandoned and the running
+workers keep serving.
+
+A worker is replaced after --max-requests requests (plus up to
+--max-requests-jitter more, so workers do not recycle together), which bounds
+memory growth. A replacement that fails to boot is retried after a delay.
+"""
+import argparse
+import os
+import random
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Seconds a worker waits between checks of its stop flag while idle
+POLL_INTERVAL = 0.5
+
+# Exit status of a worker that could not create the app
+BOOT_ERROR = 3
+
+# Seconds before a worker slot whose replacement failed to boot is tried again
+RESPAWN_DELAY = 5
+
+
+def _log(message):
+    print(f'[serve {os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+
+def prepare_databases():
+    """Create or migrate the directory and every shard in a child process. Returns whether it succeeded.
+
+    Running it in a child keeps backend.models out of the master, so the
+    next workers import the code as it is on disk. Each worker's create_app
+    checks the schemas again, which finds nothing left to do.
+    """
+    pid = os.fork()
+    if pid == 0:
+        # Stopping the server interrupts the setup, whose migrations are transactional; reloads wait for it
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        code = 1
+        try:
+            from backend.models.sharding import ShardRouter
+            ShardRouter.prepare()
+            code = 0
+        except BaseException as error:
+            _log(f'Database setup failed: {error!r}')
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+
+class _RequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # The accept loop claimed the first request of the connection before accepting it
+        self.claimed = True
+
+    def handle_one_request(self):
+        # Claim each later request before reading it, so a worker at its limit reads no more
+        if not self.claimed and not self.server.claim_request():
+            self.close_connection = True
+            return
+        self.claimed = False
+        self.raw_requestline = b''
+        try:
+            super().handle_one_request()
+        finally:
+            # The connection closed or idled out without sending a request
+            if not self.raw_requestline:
+                self.server.release_request()
+        # A stopping worker finishes the current request, then closes keep-alive connections
+        if self.server.stopping:
+            self.close_connection = True
+
+    def log_request(self, *args, **kwargs):
+        if self.server.access_log:
+            super().log_request(*args, **kwargs)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server running connections on a fixed-size thread pool.
+
+    Accepting stops while every thread is busy, leaving new connections in
+    the shared listen backlog for idle workers to pick up. Requests are
+    counted before they are read, so a worker serves at most max_requests.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, host, app, fd, threads, keepalive, max_requests=0, access_log=True):
+        _RequestHandler.timeout = keepalive
+        super().__init__(host, 0, app, handler=_RequestHandler, fd=fd)
+        # Every worker waits on the same socket; only one wins each connection, the rest get EAGAIN
+        self.socket.setblocking(False)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='serve')
+        self.slots = threading.BoundedSemaphore(threads)
+        self.max_requests = max_requests
+        self.access_log = access_log
+        self.stopping = False
+        self.requests = 0
+        self.active = 0
+        self.accepted = False
+        self.lock = threading.Lock()
+
+    def claim_request(self):
+        """Count one more request unless max_requests are already counted. Returns whether it was counted."""
+        with self.lock:
+            if self.max_requests and self.requests >= self.max_requests:
+                return False
+            self.requests += 1
+            return True
+
+    def release_request(self):
+        """Uncount a claimed request that never arrived."""
+        with self.lock:
+            self.requests -= 1
+
+    def process_request(self, request, client_address):
+        self.accepted = True
+        self.slots.acquire()
+        with self.lock:
+            self.active += 1
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.active -= 1
+            self.slots.release()
+
+    def serve(self, parent_pid):
+        """Serve until stopped, recycled or orphaned, then wait for in-flight requests."""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            while not self.stopping:
+                if os.getppid() != parent_pid:
+                    break
+                # Wait for a free thread before accepting, so a busy worker leaves connections to others
+                if not self.slots.acquire(timeout=POLL_INTERVAL):
+                    continue
+                self.slots.release()
+                # Claim a request before accepting, so every accepted connection gets answered
+                if not self.claim_request():
+                    # Recycle once the counted requests are done, unless some never arrive
+                    if not self.active:
+                        break
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                self.accepted = False
+                if selector.select(POLL_INTERVAL):
+                    self._handle_request_noblock()
+                if not self.accepted:
+                    self.release_request()
+        self.pool.shutdown(wait=True)
+        self.socket.close()
+
+    def metrics(self):
+        return {
+            'pid': os.getpid(),
+            'requests': self.requests,
+            'active': self.active,
+            'maxRequests': self.max_requests,
+        }
+
+
+def _run_worker(listener, args, slot, parent_pid, ready_fd=None):
+    """Body of a forked worker process. Never returns.
+
+    Writes a byte to ready_fd, if given, once it is ready to serve.
+    """
+    # Ctrl-C reaches the whole process group; only the master acts on it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    # One webhook dispatcher is enough; leases keep it correct either way
+    if slot != 0:
+        os.environ['WEBHOOK_DISPATCHER'] = 'off'
+
+    try:
+        from backend.app import create_app
+        app = create_app()
+    except Exception as error:
+        _log(f'Worker {slot} failed to start: {error!r}')
+        os._exit(BOOT_ERROR)
+
+    max_requests = args.max_requests
+    if max_requests and args.max_requests_jitter:
+        max_requests += random.randint(0, args.max_requests_jitter)
+
+    server = PooledWSGIServer(args.host, app, listener.fileno(), args.threads, args.keepalive, max_requests, args.access_log)
+    listener.close()
+    app.extensions['server_worker'] = server
+
+    def stop(signum, frame):
+        server.stopping = True
+    signal.signal(signal.SIGTERM, stop)
+
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+    _log(f'Worker {slot} serving with {args.threads} threads')
+    try:
+        server.serve(parent_pid)
+    finally:
+        if server.max_requests and server.requests >= server.max_requests:
+            _log(f'Worker {slot} recycled after {server.requests} requests')
+    os._exit(0)
+
+
+class Master:
+    """Forks, watches and replaces the worker processes."""
+
+    def __init__(self, args):
+        self.args = args
+        self.listener = None
+        # pid -> slot of every worker, the pids of replaced workers still finishing, and slots to respawn later
+        self.workers = {}
+        self.retiring = {}
+        self.respawns = {}
+        self.stopping = False
+        self.reload_requested = False
+
+    def _fork(self, slot, notify=False):
+        """Fork a worker. Returns its pid and, if notify, the pipe it reports readiness on."""
+        ready_read, ready_write = os.pipe() if notify else (None, None)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                if ready_read is not None:
+                    os.close(ready_read)
+                _run_worker(self.listener, self.args, slot, os.getppid(), ready_write)
+            finally:
+                os._exit(1)
+        if ready_write is not None:
+            os.close(ready_write)
+        return pid, ready_read
+
+    def _spawn(self, slot):
+        pid, _ = self._fork(slot)
+        self.workers[pid] = slot
+        return pid
+
+    def _reap(self):
+        """Collect exited workers and replace them, later if they could not boot."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            code = os.waitstatus_to_exitcode(status)
+            if self.retiring.pop(pid, None) is not None:
+                continue
+            slot = self.workers.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            if code == BOOT_ERROR:
+                _log(f'Worker {slot} failed to boot, retrying in {RESPAWN_DELAY}s')
+                self.respawns[slot] = time.monotonic() + RESPAWN_DELAY
+                continue
+            if code != 0:
+                _log(f'Worker {slot} (pid {pid}) exited with status {code}')
+            self._spawn(slot)
+
+    def _respawn_due(self):
+        now = time.monotonic()
+        for slot, due in list(self.respawns.items()):
+            if now >= due:
+                del self.respawns[slot]
+                self._spawn(slot)
+
+    def _reload(self):
+        """Roll the workers: start a full new set and stop the old one only once all new workers are ready."""
+        _log('Reloading workers')
+        if not prepare_databases():
+            _log('Reload abandoned, database setup failed; the running workers keep serving')
+            return
+
+        new = {}
+        pipes = {}
+        for slot in range(self.args.workers):
+            pid, ready_fd = self._fork(slot, notify=True)
+            new[pid] = slot
+            pipes[ready_fd] = pid
+
+        if not self._wait_ready(pipes):
+            if not self.stopping:
+                _log('Reload abandoned, new workers did not become ready; the running workers keep serving')
+            for pid in new:
+                self.retiring[pid] = time.monotonic() + self.args.graceful_timeout
+                self._signal(pid, signal.SIGTERM)
+            return
+
+        old = self.workers
+        self.workers = new
+        self.respawns.clear()
+        for pid in old:
+            self.retiring[pid] = time.monotonic() + self.args.graceful_timeout
+            self._signal(pid, signal.SIGTERM)
+
+    def _wait_ready(self, pipes):
+        """Wait until every worker behind pipes reported ready. False if one exited first, timed out or we are stopping."""
+        deadline = time.monotonic() + self.args.boot_timeout
+        ready = True
+        with selectors.DefaultSelector() as selector:
+            for fd in pipes:
+                selector.register(fd, selectors.EVENT_READ)
+            try:
+                while pipes and ready:
+                    remaining = deadline - time.monotonic()
+                    if self.stopping or remaining <= 0:
+                        ready = False
+                        break
+                    for key, _ in selector.select(min(remaining, POLL_INTERVAL)):
+                        # A worker that exits before reporting closes its end, which reads as empty
+                        if not os.read(key.fd, 1):
+                            ready = False
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+                        del pipes[key.fd]
+            finally:
+                for fd in pipes:
+                    os.close(fd)
+        return ready
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                _log(f'Worker pid {pid} did not stop in time, killing it')
+                self._signal(pid, signal.SIGKILL)
+                self.retiring[pid] = float('inf')
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def run(self):
+        if not prepare_databases():
+            sys.exit(1)
+
+        self.listener = socket.create_server((self.args.host, self.args.port), backlog=self.args.backlog)
+        self.listener.set_inheritable(True)
+        _log(f'Listening on http://{self.args.host}:{self.listener.getsockname()[1]}/ '
+             f'with {self.args.workers} workers x {self.args.threads} threads')
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        # A worker that cannot boot now means the configuration or code is broken, so give up
+        pipes = {}
+        for slot in range(self.args.workers):
+            pid, ready_fd = self._fork(slot, notify=True)
+            self.workers[pid] = slot
+            pipes[ready_fd] = pid
+        if not self._wait_ready(pipes):
+            if not self.stopping:
+                _log('Workers did not become ready, shutting down')
+            self._shutdown()
+            sys.exit(1)
+
+        try:
+            while not self.stopping:
+                time.sleep(POLL_INTERVAL)
+                self._reap()
+                self._respawn_due()
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self._reload()
+                self._kill_overdue()
+        finally:
+            self._shutdown()
+
+    def _shutdown(self):
+        _log('Stopping workers')
+        self.listener.close()
+        deadline = time.monotonic() + self.args.graceful_timeout
+        for pid in list(self.workers) + list(self.retiring):
+            self.retiring[pid] = deadline
+            self._signal(pid, signal.SIGTERM)
+        self.workers = {}
+
+        while self.retiring:
+            self._reap()
+            self._kill_overdue()
+            time.sleep(0.1)
+        _log('Stopped')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the BeezeTrack API with preforked, multi-threaded workers.')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVE_WORKERS', os.cpu_count() or 1)),
+                        help='Worker processes.')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVE_THREADS', 8)),
+                        help='Request threads per worker.')
+    parser.add_argument('--max-requests', type=int, default=int(os.getenv('SERVE_MAX_REQUESTS', 0)),
+                        help='Replace a worker after this many requests; 0 never does.')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(os.getenv('SERVE_MAX_REQUESTS_JITTER', 0)),
+                        help='Random extra requests per worker before it is replaced.')
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.getenv('SERVE_GRACEFUL_TIMEOUT', 30)),
+                        help='Seconds a stopping worker gets to finish its requests.')
+    parser.add_argument('--boot-timeout', type=float, default=float(os.getenv('SERVE_BOOT_TIMEOUT', 60)),
+                        help='Seconds a new worker gets to become ready before a start or reload is abandoned.')
+    parser.add_argument('--keepalive', type=float, default=float(os.getenv('SERVE_KEEPALIVE', 5)),
+                        help='Seconds an idle keep-alive connection is kept open.')
+    parser.add_argument('--backlog', type=int, default=int(os.getenv('SERVE_BACKLOG', 2048)))
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false')
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.threads < 1:
+        parser.error('--workers and --threads must be at least 1')
+    Master(args).run()
+
+
+if __name__ == '__main__':
+    main()
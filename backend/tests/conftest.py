@@ -0,0 +1,118 @@
+import itertools
+import os
+import sqlite3
+
+import pytest
+
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-0123456789abcdef')
+
+from backend.models import backup, db, sharding
+from backend.models.address import AddressBook
+from backend.models.sharding import ShardRouter
+
+_emails = itertools.count(1)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Point every database of the test at its own directory."""
+    path = str(tmp_path / 'data')
+    for module in (db, sharding, backup):
+        monkeypatch.setattr(module, 'DATA_DIR', path)
+    monkeypatch.setattr(ShardRouter, '_directory_prepared', False)
+    monkeypatch.setattr(AddressBook, '_cache', type(AddressBook._cache)())
+    return path
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    """Spread users over four shard files."""
+    monkeypatch.setattr(sharding, 'SHARD_COUNT', 4)
+
+
+@pytest.fixture
+def app(data_dir, monkeypatch):
+    # Admission control is covered by its own tests and would only get in the way elsewhere
+    monkeypatch.setenv('RATE_LIMIT_ENABLED', 'false')
+    monkeypatch.setenv('LOAD_SHEDDING_ENABLED', 'false')
+    from backend.app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    """Register a new user. Returns (user id, Authorization headers)."""
+    def register(name='Merchant'):
+        response = client.post('/api/auth/register', json={
+            'name': name, 'email': f'user{next(_emails)}@example.com', 'password': 'password',
+        })
+        assert response.status_code == 201, response.get_json()
+        body = response.get_json()
+        return body['user']['id'], {'Authorization': f"Bearer {body['token']}"}
+    return register
+
+
+@pytest.fixture
+def create_delivery(client):
+    """Create a delivery for the user of headers. Returns its JSON."""
+    def create_delivery(headers, **fields):
+        payload = {'packageType': 'Box', 'weight': '2kg', 'dimensions': '10x10x10', 'from': '1 Dock St', 'to': '9 Elm Rd', **fields}
+        response = client.post('/api/deliveries', json=payload, headers=headers)
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['delivery']
+    return create_delivery
+
+
+@pytest.fixture
+def legacy_database(data_dir):
+    """Write a database in the schema from before the delivery API changes. Returns its path."""
+    def legacy_database(deliveries=100, users=4):
+        os.makedirs(data_dir, exist_ok=True)
+        path = os.path.join(data_dir, 'beezetrack.db')
+        conn = sqlite3.connect(path)
+        conn.executescript('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT NOT NULL UNIQUE, password TEXT NOT NULL,
+            phone TEXT, address TEXT, city TEXT, state TEXT, zip_code TEXT, bio TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tracking_number TEXT NOT NULL UNIQUE,
+            package_type TEXT NOT NULL,
+            weight TEXT NOT NULL,
+            dimensions TEXT NOT NULL,
+            from_address TEXT NOT NULL,
+            to_address TEXT NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT NOT NULL,
+            user_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        );
+        CREATE TABLE delivery_updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, delivery_id INTEGER NOT NULL, status TEXT NOT NULL, date TEXT NOT NULL,
+            time TEXT NOT NULL, description TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (delivery_id) REFERENCES deliveries (id)
+        );
+        ''')
+        conn.executemany('INSERT INTO users (id, name, email, password) VALUES (?, ?, ?, ?)',
+                         [(user_id, f'User {user_id}', f'legacy{user_id}@example.com', 'x') for user_id in range(1, users + 1)])
+        conn.executemany('''
+        INSERT INTO deliveries (id, tracking_number, package_type, weight, dimensions, from_address, to_address, date, status, user_id)
+        VALUES (?, ?, 'Box', '1kg', '1x1x1', ?, ?, '2024-01-01', 'Pending', ?)
+        ''', [(i, f'BZ{i:08d}', f'{i % 7} Dock St', f'{i % 13} Elm Rd', i % users + 1) for i in range(1, deliveries + 1)])
+        conn.executemany('''
+        INSERT INTO delivery_updates (delivery_id, status, date, time, description)
+        VALUES (?, 'Pending', '2024-01-01', '09:00 AM', 'Your package has been scheduled for pickup.')
+        ''', [(i,) for i in range(1, deliveries + 1)])
+        conn.commit()
+        conn.close()
+        return path
+    return legacy_database
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+
+import pytest
+
+from backend.models import address
+from backend.models.address import AddressBook
+from backend.models.backup import Backup
+from backend.models.db import Database
+
+
+def _addresses(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM addresses').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_repeated_addresses_are_stored_once(client, register, create_delivery):
+    _, headers = register()
+    for _ in range(3):
+        create_delivery(headers, **{'from': 'Warehouse 1', 'to': 'Customer'})
+    create_delivery(headers, **{'from': 'Customer', 'to': 'Warehouse 1'})
+
+    assert _addresses(Database().db_path) == 2
+    deliveries = client.get('/api/deliveries', headers=headers).get_json()['deliveries']
+    assert sorted((delivery['from'], delivery['to']) for delivery in deliveries) == [('Customer', 'Warehouse 1')] + [('Warehouse 1', 'Customer')] * 3
+
+
+@pytest.mark.parametrize('value', [42, None, ['1 Dock St'], {'street': 'Dock St'}])
+def test_non_string_addresses_are_rejected(client, register, value):
+    _, headers = register()
+    response = client.post('/api/deliveries', json={'packageType': 'Box', 'weight': '1', 'dimensions': '1', 'from': value, 'to': 'B'}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_address_text_is_not_indexed(app):
+    conn = Database().get_connection()
+    indexed = {row['name'] for index in conn.execute('PRAGMA index_list(addresses)') for row in conn.execute(f"PRAGMA index_info({index['name']})")}
+    assert indexed == {'hash'}
+
+
+def test_addresses_sharing_a_hash_stay_distinct(client, register, create_delivery, monkeypatch):
+    monkeypatch.setattr(address, 'address_hash', lambda text: 7)
+    _, headers = register()
+    first = create_delivery(headers, **{'from': 'A', 'to': 'B'})
+    second = create_delivery(headers, **{'from': 'B', 'to': 'A'})
+
+    assert _addresses(Database().db_path) == 2
+    assert (first['from'], first['to'], second['from'], second['to']) == ('A', 'B', 'B', 'A')
+
+
+def test_legacy_text_addresses_are_migrated(legacy_database):
+    path = legacy_database(deliveries=600)
+
+    conn = Database(path).get_connection()
+
+    columns = {row['name']: row for row in conn.execute('PRAGMA table_info(deliveries)')}
+    assert 'from_address' not in columns
+    assert columns['from_address_id']['notnull'] and columns['to_address_id']['notnull']
+    assert conn.execute('SELECT COUNT(*) FROM addresses').fetchone()[0] == 7 + 13
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'deliveries'").fetchone()[0] == 600
+    row = conn.execute('SELECT from_address, to_address FROM deliveries_with_addresses WHERE id = 20').fetchone()
+    assert tuple(row) == ('6 Dock St', '7 Elm Rd')
+    assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+    assert {row['name'] for row in conn.execute("SELECT name FROM sqlite_schema WHERE tbl_name = 'deliveries' AND type = 'index'")} >= {'idx_deliveries_user_id'}
+
+
+def test_cached_ids_are_not_reused_after_a_restore(client, register, create_delivery, data_dir):
+    _, headers = register()
+    backup_dir = os.path.join(data_dir, 'backups')
+    name = Backup.run(sleep_ms=0, backup_dir=backup_dir)['name']
+
+    # Cache ids for addresses the snapshot does not have, then bring the snapshot back
+    create_delivery(headers, **{'from': 'X', 'to': 'Y'})
+    assert AddressBook.metrics()['cached'] == 2
+    Backup.restore(name, backup_dir=backup_dir)
+
+    # The restored file hands the same ids to other addresses
+    create_delivery(headers, **{'from': 'Z', 'to': 'W'})
+    delivery = create_delivery(headers, **{'from': 'X', 'to': 'Y'})
+
+    tracked = client.post('/api/deliveries/track', json={'trackingNumber': delivery['trackingNumber']}).get_json()['delivery']
+    assert (tracked['from'], tracked['to']) == ('X', 'Y')
@@ -0,0 +1,83 @@
+import pytest
+
+from backend.models import analytics
+from backend.models.analytics import Analytics
+from backend.models.sharding import ShardRouter
+
+
+def _deliver(client, headers, delivery):
+    for status in ('In-Transit', 'Delivered'):
+        response = client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': status}, headers=headers)
+        assert response.status_code == 200
+
+
+def _backdate(user_id, delivery_id, hours):
+    """Move a delivery's scheduling and In-Transit update back by hours, as if it had taken that long."""
+    conn = ShardRouter.database_for_user(user_id).get_connection()
+    modifier = f'-{hours} hours'
+    conn.execute("UPDATE deliveries SET created_at = datetime(created_at, ?) WHERE id = ?", (modifier, delivery_id))
+    conn.execute("UPDATE delivery_updates SET created_at = datetime(created_at, ?) WHERE delivery_id = ? AND status != 'Delivered'", (modifier, delivery_id))
+    conn.commit()
+
+
+@pytest.fixture
+def history(client, register, create_delivery):
+    """Two boxes delivered on one route, one of them late, and an envelope still in transit."""
+    user_id, headers = register()
+    boxes = [create_delivery(headers, packageType='Box') for _ in range(2)]
+    envelope = create_delivery(headers, packageType='Envelope', to='2 Oak Ave')
+    for box in boxes:
+        _deliver(client, headers, box)
+    client.put(f"/api/deliveries/{envelope['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+    _backdate(user_id, boxes[1]['id'], 100)
+    return user_id, headers
+
+
+def test_delivered_deliveries_are_counted_as_they_happen(client, history):
+    _, headers = history
+
+    result = client.get('/api/deliveries/analytics', headers=headers).get_json()['analytics']
+
+    # The late delivery was recorded when it was delivered, before it was backdated
+    assert result['all']['deliveries'] == 2
+    assert result['all']['onTimeRate'] == 100.0
+    assert list(result['packageType']) == ['Box']
+    assert list(result['route']) == ['1 Dock St -> 9 Elm Rd']
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_rebuild_recomputes_from_history(client, history, monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(analytics, 'np', None)
+    elif analytics.np is None:
+        pytest.skip('numpy is not installed')
+    user_id, headers = history
+
+    assert Analytics.rebuild(user_id) == 2
+
+    result = client.get('/api/deliveries/analytics', headers=headers).get_json()['analytics']
+    assert result['all']['deliveries'] == 2
+    assert result['all']['onTimeRate'] == 50.0
+    assert result['all']['averageTransitHours'] == 50.0
+    counts = {bucket['maxHours']: bucket['count'] for bucket in result['all']['histogram'] if bucket['count']}
+    assert counts == {6: 1, 120: 1}
+    assert result['packageType']['Box']['deliveries'] == 2
+
+
+def test_statistics_use_the_analytics(client, history):
+    user_id, headers = history
+    Analytics.rebuild(user_id)
+
+    statistics = client.get('/api/deliveries/statistics', headers=headers).get_json()['statistics']
+
+    assert (statistics['totalDeliveries'], statistics['inTransitDeliveries'], statistics['deliveredDeliveries']) == (3, 1, 2)
+    assert statistics['onTimeDeliveryRate'] == 50.0
+    assert statistics['averageDeliveryTime'] == '2.1 days'
+
+
+def test_users_without_deliveries_get_empty_metrics(client, register):
+    _, headers = register()
+
+    result = client.get('/api/deliveries/analytics', headers=headers).get_json()['analytics']
+
+    assert result['all'] == {'deliveries': 0, 'onTimeRate': 0, 'averageTransitHours': 0, 'histogram': []}
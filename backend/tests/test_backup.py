@@ -0,0 +1,99 @@
+import gzip
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from backend.models.backup import Backup, BackupError
+
+
+@pytest.fixture
+def backup_dir(data_dir):
+    return os.path.join(data_dir, 'backups')
+
+
+def _tracking_numbers(client, headers):
+    return sorted(delivery['trackingNumber'] for delivery in client.get('/api/deliveries', headers=headers).get_json()['deliveries'])
+
+
+@pytest.mark.usefixtures('sharded')
+def test_snapshot_covers_every_database(client, register, create_delivery, backup_dir, tmp_path):
+    _, headers = register()
+    create_delivery(headers)
+
+    manifest = Backup.run(pages=1, sleep_ms=0, backup_dir=backup_dir)
+
+    assert sorted(entry['name'] for entry in manifest['files']) == sorted(name for name, _ in Backup.database_paths())
+    assert len(manifest['files']) == 5
+    assert all(entry['steps'] >= 1 for entry in manifest['files'])
+    for entry in manifest['files']:
+        copy = tmp_path / os.path.basename(entry['name'])
+        with gzip.open(os.path.join(backup_dir, manifest['name'], entry['name'] + '.gz'), 'rb') as f:
+            copy.write_bytes(f.read())
+        conn = sqlite3.connect(copy)
+        try:
+            assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        finally:
+            conn.close()
+    assert [snapshot['name'] for snapshot in Backup.list(backup_dir)] == [manifest['name']]
+
+
+def test_restore_brings_back_the_snapshot(client, register, create_delivery, backup_dir):
+    _, headers = register()
+    create_delivery(headers)
+    expected = _tracking_numbers(client, headers)
+    name = Backup.run(sleep_ms=0, backup_dir=backup_dir)['name']
+
+    create_delivery(headers)
+    assert Backup.restore(name, backup_dir=backup_dir) == ['beezetrack.db']
+
+    assert _tracking_numbers(client, headers) == expected
+    create_delivery(headers)
+    assert len(_tracking_numbers(client, headers)) == 2
+
+
+def test_writes_continue_during_a_snapshot(client, register, create_delivery, backup_dir):
+    _, headers = register()
+    for _ in range(20):
+        create_delivery(headers)
+    manifests = []
+    snapshot = threading.Thread(target=lambda: manifests.append(Backup.run(pages=1, sleep_ms=5, backup_dir=backup_dir)))
+    snapshot.start()
+
+    written = 0
+    while snapshot.is_alive():
+        create_delivery(headers)
+        written += 1
+    snapshot.join()
+
+    assert written > 0 and len(manifests) == 1
+    Backup.verify(manifests[0]['name'], backup_dir)
+
+
+def test_corrupt_snapshots_are_not_restored(client, register, create_delivery, backup_dir):
+    _, headers = register()
+    create_delivery(headers)
+    manifest = Backup.run(sleep_ms=0, backup_dir=backup_dir)
+    path = os.path.join(backup_dir, manifest['name'], 'beezetrack.db.gz')
+    with open(path, 'r+b') as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(b'\0' * 8)
+
+    with pytest.raises(BackupError):
+        Backup.verify(manifest['name'], backup_dir)
+    with pytest.raises(BackupError):
+        Backup.restore(manifest['name'], backup_dir=backup_dir)
+    assert len(_tracking_numbers(client, headers)) == 1
+
+
+def test_unknown_snapshots_are_reported(backup_dir):
+    with pytest.raises(BackupError):
+        Backup.verify('20240101T000000000000Z', backup_dir)
+
+
+def test_prune_keeps_the_newest_snapshots(app, backup_dir):
+    names = [Backup.run(sleep_ms=0, backup_dir=backup_dir)['name'] for _ in range(3)]
+
+    assert Backup.prune(2, backup_dir) == [names[0]]
+    assert [manifest['name'] for manifest in Backup.list(backup_dir)] == names[:0:-1]
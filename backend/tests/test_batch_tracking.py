@@ -0,0 +1,60 @@
+import pytest
+
+from backend.controllers.delivery_controller import MAX_BATCH_TRACKING
+
+
+def _track(client, payload):
+    return client.post('/api/deliveries/track/batch', json=payload)
+
+
+def test_results_follow_the_request_order(client, register, create_delivery):
+    _, headers = register()
+    first = create_delivery(headers, **{'from': 'A'})
+    second = create_delivery(headers, **{'from': 'B'})
+
+    response = _track(client, {'trackingNumbers': [second['trackingNumber'], 'BZ00000000', first['trackingNumber']]})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['trackingNumber'] for result in results] == [second['trackingNumber'], 'BZ00000000', first['trackingNumber']]
+    assert [result['found'] for result in results] == [True, False, True]
+    assert results[0]['delivery']['from'] == 'B' and results[2]['delivery']['from'] == 'A'
+    assert results[1]['error'] == 'Delivery not found'
+    assert 'userId' not in results[0]['delivery']
+    assert [update['status'] for update in results[0]['delivery']['updates']] == ['Pending']
+
+
+def test_latest_only_returns_the_latest_update(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+    client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+
+    result = _track(client, {'trackingNumbers': [delivery['trackingNumber']], 'latestOnly': True}).get_json()['results'][0]
+
+    assert 'updates' not in result['delivery']
+    assert result['delivery']['latestUpdate']['status'] == 'In-Transit'
+
+
+def test_repeated_numbers_are_answered_each_time(client, register, create_delivery):
+    _, headers = register()
+    number = create_delivery(headers)['trackingNumber']
+
+    results = _track(client, {'trackingNumbers': [number, number]}).get_json()['results']
+
+    assert [result['found'] for result in results] == [True, True]
+
+
+@pytest.mark.parametrize('payload', [
+    {},
+    {'trackingNumbers': []},
+    {'trackingNumbers': 'BZ00000001'},
+    {'trackingNumbers': ['BZ00000001', 7]},
+    {'trackingNumbers': ['BZ00000001'] * (MAX_BATCH_TRACKING + 1)},
+])
+def test_invalid_requests_are_rejected(client, payload):
+    assert _track(client, payload).status_code == 400
+
+
+def test_the_maximum_batch_is_accepted(client):
+    results = _track(client, {'trackingNumbers': [f'BZ{i:08d}' for i in range(MAX_BATCH_TRACKING)]}).get_json()['results']
+    assert len(results) == MAX_BATCH_TRACKING and not any(result['found'] for result in results)
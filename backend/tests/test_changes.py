@@ -0,0 +1,57 @@
+import pytest
+
+from backend.models.change_log import ChangeLog
+from backend.models.sharding import ShardRouter
+
+
+def _changes(client, headers, **params):
+    query = '&'.join(f'{name}={value}' for name, value in params.items())
+    response = client.get(f'/api/changes?{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_changes_are_paged_in_order(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+    client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+    client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'Delivered'}, headers=headers)
+
+    first = _changes(client, headers, limit=2)
+    second = _changes(client, headers, since=first['nextSince'], limit=2)
+    empty = _changes(client, headers, since=second['nextSince'])
+
+    assert [change['operation'] for change in first['changes']] == ['create', 'status']
+    assert first['hasMore'] and not second['hasMore']
+    assert [change['delivery']['status'] for change in second['changes']] == ['Delivered']
+    assert second['changes'][0]['delivery']['version'] == 2
+    assert empty == {'changes': [], 'nextSince': second['nextSince'], 'hasMore': False}
+
+
+def test_changes_are_private_to_the_user(client, register, create_delivery):
+    _, owner = register()
+    _, other = register()
+    create_delivery(owner)
+
+    assert _changes(client, other)['changes'] == []
+
+
+@pytest.mark.parametrize('query', ['since=-1', 'limit=0', 'limit=1001', 'since=abc'])
+def test_invalid_cursors_are_rejected(client, register, query):
+    _, headers = register()
+    assert client.get(f'/api/changes?{query}', headers=headers).status_code == 400
+
+
+def test_compaction_keeps_the_latest_change_of_each_delivery(client, register, create_delivery):
+    user_id, headers = register()
+    delivery = create_delivery(headers)
+    create_delivery(headers)
+    client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+
+    conn = ShardRouter.database_for_user(user_id).get_connection()
+    conn.execute("UPDATE delivery_changes SET created_at = datetime('now', '-30 days')")
+    conn.commit()
+
+    assert ChangeLog.compact(7) == 1
+    changes = _changes(client, headers)['changes']
+    assert sorted((change['deliveryId'], change['operation']) for change in changes) == [(delivery['id'], 'status'), (delivery['id'] + 1, 'create')]
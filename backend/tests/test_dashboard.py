@@ -0,0 +1,69 @@
+import pytest
+
+
+def _dashboard(client, headers, query='', etag=None):
+    if etag is not None:
+        headers = {**headers, 'If-None-Match': etag}
+    return client.get(f'/api/dashboard{query}', headers=headers)
+
+
+def test_dashboard_returns_everything_at_once(client, register, create_delivery):
+    _, headers = register('Ada')
+    deliveries = [create_delivery(headers) for _ in range(3)]
+    client.put(f"/api/deliveries/{deliveries[0]['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+
+    response = _dashboard(client, headers, '?limit=2')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['user']['name'] == 'Ada'
+    assert (body['statistics']['totalDeliveries'], body['statistics']['inTransitDeliveries']) == (3, 1)
+    assert [delivery['id'] for delivery in body['deliveries']] == [deliveries[2]['id'], deliveries[1]['id']]
+    assert set(body['deliveries'][0]) == {'id', 'trackingNumber', 'packageType', 'from', 'to', 'date', 'status', 'version', 'latestUpdate'}
+    assert body['hasMore'] is True
+
+
+def test_unchanged_dashboard_is_not_modified(client, register, create_delivery):
+    _, headers = register()
+    create_delivery(headers)
+    etag = _dashboard(client, headers).headers['ETag']
+
+    response = _dashboard(client, headers, etag=etag)
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert _dashboard(client, headers, '?limit=5', etag=etag).status_code == 200
+
+
+@pytest.mark.parametrize('change', ['delivery', 'status', 'profile'])
+def test_changes_invalidate_the_etag(client, register, create_delivery, change):
+    _, headers = register()
+    delivery = create_delivery(headers)
+    etag = _dashboard(client, headers).headers['ETag']
+
+    if change == 'delivery':
+        create_delivery(headers)
+    elif change == 'status':
+        client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+    else:
+        assert client.put('/api/auth/profile', json={'name': 'Renamed'}, headers=headers).status_code == 200
+
+    response = _dashboard(client, headers, etag=etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_other_users_do_not_invalidate_the_etag(client, register, create_delivery):
+    _, headers = register()
+    _, other = register()
+    etag = _dashboard(client, headers).headers['ETag']
+
+    create_delivery(other)
+
+    assert _dashboard(client, headers, etag=etag).status_code == 304
+
+
+@pytest.mark.parametrize('query', ['?limit=0', '?limit=101', '?limit=many'])
+def test_invalid_limits_are_rejected(client, register, query):
+    _, headers = register()
+    assert _dashboard(client, headers, query).status_code == 400
@@ -0,0 +1,65 @@
+import sqlite3
+import time
+
+import pytest
+
+from backend.models import deadline
+from backend.models.db import Database
+
+
+@pytest.fixture
+def expired_deadline():
+    token = deadline.set_deadline(0)
+    yield
+    deadline.reset_deadline(token)
+
+
+def test_schema_migration_runs_past_the_request_deadline(legacy_database, expired_deadline):
+    path = legacy_database(deliveries=5000)
+
+    conn = Database(path).get_connection()
+
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(deliveries)')}
+    assert {'latest_update_status', 'version', 'from_address_id'} <= columns
+    assert 'from_address' not in columns
+
+    # The request's own statements are still cut off
+    with pytest.raises(sqlite3.OperationalError, match='interrupted'):
+        conn.execute('SELECT COUNT(*) FROM deliveries d JOIN delivery_updates u ON u.delivery_id = d.id').fetchone()
+
+
+def test_create_app_migrates_before_serving(legacy_database, monkeypatch):
+    monkeypatch.setenv('LOAD_SHEDDING_ENABLED', 'true')
+    path = legacy_database(deliveries=2000)
+    from backend.app import create_app
+    app = create_app()
+
+    conn = sqlite3.connect(path)
+    assert 'from_address' not in {row[1] for row in conn.execute('PRAGMA table_info(deliveries)')}
+
+    response = app.test_client().post('/api/deliveries/track', json={'trackingNumber': 'BZ00000042'})
+    assert response.status_code == 200
+    assert response.get_json()['delivery']['from'] == '0 Dock St'
+
+
+def test_export_outlives_the_request_deadline_once_streaming(legacy_database, monkeypatch):
+    monkeypatch.setenv('LOAD_SHEDDING_ENABLED', 'true')
+    legacy_database(deliveries=1500, users=1)
+    from flask_jwt_extended import create_access_token
+    from backend.app import create_app
+    app = create_app()
+    with app.app_context():
+        token = create_access_token(identity=1)
+
+    response = app.test_client().get('/api/deliveries/export?format=ndjson', buffered=False, headers={
+        'Authorization': f'Bearer {token}', 'X-Request-Timeout-Ms': '200',
+    })
+    assert response.status_code == 200
+
+    # A slow reader takes longer than the deadline to drain the body
+    body = b''
+    for chunk in response.response:
+        body += chunk
+        time.sleep(0.1)
+    response.close()
+    assert len(body.splitlines()) == 1500
@@ -0,0 +1,79 @@
+import csv
+import gzip
+import io
+import json
+
+from backend.models.export import CSV_COLUMNS, DeliveryExport
+
+
+def _deliveries(client, register, create_delivery):
+    _, headers = register()
+    first = create_delivery(headers, **{'from': 'A, "quoted"', 'to': 'B'})
+    second = create_delivery(headers)
+    client.put(f"/api/deliveries/{first['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+    # Another account's deliveries stay out of the export
+    _, other = register()
+    create_delivery(other)
+    return headers, first, second
+
+
+def test_csv_has_a_row_per_update(client, register, create_delivery):
+    headers, first, second = _deliveries(client, register, create_delivery)
+
+    response = client.get('/api/deliveries/export', headers=headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="deliveries.csv"'
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == CSV_COLUMNS
+    records = [dict(zip(CSV_COLUMNS, row)) for row in rows[1:]]
+    assert [(int(record['delivery_id']), record['update_status']) for record in records] == [
+        (first['id'], 'Pending'), (first['id'], 'In-Transit'), (second['id'], 'Pending')]
+    assert records[0]['from_address'] == 'A, "quoted"'
+
+
+def test_ndjson_nests_updates(client, register, create_delivery):
+    headers, first, second = _deliveries(client, register, create_delivery)
+
+    response = client.get('/api/deliveries/export?format=ndjson', headers=headers)
+
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['id'] for line in lines] == [first['id'], second['id']]
+    assert [update['status'] for update in lines[0]['updates']] == ['Pending', 'In-Transit']
+    assert lines[0]['status'] == 'In-Transit' and lines[0]['from'] == 'A, "quoted"'
+
+
+def test_gzip_output_decompresses_to_the_plain_export(client, register, create_delivery):
+    headers, _, _ = _deliveries(client, register, create_delivery)
+
+    plain = client.get('/api/deliveries/export?format=ndjson', headers=headers).get_data()
+    compressed = client.get('/api/deliveries/export?format=ndjson&gzip=true', headers=headers)
+
+    assert compressed.mimetype == 'application/gzip'
+    assert compressed.headers['Content-Disposition'] == 'attachment; filename="deliveries.ndjson.gz"'
+    assert gzip.decompress(compressed.get_data()) == plain
+
+
+def test_rows_are_fetched_in_batches(register, create_delivery):
+    user_id, headers = register()
+    for _ in range(5):
+        create_delivery(headers)
+
+    batches = list(DeliveryExport.iter_rows(user_id, batch_size=2))
+
+    assert [len(rows) for rows in batches] == [2, 2, 1]
+    assert [row['delivery_id'] for rows in batches for row in rows] == sorted(row['delivery_id'] for rows in batches for row in rows)
+
+
+def test_empty_export_has_only_the_header(client, register):
+    _, headers = register()
+
+    assert client.get('/api/deliveries/export', headers=headers).get_data(as_text=True).splitlines() == [','.join(CSV_COLUMNS)]
+    assert client.get('/api/deliveries/export?format=ndjson', headers=headers).get_data() == b''
+
+
+def test_unknown_formats_are_rejected(client, register):
+    _, headers = register()
+    assert client.get('/api/deliveries/export?format=xml', headers=headers).status_code == 400
@@ -0,0 +1,63 @@
+import pytest
+
+
+def test_fields_select_the_returned_keys(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+
+    listed = client.get('/api/deliveries?fields=id,status', headers=headers).get_json()['deliveries']
+    single = client.get(f"/api/deliveries/{delivery['id']}?fields=trackingNumber,version", headers=headers).get_json()['delivery']
+
+    assert listed == [{'id': delivery['id'], 'status': 'Pending'}]
+    assert single == {'trackingNumber': delivery['trackingNumber'], 'version': 0}
+
+
+def test_summary_mode_returns_the_latest_update_without_history(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+    client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+
+    summary = client.get('/api/deliveries?fields=status,latestUpdate', headers=headers).get_json()['deliveries'][0]
+
+    assert summary['status'] == 'In-Transit'
+    assert summary['latestUpdate']['status'] == 'In-Transit'
+    assert 'updates' not in summary
+
+
+def test_include_adds_the_update_history(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+
+    included = client.get(f"/api/deliveries/{delivery['id']}?fields=id&include=updates", headers=headers).get_json()['delivery']
+    defaults = client.get(f"/api/deliveries/{delivery['id']}?include=updates", headers=headers).get_json()['delivery']
+
+    assert set(included) == {'id', 'updates'}
+    assert [update['status'] for update in included['updates']] == ['Pending']
+    assert 'latestUpdate' not in defaults and len(defaults['updates']) == 1
+
+
+def test_tracking_never_returns_the_user(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+
+    tracked = client.post('/api/deliveries/track?fields=status,userId', json={'trackingNumber': delivery['trackingNumber']}).get_json()['delivery']
+
+    assert tracked == {'status': 'Pending'}
+
+
+def test_without_fields_the_full_shape_is_returned(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+
+    full = client.get('/api/deliveries', headers=headers).get_json()['deliveries'][0]
+
+    assert {key: value for key, value in full.items() if key != 'updates'} == {key: value for key, value in delivery.items() if key != 'updates'}
+    assert [update['status'] for update in full['updates']] == ['Pending']
+    assert 'latestUpdate' not in full and 'version' not in full
+
+
+@pytest.mark.parametrize('query', ['fields=id,secret', 'fields=updates', 'include=history'])
+def test_unknown_fields_are_rejected(client, register, query):
+    _, headers = register()
+    response = client.get(f'/api/deliveries?{query}', headers=headers)
+    assert response.status_code == 400
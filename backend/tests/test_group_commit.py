@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from backend.models.delivery import Delivery
+from backend.models.group_commit import GroupCommitWriter
+from backend.models.sharding import ShardRouter
+
+
+def _writer(user_id):
+    db = ShardRouter.database_for_user(user_id)
+    return GroupCommitWriter.for_path(db.db_path, db.foreign_keys)
+
+
+def _hold(writer):
+    """Occupy the writer thread until the returned event is set, so later operations queue up as one batch."""
+    started, release = threading.Event(), threading.Event()
+
+    def wait(cursor):
+        started.set()
+        release.wait(5)
+    writer.submit(wait)
+    started.wait(5)
+    return release
+
+
+def _orphan_update(cursor):
+    # A deferred foreign key violation passes the statement and only fails the COMMIT
+    cursor.execute('PRAGMA defer_foreign_keys = ON')
+    cursor.execute('''
+    INSERT INTO delivery_updates (delivery_id, status, date, time, description)
+    VALUES (-1, 'Pending', 'today', 'now', 'orphan')
+    ''')
+
+
+def _in_thread(load, write):
+    """Call write(load()) in a new thread, which then owns the delivery's connections.
+
+    Returns the thread and a dict that gets the delivery and any error.
+    """
+    outcome = {'error': None}
+
+    def run():
+        outcome['delivery'] = load()
+        try:
+            write(outcome['delivery'])
+        except Exception as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def _ship(delivery_id, **options):
+    return lambda: Delivery.find_by_id(delivery_id), lambda delivery: delivery.update_status('In-Transit', **options)
+
+
+def _run_batch(writer, *writes, before=()):
+    """Queue the operations in before and then the writes behind a held writer, and let them go as one batch."""
+    release = _hold(writer)
+    futures = [writer.submit(operation) for operation in before]
+    threads = [_in_thread(*write) for write in writes]
+    while writer.metrics()['queued'] < len(futures) + len(threads):
+        pass
+    release.set()
+    for thread, _ in threads:
+        thread.join()
+    return futures, [outcome for _, outcome in threads]
+
+
+def test_concurrent_writes_share_a_commit(register, create_delivery):
+    user_id, headers = register()
+    ids = [create_delivery(headers)['id'] for _ in range(5)]
+    writer = _writer(user_id)
+    before = writer.metrics()['transactions']
+
+    _, outcomes = _run_batch(writer, *(_ship(delivery_id) for delivery_id in ids))
+
+    assert [outcome['error'] for outcome in outcomes] == [None] * 5
+    # One transaction for the held operation and one for all five writes
+    assert writer.metrics()['transactions'] - before == 2
+    assert {Delivery.find_by_id(delivery_id).status for delivery_id in ids} == {'In-Transit'}
+
+
+def test_failed_operation_rolls_back_alone(register, create_delivery):
+    user_id, headers = register()
+    first, second = create_delivery(headers)['id'], create_delivery(headers)['id']
+
+    _, (failing, passing) = _run_batch(_writer(user_id), _ship(second, expected_version=5), _ship(first))
+
+    assert failing['error'] is not None and passing['error'] is None
+    assert (failing['delivery'].status, failing['delivery'].version) == ('Pending', 0)
+    assert Delivery.find_by_id(first).status == 'In-Transit'
+    assert Delivery.find_by_id(second).status == 'Pending'
+
+
+def test_failed_commit_leaves_the_delivery_unchanged(register, create_delivery):
+    user_id, headers = register()
+    delivery_id = create_delivery(headers)['id']
+
+    (orphan,), (outcome,) = _run_batch(_writer(user_id), _ship(delivery_id), before=[_orphan_update])
+
+    with pytest.raises(Exception):
+        orphan.result()
+    assert outcome['error'] is not None
+    delivery = outcome['delivery']
+    assert (delivery.status, delivery.version, delivery.latest_update['status']) == ('Pending', 0, 'Pending')
+    assert Delivery.find_by_id(delivery_id).version == 0
+
+
+def test_failed_commit_does_not_keep_a_new_id(register):
+    user_id, _ = register()
+
+    def load():
+        return Delivery(package_type='Box', weight='1kg', dimensions='1x1x1', from_address='A', to_address='B', user_id=user_id)
+
+    _, (outcome,) = _run_batch(_writer(user_id), (load, Delivery.save), before=[_orphan_update])
+
+    assert outcome['error'] is not None
+    delivery = outcome['delivery']
+    assert (delivery.id, delivery.version, delivery.latest_update) == (None, 0, None)
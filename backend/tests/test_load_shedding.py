@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from backend.middleware.load_shedding import _Gate
+from backend.models.delivery import Delivery
+from backend.models.sharding import ShardRouter
+
+
+@pytest.fixture
+def shedder(app):
+    shedder = app.extensions['load_shedder']
+    shedder.enabled = True
+    return shedder
+
+
+def test_gate_queues_then_sheds():
+    gate = _Gate(limit=1, target=0.01, interval=0.05)
+    assert gate.acquire(time.monotonic() + 1)
+
+    started = time.monotonic()
+    assert not gate.acquire(time.monotonic() + 1)
+    assert 0.04 <= time.monotonic() - started < 0.5
+
+    gate.release()
+    assert gate.acquire(time.monotonic() + 1)
+    assert (gate.metrics()['admitted'], gate.metrics()['shed']) == (2, 1)
+
+
+def test_gate_drops_quickly_once_the_queue_stands():
+    gate = _Gate(limit=1, target=0.01, interval=0.05)
+    gate.acquire(time.monotonic() + 1)
+    for _ in range(3):
+        gate.acquire(time.monotonic() + 1)
+
+    assert gate.metrics()['dropping']
+    started = time.monotonic()
+    assert not gate.acquire(time.monotonic() + 1)
+    assert time.monotonic() - started < 0.04
+
+
+def test_full_classes_are_shed_with_retry_after(client, register, shedder):
+    _, headers = register()
+    gate = shedder.gates['reads'] = _Gate(limit=1, target=0.01, interval=0.05)
+    gate.acquire(time.monotonic() + 1)
+
+    response = client.get('/api/deliveries', headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    # Other classes keep their own slots
+    assert client.post('/api/deliveries/track', json={'trackingNumber': 'BZ00000000'}).status_code == 404
+
+    gate.release()
+    assert client.get('/api/deliveries', headers=headers).status_code == 200
+
+
+def test_slow_queries_stop_at_the_client_deadline(client, register, shedder, monkeypatch):
+    user_id, headers = register()
+
+    def slow(user_id, with_updates=True):
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        conn.execute('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) SELECT MAX(i) FROM n').fetchone()
+    monkeypatch.setattr(Delivery, 'find_by_user_id', staticmethod(slow))
+
+    started = time.monotonic()
+    response = client.get('/api/deliveries?fields=id', headers={**headers, 'X-Request-Timeout-Ms': '100'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert time.monotonic() - started < 2
+    assert shedder.metrics()['deadlineExceeded'] == 1
+    assert shedder.metrics()['classes']['reads']['inFlight'] == 0
@@ -0,0 +1,29 @@
+import pytest
+
+
+def test_metrics_are_off_without_a_token(client):
+    assert client.get('/metrics').status_code == 404
+
+
+@pytest.fixture
+def metrics_client(app):
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    return app.test_client()
+
+
+@pytest.mark.parametrize('headers', [{}, {'X-Metrics-Token': 'wrong'}, {'Authorization': 'Bearer scrape-token'}])
+def test_metrics_need_the_token(metrics_client, headers):
+    assert metrics_client.get('/metrics', headers=headers).status_code == 401
+
+
+def test_metrics_with_the_token(metrics_client):
+    response = metrics_client.get('/metrics', headers={'X-Metrics-Token': 'scrape-token'})
+    assert response.status_code == 200
+    assert {'rateLimit', 'loadShedding', 'groupCommit', 'addresses', 'webhooks'} <= set(response.get_json())
+
+
+def test_metrics_token_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'from-env')
+    from backend.app import create_app
+    client = create_app().test_client()
+    assert client.get('/metrics', headers={'X-Metrics-Token': 'from-env'}).status_code == 200
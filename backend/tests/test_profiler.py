@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from backend.middleware import profiler as profiler_module
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'profiles'
+    monkeypatch.setenv('PROFILER_ENABLED', 'true')
+    monkeypatch.setenv('PROFILER_TOKEN', 'secret')
+    monkeypatch.setenv('PROFILER_DIR', str(path))
+    monkeypatch.setenv('PROFILER_TOGGLE_FILE', str(tmp_path / 'profiler.json'))
+    monkeypatch.setattr(profiler_module, 'TOGGLE_CHECK_INTERVAL', 0)
+    return path
+
+
+@pytest.fixture
+def app(profile_dir, app):
+    return app
+
+
+def _profiles(profile_dir):
+    return sorted(os.listdir(profile_dir)) if profile_dir.is_dir() else []
+
+
+def test_token_header_writes_a_collapsed_profile(client, register, create_delivery, profile_dir):
+    user_id, headers = register()
+    create_delivery(headers)
+
+    response = client.get('/api/deliveries', headers={**headers, 'X-Profile': 'secret'})
+
+    assert response.status_code == 200
+    (name,) = _profiles(profile_dir)
+    assert f'-delivery.get_user_deliveries-user{user_id}-' in name and name.endswith('.collapsed')
+    header, *lines = (profile_dir / name).read_text().splitlines()
+    assert header.startswith('# GET /api/deliveries reason=header elapsed_ms=')
+    assert lines and all(line.rpartition(' ')[2].isdigit() for line in lines)
+    assert any('get_user_deliveries' in line for line in lines)
+    assert any('[C]' in line for line in lines)
+
+
+def test_requests_without_the_token_are_not_profiled(client, register, profile_dir):
+    _, headers = register()
+
+    client.get('/api/deliveries', headers=headers)
+    client.get('/api/deliveries', headers={**headers, 'X-Profile': 'wrong'})
+
+    assert _profiles(profile_dir) == []
+
+
+def test_toggle_rules_profile_one_user(app, client, register, profile_dir):
+    user_id, headers = register()
+    _, other = register()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['profiler', 'enable', '--endpoint', 'delivery.get_user_deliveries', '--user-id', str(user_id)])
+    assert result.exit_code == 0, result.output
+
+    client.get('/api/deliveries', headers=other)
+    client.get('/api/deliveries/statistics', headers=headers)
+    client.get('/api/deliveries', headers=headers)
+
+    (name,) = _profiles(profile_dir)
+    assert f'-user{user_id}-' in name
+    assert 'reason=toggle' in (profile_dir / name).read_text().splitlines()[0]
+    assert name.split('-')[0] in runner.invoke(args=['profiler', 'status']).output
+    assert 'ms' in runner.invoke(args=['profiler', 'top', str(profile_dir / name)]).output
+
+    runner.invoke(args=['profiler', 'disable'])
+    client.get('/api/deliveries', headers=headers)
+    assert len(_profiles(profile_dir)) == 1
+
+
+def test_disabled_profiler_installs_no_hooks(client, register, profile_dir, monkeypatch):
+    monkeypatch.setenv('PROFILER_ENABLED', 'false')
+    from backend.app import create_app
+    disabled = create_app().test_client()
+    _, headers = register()
+
+    disabled.get('/api/deliveries', headers={**headers, 'X-Profile': 'secret'})
+
+    assert _profiles(profile_dir) == []
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def limiter(app):
+    limiter = app.extensions['rate_limiter']
+    limiter.enabled = True
+    return limiter
+
+
+def test_login_is_limited_per_account(client, register, limiter):
+    register()
+    for _ in range(5):
+        assert client.post('/api/auth/login', json={'email': 'user1@example.com', 'password': 'wrong'}).status_code == 401
+
+    response = client.post('/api/auth/login', json={'email': ' USER1@example.com', 'password': 'password'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Another account from the same address still has its own budget
+    assert client.post('/api/auth/login', json={'email': 'someone@example.com', 'password': 'x'}).status_code == 401
+    assert limiter.metrics()['rules']['login'] == {'allowed': 6, 'limited_account': 1}
+
+
+def test_tracking_is_limited_per_ip(client, limiter):
+    limiter.limits = {'tracking': {'ip': (0.001, 2)}}
+    for _ in range(2):
+        assert client.post('/api/deliveries/track', json={'trackingNumber': 'BZ0'}).status_code == 404
+    assert client.post('/api/deliveries/track/batch', json={'trackingNumbers': ['BZ0']}).status_code == 429
+    assert client.post('/api/deliveries/track', json={'trackingNumber': 'BZ0'}, environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 404
+
+
+@pytest.mark.parametrize('body', [['user1@example.com'], 5, 'user1@example.com', None])
+@pytest.mark.parametrize('path', ['/api/auth/login', '/api/deliveries/track', '/api/deliveries/track/batch'])
+def test_non_object_bodies_are_bad_requests(client, limiter, path, body):
+    response = client.post(path, data=json.dumps(body), content_type='application/json')
+    assert response.status_code == 400
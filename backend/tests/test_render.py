@@ -0,0 +1,62 @@
+import pytest
+
+from backend.models.render import DeliveryRenderer
+
+
+@pytest.fixture
+def deliveries(client, register, create_delivery):
+    """A user with deliveries covering several updates, non-ASCII text and quotes. Returns the user's headers."""
+    _, headers = register()
+    shipped = create_delivery(headers, **{'from': 'Zürich "Hbf"', 'to': '東京 \\ 1'})
+    create_delivery(headers)
+    for status in ('In-Transit', 'Delivered'):
+        client.put(f"/api/deliveries/{shipped['id']}/status", json={'status': status}, headers=headers)
+    return headers, shipped['trackingNumber']
+
+
+def _both(client, monkeypatch, method, url, **kwargs):
+    """Send the same request with SQL rendering on and off. Returns both responses."""
+    responses = []
+    for enabled in (True, False):
+        monkeypatch.setattr(DeliveryRenderer, 'enabled', enabled)
+        assert DeliveryRenderer.available() is enabled
+        responses.append(getattr(client, method)(url, **kwargs))
+    return responses
+
+
+def _assert_same(rendered, built):
+    assert rendered.status_code == built.status_code
+    assert rendered.mimetype == built.mimetype == 'application/json'
+    assert rendered.get_json() == built.get_json()
+
+
+def test_delivery_list_matches_the_object_path(client, monkeypatch, deliveries):
+    headers, _ = deliveries
+    rendered, built = _both(client, monkeypatch, 'get', '/api/deliveries', headers=headers)
+
+    _assert_same(rendered, built)
+    assert [update['status'] for update in rendered.get_json()['deliveries'][-1]['updates']] == ['Delivered', 'In-Transit', 'Pending']
+
+
+def test_tracking_matches_the_object_path(client, monkeypatch, deliveries):
+    _, tracking_number = deliveries
+
+    _assert_same(*_both(client, monkeypatch, 'post', '/api/deliveries/track', json={'trackingNumber': tracking_number}))
+    _assert_same(*_both(client, monkeypatch, 'post', '/api/deliveries/track', json={'trackingNumber': 'BZ00000000'}))
+
+
+@pytest.mark.parametrize('latest_only', [False, True])
+def test_batch_tracking_matches_the_object_path(client, monkeypatch, deliveries, latest_only):
+    _, tracking_number = deliveries
+    payload = {'trackingNumbers': [tracking_number, 'BZ00000000', tracking_number], 'latestOnly': latest_only}
+
+    _assert_same(*_both(client, monkeypatch, 'post', '/api/deliveries/track/batch', json=payload))
+
+
+def test_field_selections_use_the_object_path(client, monkeypatch, deliveries):
+    headers, _ = deliveries
+    monkeypatch.setattr(DeliveryRenderer, 'enabled', True)
+
+    listed = client.get('/api/deliveries?fields=id,latestUpdate', headers=headers).get_json()['deliveries']
+
+    assert all(set(delivery) == {'id', 'latestUpdate'} for delivery in listed)
@@ -0,0 +1,177 @@
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+import pytest
+
+from backend.serve import Master, PooledWSGIServer
+
+
+def _hello(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '5')])
+    return [b'hello']
+
+
+@pytest.fixture
+def serve():
+    """Start a worker server on a loopback port. Returns (server, port, thread)."""
+    started = []
+
+    def serve(**options):
+        listener = socket.create_server(('127.0.0.1', 0))
+        server = PooledWSGIServer('127.0.0.1', _hello, listener.fileno(), options.pop('threads', 4), options.pop('keepalive', 1), access_log=False, **options)
+        listener.close()
+        thread = threading.Thread(target=server.serve, args=(os.getppid(),), daemon=True)
+        thread.start()
+        started.append(server)
+        return server, server.server_address[1], thread
+    yield serve
+    for server in started:
+        server.stopping = True
+
+
+def _get_until_refused(port, limit=20):
+    """Send requests over one keep-alive connection until the server stops answering. Returns how many were answered."""
+    answered = 0
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        while answered < limit:
+            connection.request('GET', '/')
+            response = connection.getresponse()
+            assert response.read() == b'hello'
+            answered += 1
+    except (ConnectionError, http.client.HTTPException, OSError):
+        pass
+    finally:
+        connection.close()
+    return answered
+
+
+def test_worker_recycles_after_max_requests(serve):
+    server, port, thread = serve(max_requests=5)
+
+    assert _get_until_refused(port) == 5
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert server.requests == 5
+
+
+def test_concurrent_connections_do_not_exceed_max_requests(serve):
+    server, port, thread = serve(max_requests=7, threads=3)
+    answered = []
+    clients = [threading.Thread(target=lambda: answered.append(_get_until_refused(port))) for _ in range(3)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert sum(answered) == server.requests == 7
+
+
+def test_idle_connections_do_not_use_up_requests(serve):
+    server, port, thread = serve(max_requests=3, keepalive=0.2)
+
+    # Opened and left silent until the server gives up on it
+    idle = socket.create_connection(('127.0.0.1', port))
+    try:
+        assert idle.recv(1) == b''
+    finally:
+        idle.close()
+
+    assert _get_until_refused(port) == 3
+    thread.join(5)
+    assert server.requests == 3
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _worker_pid(port):
+    """Ask whichever worker takes the request for its pid, or None when nothing answers."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        connection.request('GET', '/metrics', headers={'X-Metrics-Token': 't'})
+        response = connection.getresponse()
+        assert response.status == 200
+        return json.loads(response.read())['worker']['pid']
+    except (ConnectionError, OSError):
+        return None
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def master(data_dir, monkeypatch):
+    """Start a master with two workers in a forked process on a loopback port. Returns (pid, port)."""
+    for name, value in (('METRICS_TOKEN', 't'), ('WEBHOOK_DISPATCHER', 'off'),
+                        ('RATE_LIMIT_ENABLED', 'false'), ('LOAD_SHEDDING_ENABLED', 'false')):
+        monkeypatch.setenv(name, value)
+    started = []
+
+    def master(max_requests=0):
+        port = _free_port()
+        args = argparse.Namespace(host='127.0.0.1', port=port, workers=2, threads=2, max_requests=max_requests, max_requests_jitter=0,
+                                  graceful_timeout=5, boot_timeout=30, keepalive=1, backlog=64, access_log=False)
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                Master(args).run()
+                code = 0
+            except SystemExit as e:
+                code = e.code or 0
+            finally:
+                os._exit(code)
+        started.append(pid)
+
+        deadline = time.monotonic() + 30
+        while _worker_pid(port) is None:
+            assert time.monotonic() < deadline, 'master did not start serving'
+            time.sleep(0.1)
+        return pid, port
+    yield master
+    for pid in started:
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+
+def test_master_replaces_recycled_workers(master):
+    _, port = master(max_requests=3)
+
+    pids = [_worker_pid(port) for _ in range(12)]
+
+    # Every request is answered, and no worker answers more than its three
+    assert None not in pids
+    assert max(pids.count(pid) for pid in set(pids)) <= 3
+    assert len(set(pids)) >= 4
+
+
+def test_master_reloads_and_stops_gracefully(master):
+    pid, port = master()
+    before = {_worker_pid(port) for _ in range(4)}
+
+    os.kill(pid, signal.SIGHUP)
+    deadline = time.monotonic() + 30
+    answered = [_worker_pid(port)]
+    while answered[-1] in before and time.monotonic() < deadline:
+        answered.append(_worker_pid(port))
+
+    assert None not in answered and answered[-1] not in before
+    os.kill(pid, signal.SIGTERM)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert _worker_pid(port) is None
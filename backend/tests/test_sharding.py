@@ -0,0 +1,99 @@
+import pytest
+
+from backend.models import sharding
+from backend.models.sharding import ShardRouter, UserMoving
+
+pytestmark = pytest.mark.usefixtures('sharded')
+
+
+def _note(client, headers, delivery, count):
+    # Repeating a non-terminal status adds change log entries without moving the delivery on
+    for _ in range(count):
+        response = client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'Pending'}, headers=headers)
+        assert response.status_code == 200
+        delivery = response.get_json()['delivery']
+    return delivery
+
+
+def _move(user_id, shard_id):
+    ShardRouter.assign_user(user_id, shard_id)
+    return ShardRouter.rebalance(user_id=user_id)
+
+
+def test_users_are_stored_in_their_own_shard(client, register, create_delivery):
+    first_id, first = register()
+    second_id, second = register()
+    create_delivery(first, **{'from': 'A'})
+    create_delivery(second, **{'from': 'B'})
+
+    for user_id, address in ((first_id, 'A'), (second_id, 'B')):
+        conn = ShardRouter.database_for_user(user_id).get_connection()
+        assert [row['from_address'] for row in conn.execute('SELECT from_address FROM deliveries_with_addresses')] == [address]
+
+    assert [delivery['from'] for delivery in client.get('/api/deliveries', headers=first).get_json()['deliveries']] == ['A']
+
+
+def test_moved_user_keeps_deliveries_and_tracking(client, register, create_delivery):
+    user_id, headers = register()
+    delivery = create_delivery(headers)
+    target = (ShardRouter.shard_for_user(user_id) + 1) % sharding.SHARD_COUNT
+
+    assert _move(user_id, target) == [(user_id, target, 1)]
+
+    assert ShardRouter.misplaced_users() == []
+    tracked = client.post('/api/deliveries/track', json={'trackingNumber': delivery['trackingNumber']})
+    assert tracked.get_json()['delivery']['id'] == delivery['id']
+    assert client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers).status_code == 200
+
+
+def test_writes_are_refused_while_moving(client, register, create_delivery):
+    user_id, headers = register()
+    delivery = create_delivery(headers)
+
+    ShardRouter._set_moving(user_id, True)
+    try:
+        response = client.post('/api/deliveries', json={'packageType': 'Box', 'weight': '1', 'dimensions': '1', 'from': 'A', 'to': 'B'}, headers=headers)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers).status_code == 503
+    finally:
+        ShardRouter._set_moving(user_id, False)
+
+    assert client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers).status_code == 200
+
+
+def test_writes_routed_to_the_old_shard_are_refused(register):
+    user_id, _ = register()
+    old = ShardRouter.database_for_user(user_id)
+    ShardRouter.assign_user(user_id, (ShardRouter.shard_for_user(user_id) + 1) % sharding.SHARD_COUNT)
+
+    with pytest.raises(UserMoving):
+        ShardRouter.check_writable(user_id, old)
+
+
+def test_change_feed_cursor_survives_a_move(client, register, create_delivery):
+    user_id, headers = register()
+    delivery = _note(client, headers, create_delivery(headers), 20)
+    cursor = client.get('/api/changes?limit=1000', headers=headers).get_json()['nextSince']
+
+    # An empty target shard would otherwise number the moved changes from 1
+    target = (ShardRouter.shard_for_user(user_id) + 1) % sharding.SHARD_COUNT
+    _move(user_id, target)
+    _note(client, headers, delivery, 1)
+
+    changes = client.get(f'/api/changes?since={cursor}&limit=1000', headers=headers).get_json()['changes']
+    assert len(changes) == 22
+    assert changes[-1]['delivery']['version'] == 21
+    assert all(change['seq'] > cursor for change in changes)
+
+
+def test_dashboard_etag_changes_when_the_user_moves(client, register, create_delivery):
+    user_id, headers = register()
+    create_delivery(headers)
+    etag = client.get('/api/dashboard', headers=headers).headers['ETag']
+
+    _move(user_id, (ShardRouter.shard_for_user(user_id) + 1) % sharding.SHARD_COUNT)
+
+    response = client.get('/api/dashboard', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,64 @@
+import pytest
+
+
+@pytest.fixture
+def delivery(register, create_delivery):
+    _, headers = register()
+    return headers, create_delivery(headers)
+
+
+def _update(client, headers, delivery, status, **extra):
+    return client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': status}, headers={**headers, **extra})
+
+
+def test_update_with_current_version(client, delivery):
+    headers, created = delivery
+    etag = client.get(f"/api/deliveries/{created['id']}", headers=headers).headers['ETag']
+    assert etag == '"0"'
+
+    response = _update(client, headers, created, 'In-Transit', **{'If-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+    assert response.get_json()['delivery']['status'] == 'In-Transit'
+
+
+def test_stale_version_conflicts(client, delivery):
+    headers, created = delivery
+    assert _update(client, headers, created, 'In-Transit', **{'If-Match': '"0"'}).status_code == 200
+
+    response = _update(client, headers, created, 'Delivered', **{'If-Match': '"0"'})
+    assert response.status_code == 409
+    assert response.get_json()['currentVersion'] == 1
+    assert client.get(f"/api/deliveries/{created['id']}", headers=headers).get_json()['delivery']['status'] == 'In-Transit'
+
+
+def test_weak_etag_is_not_a_match(client, delivery):
+    headers, created = delivery
+    response = _update(client, headers, created, 'In-Transit', **{'If-Match': 'W/"0"'})
+    assert response.status_code == 412
+    assert client.get(f"/api/deliveries/{created['id']}", headers=headers).headers['ETag'] == '"0"'
+
+
+@pytest.mark.parametrize('if_match', ['"a"', '"0", "1"'])
+def test_malformed_if_match(client, delivery, if_match):
+    headers, created = delivery
+    assert _update(client, headers, created, 'In-Transit', **{'If-Match': if_match}).status_code == 400
+
+
+def test_illegal_transition_conflicts(client, delivery):
+    headers, created = delivery
+    assert _update(client, headers, created, 'Delivered').status_code == 200
+
+    response = _update(client, headers, created, 'In-Transit')
+    assert response.status_code == 409
+    assert response.get_json()['currentStatus'] == 'Delivered'
+
+
+def test_repeating_a_status_adds_an_update(client, delivery):
+    headers, created = delivery
+    for _ in range(2):
+        assert _update(client, headers, created, 'Pending').status_code == 200
+
+    response = client.get(f"/api/deliveries/{created['id']}", headers=headers)
+    assert response.headers['ETag'] == '"2"'
+    assert len(response.get_json()['delivery']['updates']) == 3
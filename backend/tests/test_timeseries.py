@@ -0,0 +1,68 @@
+import datetime
+
+import pytest
+
+from backend.models.rollups import DailyRollup
+from backend.models.sharding import ShardRouter
+
+
+def _series(client, headers, query=''):
+    response = client.get(f'/api/deliveries/timeseries{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_events_are_counted_on_the_write_paths(client, register, create_delivery):
+    _, headers = register()
+    first = create_delivery(headers)
+    create_delivery(headers)
+    for status in ('In-Transit', 'Delivered'):
+        client.put(f"/api/deliveries/{first['id']}/status", json={'status': status}, headers=headers)
+
+    body = _series(client, headers)
+
+    today = datetime.datetime.utcnow().date()
+    assert (body['granularity'], body['to']) == ('day', today.isoformat())
+    assert len(body['series']) == 30
+    assert body['series'][-1] == {'period': today.isoformat(), 'created': 2, 'inTransit': 1, 'delivered': 1, 'cancelled': 0}
+    assert not any(period['created'] for period in body['series'][:-1])
+
+
+def test_repeated_statuses_are_not_counted_again(client, register, create_delivery):
+    _, headers = register()
+    delivery = create_delivery(headers)
+    for _ in range(3):
+        client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'Pending'}, headers=headers)
+
+    series = _series(client, headers)['series']
+    assert series[-1]['created'] == 1
+    assert sum(period[event] for period in series for event in ('inTransit', 'delivered', 'cancelled')) == 0
+
+
+def test_backfill_rebuilds_from_history(client, register, create_delivery):
+    user_id, headers = register()
+    old = create_delivery(headers)
+    create_delivery(headers)
+    client.put(f"/api/deliveries/{old['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+
+    # Move the first delivery's history to a fixed earlier day
+    conn = ShardRouter.database_for_user(user_id).get_connection()
+    conn.execute("UPDATE deliveries SET created_at = '2024-03-06 10:00:00' WHERE id = ?", (old['id'],))
+    conn.execute("UPDATE delivery_updates SET created_at = '2024-03-07 10:00:00' WHERE delivery_id = ?", (old['id'],))
+    conn.commit()
+
+    DailyRollup.backfill(user_id)
+
+    daily = _series(client, headers, '?from=2024-03-05&to=2024-03-08')['series']
+    assert [(period['period'], period['created'], period['inTransit']) for period in daily] == [
+        ('2024-03-05', 0, 0), ('2024-03-06', 1, 0), ('2024-03-07', 0, 1), ('2024-03-08', 0, 0)]
+    weekly = _series(client, headers, '?granularity=week&from=2024-03-01&to=2024-03-14')['series']
+    assert [(period['period'], period['created'], period['inTransit']) for period in weekly] == [
+        ('2024-02-26', 0, 0), ('2024-03-04', 1, 1), ('2024-03-11', 0, 0)]
+    assert _series(client, headers)['series'][-1]['created'] == 1
+
+
+@pytest.mark.parametrize('query', ['?granularity=month', '?from=2024-13-01', '?from=2024-03-02&to=2024-03-01', '?from=2020-01-01&to=2024-01-01'])
+def test_invalid_ranges_are_rejected(client, register, query):
+    _, headers = register()
+    assert client.get(f'/api/deliveries/timeseries{query}', headers=headers).status_code == 400
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.controllers import webhook_controller
+from backend.models import webhook
+from backend.models.sharding import ShardRouter
+from backend.models.webhook import WebhookOutbox, WebhookSubscription
+from backend.webhooks.dispatcher import WebhookDispatcher
+from backend.webhooks.http import is_public_address
+from backend.webhooks.stub_receiver import StubReceiver
+
+
+@pytest.fixture
+def allow_private(monkeypatch):
+    """Let subscriptions point at the loopback stub receiver."""
+    monkeypatch.setattr(webhook_controller, 'ALLOW_PRIVATE_TARGETS', True)
+
+
+def _ship(client, headers, create_delivery, count):
+    for _ in range(count):
+        delivery = create_delivery(headers)
+        response = client.put(f"/api/deliveries/{delivery['id']}/status", json={'status': 'In-Transit'}, headers=headers)
+        assert response.status_code == 200
+
+
+def _dispatch(receiver, subscribe, **options):
+    """Start the receiver, subscribe to it, then dispatch until the outbox is drained."""
+    async def run():
+        port = await receiver.start()
+        subscribe(f'http://127.0.0.1:{port}/hooks')
+        dispatcher = WebhookDispatcher(poll_interval=0.01, **options)
+        try:
+            await dispatcher.run(until_empty=True)
+        finally:
+            await receiver.stop()
+        return dispatcher
+    return asyncio.run(run())
+
+
+def test_status_changes_are_delivered(client, register, create_delivery, allow_private):
+    user_id, headers = register()
+    receiver = StubReceiver()
+
+    def subscribe(url):
+        assert client.post('/api/webhooks', json={'url': url}, headers=headers).status_code == 201
+        _ship(client, headers, create_delivery, 3)
+
+    dispatcher = _dispatch(receiver, subscribe, allow_private_targets=True)
+
+    assert receiver.stats()['uniqueEvents'] == 3
+    assert dispatcher.metrics()['delivered'] == 3
+    assert WebhookOutbox.claim(ShardRouter.database_for_user(user_id), 10) == []
+
+
+@pytest.mark.parametrize('url', ['http://127.0.0.1:9/hooks', 'http://10.1.2.3/hooks', 'http://[::1]/hooks',
+                                 'http://169.254.169.254/latest', 'http://localhost/hooks', 'ftp://example.com/'])
+def test_private_endpoints_are_refused(client, register, url):
+    _, headers = register()
+    assert client.post('/api/webhooks', json={'url': url}, headers=headers).status_code == 400
+
+
+@pytest.mark.parametrize('address, public', [('93.184.216.34', True), ('2606:4700::1111', True), ('127.0.0.1', False),
+                                             ('::ffff:10.0.0.1', False), ('fe80::1%eth0', False), ('224.0.0.1', False)])
+def test_public_addresses(address, public):
+    assert is_public_address(address) is public
+
+
+def test_dispatch_does_not_reach_private_endpoints(client, register, create_delivery):
+    user_id, headers = register()
+    receiver = StubReceiver()
+
+    def subscribe(url):
+        # Stored directly, as if the host had resolved to a public address when subscribing
+        WebhookSubscription(user_id=user_id, url=url).save()
+        _ship(client, headers, create_delivery, 2)
+
+    dispatcher = _dispatch(receiver, subscribe)
+
+    assert receiver.stats()['requests'] == 0
+    assert dispatcher.metrics()['failed'] == 2
+
+
+def test_lapsed_leases_are_not_sent_twice(client, register, create_delivery, allow_private, monkeypatch):
+    monkeypatch.setattr(webhook, 'LEASE_SECONDS', 0.3)
+    _, headers = register()
+    receiver = StubReceiver(delay=0.1)
+
+    def subscribe(url):
+        client.post('/api/webhooks', json={'url': url}, headers=headers)
+        _ship(client, headers, create_delivery, 12)
+
+    # One request at a time, so most batches wait in the dispatcher long past their lease
+    _dispatch(receiver, subscribe, allow_private_targets=True, batch_size=1, endpoint_concurrency=1)
+
+    assert receiver.stats()['uniqueEvents'] == 12
+    assert receiver.stats()['events'] == 12
+
+
+def test_dispatch_can_be_limited_to_subscriptions(client, register, create_delivery, allow_private):
+    user_id, headers = register()
+    other = WebhookSubscription(user_id=user_id, url='https://example.com/hooks').save()
+    receiver = StubReceiver()
+    subscribed = []
+
+    def subscribe(url):
+        subscribed.append(client.post('/api/webhooks', json={'url': url}, headers=headers).get_json()['subscription']['id'])
+        _ship(client, headers, create_delivery, 2)
+
+    _dispatch(receiver, subscribe, allow_private_targets=True, subscription_ids=subscribed)
+
+    assert receiver.stats()['uniqueEvents'] == 2
+    pending = WebhookOutbox.claim(ShardRouter.database_for_user(user_id), 10)
+    assert [event['subscription_id'] for event in pending] == [other.id, other.id]
+    assert {json.loads(event['payload'])['status'] for event in pending} == {'In-Transit'}
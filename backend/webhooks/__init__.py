@@ -0,0 +1,4 @@
+from .dispatcher import WebhookDispatcher, sign
+from .http import ConnectionPool, HttpError
+
+__all__ = ['WebhookDispatcher', 'sign', 'ConnectionPool', 'HttpError']
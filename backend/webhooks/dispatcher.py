@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.models.sharding import ShardRouter
+from backend.models.webhook import WebhookOutbox
+from .http import ALLOW_PRIVATE_TARGETS, ConnectionPool, HttpError
+
+# Events sent to one endpoint in a single POST
+DEFAULT_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 50))
+
+# Concurrent POSTs allowed per endpoint URL
+DEFAULT_ENDPOINT_CONCURRENCY = int(os.getenv('WEBHOOK_ENDPOINT_CONCURRENCY', 4))
+
+# Concurrent POSTs across all endpoints
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', 64))
+
+# Seconds between outbox polls when there is nothing to send
+DEFAULT_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 0.5))
+
+# Seconds to wait for an endpoint to answer
+DEFAULT_REQUEST_TIMEOUT = float(os.getenv('WEBHOOK_REQUEST_TIMEOUT', 10))
+
+SIGNATURE_HEADER = 'X-BeezeTrack-Signature'
+
+
+def sign(secret, body):
+    """HMAC-SHA256 signature of a request body, as sent in the signature header."""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+class WebhookDispatcher:
+    """Drains the webhook outboxes of every shard and POSTs events to their endpoints.
+
+    Runs an asyncio loop outside the request path. Due events are claimed in
+    leases, grouped by subscription into batches of up to batch_size events
+    and sent over pooled keep-alive connections, with at most
+    endpoint_concurrency requests in flight per endpoint. A batch renews its
+    lease before a request it might not outlast and events this dispatcher
+    still holds are never claimed again, so a lease lapsing while a batch
+    waits for a slot does not send it twice. Failed batches are retried with exponential
+    backoff and dead-lettered after the last attempt. Given subscription_ids,
+    only the events of those subscriptions are sent.
+    SQLite calls run on one dedicated thread so they never block the loop.
+    """
+
+    _background = None
+    _background_lock = threading.Lock()
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, endpoint_concurrency=DEFAULT_ENDPOINT_CONCURRENCY,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, poll_interval=DEFAULT_POLL_INTERVAL,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, allow_private_targets=ALLOW_PRIVATE_TARGETS, subscription_ids=None):
+        self.batch_size = batch_size
+        self.endpoint_concurrency = endpoint_concurrency
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.request_timeout = request_timeout
+        self.allow_private_targets = allow_private_targets
+        self.subscription_ids = subscription_ids
+        self.semaphores = {}
+        self.pool = None
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webhook-db')
+        self.databases = None
+        # Ids of claimed events not yet finished, per database path
+        self.leased = {}
+        self.delivered = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.requests = 0
+
+    @classmethod
+    def start_background(cls):
+        """Run a dispatcher on a daemon thread of this process, once."""
+        with cls._background_lock:
+            if cls._background is None:
+                dispatcher = cls()
+                thread = threading.Thread(target=lambda: asyncio.run(dispatcher.run()), name='webhook-dispatcher', daemon=True)
+                thread.start()
+                cls._background = dispatcher
+        return cls._background
+
+    @classmethod
+    def process_metrics(cls):
+        """Metrics of the background dispatcher, or None when this process does not run one."""
+        return cls._background.metrics() if cls._background is not None else None
+
+    async def _db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, function, *args)
+
+    async def run(self, stop=None, until_empty=False):
+        """Dispatch until stop (an asyncio.Event) is set, or until no events are due when until_empty."""
+        self.pool = ConnectionPool(timeout=self.request_timeout, allow_private=self.allow_private_targets)
+        self.databases = await self._db(ShardRouter.all_databases)
+        in_flight = set()
+        try:
+            while stop is None or not stop.is_set():
+                claimed = 0
+                for db in self.databases:
+                    room = (self.max_in_flight - len(in_flight)) * self.batch_size
+                    if room <= 0:
+                        break
+                    # Events still queued or sending here are skipped even if their lease has lapsed
+                    leased = self.leased.setdefault(db.db_path, set())
+                    events = await self._db(WebhookOutbox.claim, db, room, list(leased), self.subscription_ids)
+                    leased.update(event['id'] for event in events)
+                    claimed += len(events)
+                    for batch in self._batches(events):
+                        in_flight.add(asyncio.ensure_future(self._send(db, batch)))
+
+                if not claimed and not in_flight:
+                    if until_empty:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+                elif in_flight:
+                    # Claim more as soon as a batch finishes; poll again after the interval otherwise
+                    done, in_flight = await asyncio.wait(in_flight, timeout=None if claimed else self.poll_interval,
+                                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if in_flight:
+                await asyncio.wait(in_flight)
+            await self.pool.close()
+
+    def _batches(self, events):
+        by_subscription = {}
+        for event in events:
+            by_subscription.setdefault(event['subscription_id'], []).append(event)
+        for subscription_events in by_subscription.values():
+            for start in range(0, len(subscription_events), self.batch_size):
+                yield subscription_events[start:start + self.batch_size]
+
+    async def _send(self, db, batch):
+        try:
+            await self._send_batch(db, batch)
+        finally:
+            self.leased[db.db_path].difference_update(event['id'] for event in batch)
+
+    async def _send_batch(self, db, batch):
+        url = batch[0]['url']
+        semaphore = self.semaphores.get(url)
+        if semaphore is None:
+            semaphore = self.semaphores[url] = asyncio.Semaphore(self.endpoint_concurrency)
+
+        error = None
+        async with semaphore:
+            # A batch that queued for a slot may be near or past its lease, so renew it and drop events another
+            # dispatcher took; a request can take a timeout each on a stale pooled connection, a new one and the exchange
+            if min(event['lease'] for event in batch) - time.time() < 3 * self.request_timeout:
+                batch = await self._db(WebhookOutbox.renew, db, batch)
+                if not batch:
+                    return
+
+            body = ('{"events": [' + ', '.join(event['payload'] for event in batch) + ']}').encode('utf-8')
+            headers = {
+                'Content-Type': 'application/json',
+                SIGNATURE_HEADER: sign(batch[0]['secret'], body),
+                'X-BeezeTrack-Event-Count': str(len(batch)),
+            }
+            self.requests += 1
+            try:
+                status, _ = await self.pool.request('POST', url, body, headers)
+                if not 200 <= status < 300:
+                    error = f'HTTP {status}'
+            except (HttpError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                error = f'{type(e).__name__}: {e}'
+
+        event_ids = [event['id'] for event in batch]
+        if error is None:
+            await self._db(WebhookOutbox.complete, db, event_ids)
+            self.delivered += len(batch)
+        else:
+            self.dead_lettered += await self._db(WebhookOutbox.fail, db, batch, error)
+            self.failed += len(batch)
+
+    def metrics(self):
+        return {
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'deadLettered': self.dead_lettered,
+            'requests': self.requests,
+            'connectionsOpened': self.pool.opened if self.pool else 0,
+            'connectionsReused': self.pool.reused if self.pool else 0,
+        }
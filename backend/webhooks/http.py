@@ -0,0 +1,216 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import ssl
+from urllib.parse import urlsplit
+
+# Idle keep-alive connections kept per origin
+DEFAULT_MAX_IDLE = 8
+
+# Largest response body read from a webhook endpoint; the rest of the connection is dropped
+MAX_RESPONSE_BYTES = 64 * 1024
+
+
+# Allow endpoints on loopback, private and other non-public addresses, e.g. a local stub receiver
+ALLOW_PRIVATE_TARGETS = os.getenv('WEBHOOK_ALLOW_PRIVATE_TARGETS', 'false').lower() == 'true'
+
+
+class HttpError(Exception):
+    """The endpoint could not be reached or sent an unreadable response."""
+
+
+class BlockedAddress(HttpError):
+    """The endpoint resolves to an address webhooks must not be sent to."""
+
+
+def is_public_address(address):
+    """Whether an IP address is globally routable unicast, not loopback, private, link-local or reserved."""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_addresses(hostname, addresses, allow_private=False):
+    """Raise BlockedAddress if any address of hostname is not public, unless allow_private."""
+    if allow_private:
+        return
+    for address in addresses:
+        if not is_public_address(address):
+            raise BlockedAddress(f'{hostname} resolves to non-public address {address}')
+
+
+def resolve(hostname, port, allow_private=False):
+    """Resolve an endpoint host and check its addresses. Returns the addresses."""
+    try:
+        infos = socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise HttpError(f'Cannot resolve {hostname}: {e}') from e
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    check_addresses(hostname, addresses, allow_private)
+    return addresses
+
+
+class _Connection:
+    __slots__ = ('reader', 'writer')
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Minimal asyncio HTTP/1.1 client that keeps connections alive per origin.
+
+    Only what webhook delivery needs: one request at a time per connection,
+    Content-Length request bodies and Content-Length or chunked responses.
+    Hosts are resolved here and connections go to the checked addresses, so
+    a DNS answer that changes after the check cannot reach internal hosts.
+    """
+
+    def __init__(self, timeout=10, max_idle=DEFAULT_MAX_IDLE, allow_private=ALLOW_PRIVATE_TARGETS):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.allow_private = allow_private
+        self.idle = {}
+        self.ssl_context = ssl.create_default_context()
+        self.opened = 0
+        self.reused = 0
+
+    async def request(self, method, url, body=b'', headers=None):
+        """Send a request and return (status, body)."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise HttpError(f'Unsupported URL: {url}')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        origin = (parts.scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        host = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+        head = [f'{method} {target} HTTP/1.1', f'Host: {host}', f'Content-Length: {len(body)}', 'Connection: keep-alive']
+        head.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+        data = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+        # A pooled connection may have been closed by the server while idle, so retry once on a fresh one
+        conn = self._take_idle(origin)
+        if conn is not None:
+            try:
+                return await asyncio.wait_for(self._exchange(origin, conn, data), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+            except BaseException:
+                conn.close()
+                raise
+
+        conn = await asyncio.wait_for(self._open(origin), self.timeout)
+        try:
+            return await asyncio.wait_for(self._exchange(origin, conn, data), self.timeout)
+        except BaseException:
+            conn.close()
+            raise
+
+    def _take_idle(self, origin):
+        connections = self.idle.get(origin)
+        while connections:
+            conn = connections.pop()
+            if not conn.writer.is_closing() and not conn.reader.at_eof():
+                self.reused += 1
+                return conn
+            conn.close()
+        return None
+
+    async def _open(self, origin):
+        scheme, hostname, port = origin
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError) as e:
+            raise HttpError(f'Cannot resolve {hostname}: {e}') from e
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        check_addresses(hostname, addresses, self.allow_private)
+
+        error = None
+        for address in addresses:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    address, port, ssl=self.ssl_context if scheme == 'https' else None,
+                    server_hostname=hostname if scheme == 'https' else None)
+            except OSError as e:
+                error = e
+                continue
+            self.opened += 1
+            return _Connection(reader, writer)
+        raise HttpError(f'Connection to {hostname}:{port} failed: {error}') from error
+
+    async def _exchange(self, origin, conn, data):
+        conn.writer.write(data)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed before the response')
+        try:
+            version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise HttpError(f'Malformed status line: {status_line!r}')
+
+        headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            response = await self._read_chunked(conn.reader)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > MAX_RESPONSE_BYTES:
+                response = await conn.reader.readexactly(MAX_RESPONSE_BYTES)
+                keep_alive = False
+            else:
+                response = await conn.reader.readexactly(length)
+        else:
+            # Without a length the body runs until the server closes the connection
+            response = await conn.reader.read(MAX_RESPONSE_BYTES)
+            keep_alive = False
+
+        if keep_alive:
+            self._release(origin, conn)
+        else:
+            conn.close()
+        return status, response
+
+    async def _read_chunked(self, reader):
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                # Skip trailers up to the blank line ending the message
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return bytes(body[:MAX_RESPONSE_BYTES])
+            chunk = await reader.readexactly(size + 2)
+            if len(body) < MAX_RESPONSE_BYTES:
+                body.extend(chunk[:-2])
+
+    def _release(self, origin, conn):
+        connections = self.idle.setdefault(origin, [])
+        if len(connections) < self.max_idle:
+            connections.append(conn)
+        else:
+            conn.close()
+
+    async def close(self):
+        for connections in self.idle.values():
+            for conn in connections:
+                conn.close()
+        self.idle.clear()
@@ -0,0 +1,126 @@
+"""Local webhook endpoint for tests and throughput benchmarks.
+
+Accepts keep-alive HTTP/1.1 POSTs, counts the events in each batch and
+answers 200, or 500 for a configurable share of requests to exercise
+retries. Run it with:
+
+    python -m backend.webhooks.stub_receiver --port 9900 --fail-rate 0.1
+
+It listens on loopback, so subscribing to it and dispatching to it needs
+WEBHOOK_ALLOW_PRIVATE_TARGETS=true.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+class StubReceiver:
+    def __init__(self, fail_rate=0.0, delay=0.0):
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.requests = 0
+        self.events = 0
+        self.failures = 0
+        self.connections = 0
+        self.event_ids = set()
+        self.server = None
+        self.handlers = {}
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening and return the bound port."""
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        # Closing the open keep-alive connections lets their handlers finish
+        for writer in list(self.handlers.values()):
+            writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.handlers[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+                self.requests += 1
+                if random.random() < self.fail_rate:
+                    self.failures += 1
+                    status = '500 Internal Server Error'
+                else:
+                    status = '200 OK'
+                    events = json.loads(body)['events']
+                    self.events += len(events)
+                    self.event_ids.update(event['id'] for event in events)
+
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n'.encode('latin-1'))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'events': self.events,
+            'uniqueEvents': len(self.event_ids),
+            'failures': self.failures,
+            'connections': self.connections,
+        }
+
+
+async def _serve(args):
+    receiver = StubReceiver(args.fail_rate, args.delay_ms / 1000)
+    port = await receiver.start(args.host, args.port)
+    print(f'Listening on http://{args.host}:{port}/')
+
+    # Report the receive rate once a second
+    last_events = 0
+    last_time = time.monotonic()
+    while True:
+        await asyncio.sleep(1)
+        now = time.monotonic()
+        stats = receiver.stats()
+        rate = (stats['events'] - last_events) / (now - last_time)
+        last_events, last_time = stats['events'], now
+        print(f"{rate:.0f} events/s  {stats}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub webhook receiver.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9900)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 500.')
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='Delay before each response.')
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()